@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.core.management import BaseCommand
 from django.urls import reverse
 
@@ -14,7 +15,7 @@ class Command(BaseCommand):
         if nginx_configured():
             root_url = f'http://{private_ip}'
         else:
-            root_url = f'http://localhost:8000'
+            root_url = f'http://localhost:{settings.WEBSOCKET_PORT}'
 
         dashboard_path = reverse('dashboard')
         admin_path = reverse('admin:index')
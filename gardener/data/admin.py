@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from gardener.data.models import Location
+from gardener.data.models import SunTimes
 from gardener.data.models import WeatherForecast
 from gardener.data.models import WeatherForecastProvider
 
@@ -31,6 +32,17 @@ class WeatherForecastAdmin(admin.ModelAdmin):
     )
 
 
+class SunTimesAdmin(admin.ModelAdmin):
+    list_display = (
+        'latitude',
+        'longitude',
+        'date',
+        'sunrises',
+        'sunsets',
+    )
+
+
 admin.site.register(Location, LocationAdmin)
+admin.site.register(SunTimes, SunTimesAdmin)
 admin.site.register(WeatherForecast, WeatherForecastAdmin)
 admin.site.register(WeatherForecastProvider, WeatherForecastProviderAdmin)
@@ -0,0 +1,98 @@
+import logging
+import os
+import re
+from datetime import datetime
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+logger = logging.getLogger('gardener')
+
+FORECASTS_DIR = os.path.join(settings.BASE_DIR, 'gardener', 'data', 'fixtures', 'forecasts')
+
+ISSUE_TIME_RE = re.compile(r'<issue-time-utc>(\d{4}-\d{2}-\d{2})T')
+DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+
+class Command(BaseCommand):
+    help = 'Serve recorded weather forecasts over HTTP for the simulated hardware backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--address',
+            type=str,
+            required=False,
+            default='127.0.0.1',
+            help='Address to listen on.')
+
+        parser.add_argument(
+            '--port',
+            type=int,
+            required=False,
+            default=settings.SIMULATED_FORECAST_SERVER_PORT,
+            help='Port to listen on.')
+
+        parser.add_argument(
+            '--directory',
+            type=str,
+            required=False,
+            default=FORECASTS_DIR,
+            help='Directory of recorded forecasts.')
+
+        parser.add_argument(
+            '--no-shift',
+            action='store_true',
+            default=False,
+            help='Serve recorded forecasts as is instead of shifting them to start today.')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        shift = not options['no_shift']
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = os.path.join(directory, os.path.basename(self.path))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                with open(path) as f:
+                    content = f.read()
+                if shift:
+                    content = shift_forecast(content)
+                body = content.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.info(f'{self.address_string()} - {format % args}')
+
+        server = ThreadingHTTPServer((options['address'], options['port']), Handler)
+        logger.info(f'serving directory={directory} - address={options["address"]} - port={options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def shift_forecast(content, today=None):
+    """Shifts all timestamps of a recorded forecast by whole days so that it is issued today."""
+    match = ISSUE_TIME_RE.search(content)
+    if match is None:
+        return content
+    if today is None:
+        today = datetime.utcnow().date()
+    days = (today - datetime.strptime(match.group(1), '%Y-%m-%d').date()).days
+
+    def shift(match):
+        dt = datetime.strptime(match.group(0), '%Y-%m-%dT%H:%M:%S') + timedelta(days=days)
+        return dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+    return DATETIME_RE.sub(shift, content)
@@ -3,13 +3,17 @@ import time
 import xml.etree.ElementTree
 from io import StringIO
 
+from django.conf import settings
 from django.core.management import BaseCommand
 
 from gardener.data.models import Location
 from gardener.data.models import WeatherForecast
 from gardener.data.models import WeatherForecastProvider
+from gardener.device import thermal
+from gardener.device.hardware import get_backend
 from gardener.utils import ftp_get
 from gardener.utils import http_get
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
@@ -32,10 +36,16 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical update.')
 
     def handle(self, *args, **options):
+        set_process_priority('update_weather_forecast')
+
         run_once = options['run_once']
         delay = options['delay']
 
         while True:
+            if not run_once and thermal.should_defer(thermal.WEATHER_FORECAST):
+                time.sleep(settings.THERMAL_DEFER_DELAY)
+                continue
+
             weather_forecast_providers = WeatherForecastProvider.objects.all()
             for weather_forecast_provider in weather_forecast_providers:
                 weather_forecasts = None
@@ -67,6 +77,8 @@ class Command(BaseCommand):
 def get_bom_gov_au_weather_forecasts(url):
     weather_forecasts = []
 
+    url = get_backend().weather_forecast_url(url)
+
     if url.startswith('ftp'):
         xml_content = ftp_get(url)
     else:
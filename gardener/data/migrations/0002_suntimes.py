@@ -0,0 +1,28 @@
+# Generated by Django 2.2.3 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SunTimes',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('date', models.DateField()),
+                ('sunrise', models.DateTimeField()),
+                ('sunset', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'sun times',
+                'unique_together': {('latitude', 'longitude', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.3 on 2026-10-18 22:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+def delete_sun_times(apps, schema_editor):
+    # Only the first sunrise and sunset of each date was stored, they are recomputed on demand.
+    SunTimes = apps.get_model('data', 'SunTimes')
+    SunTimes.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0002_suntimes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_sun_times, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='suntimes',
+            name='sunrise',
+        ),
+        migrations.RemoveField(
+            model_name='suntimes',
+            name='sunset',
+        ),
+        migrations.AddField(
+            model_name='suntimes',
+            name='sunrises',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.DateTimeField(), default=list, size=None),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='suntimes',
+            name='sunsets',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.DateTimeField(), default=list, size=None),
+            preserve_default=False,
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 
 
@@ -44,3 +45,23 @@ class WeatherForecast(models.Model):
 
     class Meta:
         ordering = ('-start_time', )
+
+
+class SunTimes(models.Model):
+    """Sunrises and sunsets within a UTC date at a location, precomputed by gardener.data.solar."""
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    date = models.DateField()
+    sunrises = ArrayField(models.DateTimeField())
+    sunsets = ArrayField(models.DateTimeField())
+
+    def __str__(self):
+        return '<%s latitude=%f longitude=%f date=%s sunrises=%s sunsets=%s>' % (
+            self.__class__.__name__, self.latitude, self.longitude, self.date, self.sunrises, self.sunsets)
+
+    def __repr__(self):
+        return str(self)
+
+    class Meta:
+        unique_together = (('latitude', 'longitude', 'date'), )
+        verbose_name_plural = 'sun times'
@@ -0,0 +1,140 @@
+import ephem
+import logging
+import pytz
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from gardener.data.models import SunTimes
+
+logger = logging.getLogger('gardener')
+
+# Loaded sun times per process, (latitude, longitude) -> SunTable.
+_tables = {}
+
+
+def chain_events(loc, find, body, start, end):
+    """Returns times of all the events found by find, e.g. loc.next_rising, from start until end.
+
+    Each search starts just after the previous event, so that two events on the same day are not missed, e.g. when
+    sunrise moves earlier across midnight UTC.
+    """
+    end = ephem.Date(end)
+    loc.date = start
+    times = []
+    while loc.date < end:
+        try:
+            time = find(body, use_center=False)
+        except ephem.CircumpolarError:
+            # No event within the next day, i.e. polar day or night.
+            loc.date = ephem.Date(loc.date + 1)
+            continue
+        if time >= end:
+            break
+        times.append(time.datetime())
+        loc.date = ephem.Date(time + ephem.second)
+    return times
+
+
+def compute_sun_times(lat, lon, dates):
+    """Returns list of (date, sunrises, sunsets) of all the sunrises and sunsets within each UTC date.
+
+    A date has usually one of each but may have none or two, e.g. during polar day or night or when sunrise moves
+    across midnight UTC. A single observer is reused for the whole batch, consecutive dates are solved in one chain.
+    """
+    loc = ephem.Observer()
+    loc.lat = str(lat)
+    loc.lon = str(lon)
+    loc.elev = 0
+    loc.horizon = '-0:34'
+    loc.pressure = 0
+    sun = ephem.Sun()
+
+    sun_times = {date: ([], []) for date in dates}
+    dates = sorted(dates)
+    while dates:
+        # Run of consecutive dates.
+        n = 1
+        while n < len(dates) and dates[n] == dates[0] + timedelta(days=n):
+            n += 1
+        start = datetime(dates[0].year, dates[0].month, dates[0].day)
+        end = start + timedelta(days=n)
+        for i, find in enumerate((loc.next_rising, loc.next_setting)):
+            for time in chain_events(loc, find, sun, start, end):
+                time = timezone.make_aware(time, pytz.UTC).replace(microsecond=0)  # Second precision.
+                sun_times[time.date()][i].append(time)
+        dates = dates[n:]
+    return [(date, sunrises, sunsets) for date, (sunrises, sunsets) in sorted(sun_times.items())]
+
+
+class SunTable:
+    """Sorted sunrises and sunsets of consecutive dates, from midnight UTC of start_date."""
+
+    def __init__(self, start_date, sun_times):
+        self.start_time = datetime(start_date.year, start_date.month, start_date.day, tzinfo=pytz.UTC)
+        self.sunrises = sorted({sunrise for _, sunrises, _ in sun_times for sunrise in sunrises})
+        self.sunsets = sorted({sunset for _, _, sunsets in sun_times for sunset in sunsets})
+
+    def __str__(self):
+        return '<%s start_time=%s sunrises=%d sunsets=%d>' % (
+            self.__class__.__name__, self.start_time, len(self.sunrises), len(self.sunsets))
+
+    def __repr__(self):
+        return str(self)
+
+    def get_next_sun(self, date):
+        """Returns tuple of next sunrise and sunset after date or None if the table does not cover it."""
+        if date < self.start_time:
+            return None
+        i = bisect_right(self.sunrises, date)
+        j = bisect_right(self.sunsets, date)
+        if i == len(self.sunrises) or j == len(self.sunsets):
+            return None
+        return self.sunrises[i], self.sunsets[j]
+
+
+def load_sun_table(lat, lon, start_date, days=None):
+    """Returns SunTable of the specified number of days, computing and storing the dates which are not stored yet."""
+    if days is None:
+        days = settings.SUN_TIMES_DAYS
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    sun_times = list(
+        SunTimes.objects
+        .filter(latitude=lat, longitude=lon, date__range=(dates[0], dates[-1]))
+        .values_list('date', 'sunrises', 'sunsets'))
+
+    missing_dates = sorted(set(dates) - {date for date, _, _ in sun_times})
+    if missing_dates:
+        computed = compute_sun_times(lat, lon, missing_dates)
+        SunTimes.objects.bulk_create(
+            [SunTimes(latitude=lat, longitude=lon, date=date, sunrises=sunrises, sunsets=sunsets)
+             for date, sunrises, sunsets in computed],
+            ignore_conflicts=True)
+        sun_times.extend(computed)
+        logger.info(f'lat={lat} - lon={lon} - start_date={start_date} - computed={len(computed)}')
+
+    return SunTable(start_date, sun_times)
+
+
+def get_next_sun(lat, lon, date=None):
+    """Returns a tuple of next sunrise and sunset given the specified latitude and longitude.
+
+    Answered from the sun times of the next SUN_TIMES_DAYS days, which are loaded or computed in one batch when date
+    is not covered by the loaded ones.
+    """
+    if date is None:
+        date = timezone.now()
+
+    table = _tables.get((lat, lon))
+    next_sun = table.get_next_sun(date) if table is not None else None
+    if next_sun is None:
+        table = load_sun_table(lat, lon, date.astimezone(pytz.UTC).date())
+        _tables[(lat, lon)] = table
+        next_sun = table.get_next_sun(date)
+    if next_sun is None:
+        # No sunrise or sunset within the table, e.g. during polar day or night.
+        raise ephem.CircumpolarError(f'no sunrise or sunset within {settings.SUN_TIMES_DAYS} days')
+    return next_sun
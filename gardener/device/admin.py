@@ -1,6 +1,8 @@
 from django.contrib import admin
 
+from gardener.device.models import ArchivedRun
 from gardener.device.models import Camera
+from gardener.device.models import DailyRunRollup
 from gardener.device.models import Device
 from gardener.device.models import Fan
 from gardener.device.models import Lcd
@@ -9,6 +11,8 @@ from gardener.device.models import PopToPumpDuration
 from gardener.device.models import Pump
 from gardener.device.models import Run
 from gardener.device.models import ScheduledRun
+from gardener.device.models import Sensor
+from gardener.device.models import SensorReading
 
 
 class PumpInline(admin.TabularInline):
@@ -21,6 +25,7 @@ class PumpInline(admin.TabularInline):
         'scheduled_run_default_duration',
         'scheduled_run_frequency',
         'scheduled_run_email_notification_recipients',
+        'budget_weight',
     )
 
 
@@ -62,6 +67,22 @@ class FanInline(admin.TabularInline):
     )
 
 
+class SensorInline(admin.TabularInline):
+    model = Sensor
+    extra = 0
+    fields = (
+        'kind',
+        'is_active',
+        'iio_device',
+        'channel',
+        'sample_rate',
+        'decimation',
+        'scale',
+        'offset',
+        'unit',
+    )
+
+
 class PopToPumpDurationInline(admin.TabularInline):
     model = PopToPumpDuration
     extra = 1
@@ -94,12 +115,14 @@ class DeviceAdmin(admin.ModelAdmin):
         'location',
         'latitude',
         'longitude',
+        'pump_budget',
     )
     inlines = (
         PumpInline,
         CameraInline,
         LightInline,
         FanInline,
+        SensorInline,
     )
 
 
@@ -112,6 +135,7 @@ class PumpAdmin(admin.ModelAdmin):
         'scheduled_run_default_duration',
         'scheduled_run_frequency',
         'scheduled_run_email_notification_recipients',
+        'budget_weight',
     )
     inlines = (
         PopToPumpDurationInline,
@@ -140,6 +164,38 @@ class RunAdmin(admin.ModelAdmin):
         return False
 
 
+class ArchivedRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'pump_id',
+        'start_time',
+        'duration',
+        'is_scheduled',
+        'pop',
+    )
+    readonly_fields = list_display
+
+    def has_add_permission(self, *args, **kwargs):
+        return False
+
+
+class DailyRunRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        'pump',
+        'date',
+        'run_count',
+        'total_seconds',
+        'scheduled_run_count',
+        'scheduled_seconds',
+        'pop',
+    )
+    list_filter = ('pump', )
+    readonly_fields = list_display
+
+    def has_add_permission(self, *args, **kwargs):
+        return False
+
+
 class ScheduledRunAdmin(admin.ModelAdmin):
     list_display = (
         'id',
@@ -202,7 +258,39 @@ class FanAdmin(admin.ModelAdmin):
     )
 
 
+class SensorAdmin(admin.ModelAdmin):
+    list_display = (
+        'device',
+        'kind',
+        'is_active',
+        'iio_device',
+        'channel',
+        'sample_rate',
+        'decimation',
+        'unit',
+    )
+
+
+class SensorReadingAdmin(admin.ModelAdmin):
+    list_display = (
+        'sensor',
+        'start_time',
+        'end_time',
+        'count',
+        'mean',
+        'min',
+        'max',
+        'std',
+    )
+    readonly_fields = list_display
+
+    def has_add_permission(self, *args, **kwargs):
+        return False
+
+
+admin.site.register(ArchivedRun, ArchivedRunAdmin)
 admin.site.register(Camera, CameraAdmin)
+admin.site.register(DailyRunRollup, DailyRunRollupAdmin)
 admin.site.register(Device, DeviceAdmin)
 admin.site.register(Fan, FanAdmin)
 admin.site.register(Lcd, LcdAdmin)
@@ -211,3 +299,5 @@ admin.site.register(PopToPumpDuration, PopToPumpDurationAdmin)
 admin.site.register(Pump, PumpAdmin)
 admin.site.register(Run, RunAdmin)
 admin.site.register(ScheduledRun, ScheduledRunAdmin)
+admin.site.register(Sensor, SensorAdmin)
+admin.site.register(SensorReading, SensorReadingAdmin)
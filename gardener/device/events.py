@@ -0,0 +1,189 @@
+import json
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger('gardener')
+
+# Pump events.
+START = 'start'
+STOP = 'stop'
+EXPIRE = 'expire'
+
+# Published on REDIS_PUMP_EVENTS_CHANNEL and appended to REDIS_RUN_LOG_KEY as compact JSON. The start event is also
+# the value of the pump key while the pump is running. Deadline and time are unix timestamps.
+PumpEvent = namedtuple(
+    'PumpEvent', ('event', 'pump_id', 'status', 'run_id', 'deadline', 'time', 'scheduled_run_id'), defaults=(None, ))
+
+# Seconds during which a scheduled run cannot be started again.
+SCHEDULED_RUN_MARKER_TTL = 86400
+
+# Starts pump unless it is already running (or the scheduled run has already been started, or the running pumps of
+# the device would exceed its pump budget). KEYS[3] to KEYS[2 + n] are the pump keys of the other pumps of the device,
+# with their weights in ARGV[8] onwards, and KEYS[3 + n] is the optional scheduled run marker. Returns 1 on success, 0
+# if the pump is already running, -1 if the scheduled run has already been started and -2 if the budget would be
+# exceeded.
+START_SCRIPT = '''
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local n = tonumber(ARGV[5])
+if ARGV[6] ~= '' then
+    local load = tonumber(ARGV[7])
+    for i = 1, n do
+        if redis.call('exists', KEYS[2 + i]) == 1 then
+            load = load + tonumber(ARGV[7 + i])
+        end
+    end
+    if load > tonumber(ARGV[6]) + 1e-9 then
+        return -2
+    end
+end
+if KEYS[3 + n] and not redis.call('set', KEYS[3 + n], 1, 'NX', 'EX', ARGV[4]) then
+    return -1
+end
+redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+redis.call('rpush', KEYS[2], ARGV[2])
+redis.call('publish', ARGV[1], ARGV[2])
+return 1
+'''
+
+# Stops pump if it is running, copying run details from its start event into the stop event. The stop event is only
+# published (not logged) if the pump is not running and force is set. Returns the stop event or nil.
+STOP_SCRIPT = '''
+local event = ARGV[2]
+local state = redis.call('get', KEYS[1])
+if state then
+    state = cjson.decode(state)
+    event = cjson.decode(event)
+    event['run_id'] = state['run_id']
+    event['deadline'] = state['deadline']
+    event['scheduled_run_id'] = state['scheduled_run_id']
+    event = cjson.encode(event)
+    redis.call('del', KEYS[1])
+    redis.call('rpush', KEYS[2], event)
+elseif ARGV[3] ~= '1' then
+    return false
+end
+redis.call('publish', ARGV[1], event)
+return event
+'''
+
+# Publishes and logs expire event if the pump key has expired. Returns PTTL of the key i.e. -2 if the event has been
+# published, -1 if the key has no TTL or remaining milliseconds if it has not expired yet (or the pump has been
+# started again).
+EXPIRE_SCRIPT = '''
+local ttl = redis.call('pttl', KEYS[1])
+if ttl == -2 then
+    redis.call('rpush', KEYS[2], ARGV[2])
+    redis.call('publish', ARGV[1], ARGV[2])
+end
+return ttl
+'''
+
+_scripts = {}
+
+
+def make_event(event, pump_id, status, run_id=None, deadline=None, timestamp=None, scheduled_run_id=None):
+    return PumpEvent(event, pump_id, status, run_id, deadline, timestamp or time.time(), scheduled_run_id)
+
+
+def encode(event):
+    return json.dumps(event._asdict(), separators=(',', ':'))
+
+
+def decode(data):
+    try:
+        return PumpEvent(**json.loads(data))
+    except (TypeError, ValueError) as e:
+        logger.warning(f'data={data} - e={e}')
+        return None
+
+
+def parse_message(msg):
+    """Returns PumpEvent from pubsub message or None if it is not a pump event."""
+    if msg['type'] != 'message':
+        return None
+    event = decode(msg['data'])
+    logger.debug(f'event={event}')
+    return event
+
+
+def run_script(script, keys, args, client=None):
+    """Runs Lua script by its SHA1, loading it on first use or after Redis has been restarted.
+
+    If client is a pipeline, the script is queued and its result is returned by execute().
+    """
+    if script not in _scripts:
+        _scripts[script] = settings.REDIS_CONN.register_script(script)
+    return _scripts[script](keys=keys, args=args, client=client)
+
+
+def start(redis_key, event, ttl, budget=None, client=None):
+    """Atomically starts pump for ttl milliseconds, see START_SCRIPT.
+
+    Budget is None or tuple of the pump budget, weight of the pump and dict of pump key to weight of the other pumps
+    sharing the budget.
+    """
+    limit, weight, others = budget if budget is not None else ('', 0, {})
+    keys = [redis_key, settings.REDIS_RUN_LOG_KEY] + list(others)
+    if event.scheduled_run_id is not None:
+        keys.append(f'{settings.REDIS_KEY_PREFIX}:scheduled-run:{event.scheduled_run_id}')
+    return run_script(
+        START_SCRIPT,
+        keys,
+        [
+            settings.REDIS_PUMP_EVENTS_CHANNEL,
+            encode(event),
+            ttl,
+            SCHEDULED_RUN_MARKER_TTL,
+            len(others),
+            limit,
+            weight,
+        ] + list(others.values()),
+        client=client)
+
+
+def stop(redis_key, event, force=False, client=None):
+    """Atomically stops pump and returns the published stop event or None, see STOP_SCRIPT."""
+    data = run_script(
+        STOP_SCRIPT,
+        [redis_key, settings.REDIS_RUN_LOG_KEY],
+        [settings.REDIS_PUMP_EVENTS_CHANNEL, encode(event), '1' if force else '0'],
+        client=client)
+    if client is not None:
+        return data
+    return decode(data) if data is not None else None
+
+
+def run_batch(commands):
+    """Runs list of (start or stop, args) commands in one Redis pipeline and returns list of their results.
+
+    Each script stays atomic on its own, the batch as a whole is not.
+    """
+    if not commands:
+        return []
+    pipe = settings.REDIS_CONN.pipeline(transaction=False)
+    for func, args in commands:
+        func(*args, client=pipe)
+    results = []
+    for (func, _), result in zip(commands, pipe.execute()):
+        if func is stop and result is not None:
+            result = decode(result)
+        results.append(result)
+    return results
+
+
+def publish_expiry(redis_key, event):
+    """Publishes expire event unless the pump key still exists and returns its PTTL, see EXPIRE_SCRIPT."""
+    return run_script(
+        EXPIRE_SCRIPT, [redis_key, settings.REDIS_RUN_LOG_KEY], [settings.REDIS_PUMP_EVENTS_CHANNEL, encode(event)])
+
+
+def get_state(redis_keys):
+    """Returns list of start events of the running pumps (None for the pumps which are not running)."""
+    if not redis_keys:
+        return []
+    return [decode(value) if value is not None else None for value in settings.REDIS_CONN.mget(redis_keys)]
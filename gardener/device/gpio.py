@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+import time
+
+from gardener.device.hardware import get_backend
+
+logger = logging.getLogger('gardener')
+
+# Number of attempts (and delay in seconds between them) while waiting for udev to grant access to a newly exported
+# GPIO line.
+EXPORT_RETRIES = 50
+EXPORT_RETRY_DELAY = 0.01
+
+
+class GpioLine:
+    """Handle to a sysfs GPIO line.
+
+    The line is exported once, its direction and edge are only written when they differ from the cached state and
+    its value file descriptor is kept open so that reads and writes are a single pread/pwrite each.
+    """
+
+    def __init__(self, gpio_export_num):
+        self.gpio_export_num = gpio_export_num
+        self.path = os.path.join(get_backend().gpio_path, f'gpio{gpio_export_num}')
+        self.lock = threading.Lock()
+        self.fd = None
+        self.direction = None
+        self.edge = None
+
+    def __str__(self):
+        return '<%s gpio_export_num=%d>' % (self.__class__.__name__, self.gpio_export_num)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def exported(self):
+        return os.path.isdir(self.path)
+
+    def export(self):
+        if self.exported:
+            return True
+        logger.debug(f'exporting gpio #{self.gpio_export_num}')
+        try:
+            get_backend().export_gpio(self.gpio_export_num)
+        except OSError as e:
+            logger.error(f'path={self.path} - e={e}')
+        return self.exported
+
+    def open(self, export=False):
+        """Opens value file descriptor (optionally exporting the line first) and returns True on success."""
+        if self.fd is not None:
+            return True
+        if export:
+            self.export()
+        path = os.path.join(self.path, 'value')
+        for _ in range(EXPORT_RETRIES if export else 1):
+            try:
+                self.fd = os.open(path, os.O_RDWR)
+            except PermissionError:
+                try:
+                    self.fd = os.open(path, os.O_RDONLY)
+                except PermissionError as e:
+                    # udev may not have granted access to a newly exported line yet.
+                    logger.debug(f'path={path} - e={e}')
+                    time.sleep(EXPORT_RETRY_DELAY)
+                    continue
+            except FileNotFoundError:
+                if not export:
+                    return False
+                time.sleep(EXPORT_RETRY_DELAY)
+                continue
+            return True
+        logger.warning(f'cannot open path={path}')
+        return False
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.direction = None
+        self.edge = None
+
+    def fileno(self):
+        return self.fd
+
+    def _read_attr(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read().strip()
+        except OSError as e:
+            logger.warning(f'path={self.path} - name={name} - e={e}')
+            return None
+
+    def _write_attr(self, name, value):
+        logger.debug(f'echo {value} > {self.path}/{name}')
+        try:
+            with open(os.path.join(self.path, name), 'w') as f:
+                f.write(value)
+        except OSError as e:
+            logger.error(f'path={self.path} - name={name} - e={e}')
+            return False
+        return True
+
+    def configure(self, direction, edge=None):
+        """Sets direction and edge, skipping the writes which would not change anything."""
+        with self.lock:
+            if not self.open(export=True):
+                return False
+            if self.direction is None:
+                self.direction = self._read_attr('direction')
+            if direction != self.direction:
+                if not self._write_attr('direction', direction):
+                    return False
+                self.direction = direction
+            if edge is not None:
+                if self.edge is None:
+                    self.edge = self._read_attr('edge')
+                if edge != self.edge:
+                    if not self._write_attr('edge', edge):
+                        return False
+                    self.edge = edge
+            return True
+
+    def read(self):
+        """Returns raw line value or None if the line is not exported."""
+        with self.lock:
+            if not self.open():
+                return None
+            try:
+                return int(os.pread(self.fd, 8, 0).strip())
+            except OSError as e:
+                logger.error(f'path={self.path} - e={e}')
+                self.close()
+                return None
+
+    def write(self, value):
+        """Writes raw line value and returns True on success."""
+        with self.lock:
+            if not self.open(export=True):
+                return False
+            try:
+                os.pwrite(self.fd, b'1' if value else b'0', 0)
+            except OSError as e:
+                logger.error(f'path={self.path} - value={value} - e={e}')
+                self.close()
+                return False
+            return True
+
+
+class GpioGroup:
+    """Set of GPIO output lines written together.
+
+    Each write takes the desired value of every line (either as a sequence or as a bit pattern where bit N is the
+    value of line N), diffs it against the last known state and only writes the lines which changed.
+    """
+
+    def __init__(self, gpio_export_nums):
+        self.lines = [get_line(gpio_export_num) for gpio_export_num in gpio_export_nums]
+        self.values = None
+
+    def __str__(self):
+        return '<%s gpio_export_nums=%s>' % (
+            self.__class__.__name__, [line.gpio_export_num for line in self.lines])
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def read(self):
+        """Configures lines as output and reads their current raw values."""
+        for line in self.lines:
+            line.configure('out')
+        self.values = [line.read() for line in self.lines]
+        return self.values
+
+    def write(self, values):
+        """Writes raw values of the lines which differ from last known state and returns number of lines written."""
+        if isinstance(values, int):
+            values = [(values >> index) & 1 for index in range(len(self.lines))]
+        values = list(values)
+        assert len(values) == len(self.lines)
+
+        if self.values is None:
+            self.read()
+
+        changed = 0
+        for index, (line, value) in enumerate(zip(self.lines, values)):
+            if self.values[index] == value:
+                continue
+            if line.write(value):
+                self.values[index] = value
+                changed += 1
+            else:
+                self.values[index] = None  # Unknown state, retry on next write.
+        logger.debug(f'{self} - values={values} - changed={changed}')
+        return changed
+
+
+_lines = {}
+_lines_lock = threading.Lock()
+
+
+def get_line(gpio_export_num):
+    """Returns process wide handle for the specified GPIO export number."""
+    with _lines_lock:
+        line = _lines.get(gpio_export_num)
+        if line is None:
+            line = _lines[gpio_export_num] = GpioLine(gpio_export_num)
+        return line
+
+
+def close_lines():
+    with _lines_lock:
+        for line in _lines.values():
+            line.close()
+        _lines.clear()
@@ -0,0 +1,156 @@
+import functools
+import logging
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('gardener')
+
+
+class SysfsBackend:
+    """Real hardware accessed through sysfs, IIO character devices, cv2 camera indexes and remote forecasts."""
+    root = '/'
+
+    @property
+    def gpio_path(self):
+        return os.path.join(self.root, 'sys', 'class', 'gpio')
+
+    @property
+    def thermal_path(self):
+        return os.path.join(self.root, 'sys', 'devices', 'virtual', 'thermal')
+
+    @property
+    def iio_sysfs_path(self):
+        return os.path.join(self.root, 'sys', 'bus', 'iio', 'devices')
+
+    @property
+    def iio_dev_path(self):
+        return os.path.join(self.root, 'dev')
+
+    def export_gpio(self, gpio_export_num):
+        with open(os.path.join(self.gpio_path, 'export'), 'w') as f:
+            f.write(f'{gpio_export_num}')
+
+    def open_interrupt(self, line):
+        """Returns file descriptor which becomes ready on the configured edge of the line, or None."""
+        if not line.open():
+            return None
+        return line.fileno()
+
+    def acknowledge_interrupt(self, fd):
+        os.pread(fd, 8, 0)
+
+    def close_interrupt(self, fd):
+        pass  # Shared with the line handle.
+
+    def camera_source(self, camera):
+        return camera.index
+
+    def weather_forecast_url(self, url):
+        return url
+
+
+class SimulatedBackend(SysfsBackend):
+    """In-memory (tmpfs) hardware tree for running the whole stack off-device.
+
+    The tree mirrors sysfs under SIMULATED_HARDWARE_ROOT. Exporting a GPIO line creates its attribute files and an
+    events FIFO which becomes readable when set_gpio_input() changes the line value on its configured edge. The camera
+    is backed by a video file and weather forecasts are fetched from the local forecast_server.
+    """
+
+    @property
+    def root(self):
+        return settings.SIMULATED_HARDWARE_ROOT
+
+    def init(self, thermal_zones=1, temp=45):
+        for path in (self.gpio_path, self.iio_sysfs_path, self.iio_dev_path):
+            os.makedirs(path, exist_ok=True)
+        for index in range(thermal_zones):
+            path = os.path.join(self.thermal_path, f'thermal_zone{index}')
+            os.makedirs(path, exist_ok=True)
+            if not os.path.exists(os.path.join(path, 'temp')):
+                self.set_temp(temp, index)
+        logger.info(f'initialized simulated hardware - root={self.root}')
+
+    def export_gpio(self, gpio_export_num):
+        path = os.path.join(self.gpio_path, f'gpio{gpio_export_num}')
+        os.makedirs(path, exist_ok=True)
+        for name, value in (('active_low', '0'), ('direction', 'in'), ('edge', 'none'), ('value', '0')):
+            if not os.path.exists(os.path.join(path, name)):
+                with open(os.path.join(path, name), 'w') as f:
+                    f.write(f'{value}\n')
+        if not os.path.exists(os.path.join(path, 'events')):
+            os.mkfifo(os.path.join(path, 'events'))
+
+    def open_interrupt(self, line):
+        if not line.exported:
+            self.export_gpio(line.gpio_export_num)
+        return os.open(os.path.join(line.path, 'events'), os.O_RDWR | os.O_NONBLOCK)
+
+    def acknowledge_interrupt(self, fd):
+        try:
+            os.read(fd, 4096)
+        except BlockingIOError:
+            pass
+
+    def close_interrupt(self, fd):
+        os.close(fd)
+
+    def set_gpio_input(self, gpio_export_num, value):
+        """Sets the value of a simulated input line and emits an interrupt if it matches the configured edge."""
+        path = os.path.join(self.gpio_path, f'gpio{gpio_export_num}')
+        if not os.path.isdir(path):
+            self.export_gpio(gpio_export_num)
+        with open(os.path.join(path, 'value')) as f:
+            old_value = int(f.read().strip())
+        with open(os.path.join(path, 'edge')) as f:
+            edge = f.read().strip()
+        with open(os.path.join(path, 'value'), 'w') as f:
+            f.write(f'{value}\n')
+
+        if old_value == value:
+            return False
+        if edge not in ('both', 'rising' if value else 'falling'):
+            return False
+        try:
+            fd = os.open(os.path.join(path, 'events'), os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            logger.debug(f'no interrupt listener - gpio_export_num={gpio_export_num} - e={e}')
+            return False
+        try:
+            os.write(fd, b'1')
+        finally:
+            os.close(fd)
+        logger.info(f'emitted {edge} edge - gpio_export_num={gpio_export_num} - value={value}')
+        return True
+
+    def set_temp(self, temp, zone=0):
+        path = os.path.join(self.thermal_path, f'thermal_zone{zone}')
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'temp'), 'w') as f:
+            f.write(f'{int(temp * 1000)}\n')
+
+    def camera_source(self, camera):
+        if settings.SIMULATED_CAMERA_SOURCE:
+            return settings.SIMULATED_CAMERA_SOURCE
+        return camera.index
+
+    def weather_forecast_url(self, url):
+        filename = os.path.basename(urlparse(url).path)
+        return f'http://127.0.0.1:{settings.SIMULATED_FORECAST_SERVER_PORT}/{filename}'
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    """Returns hardware backend selected by HARDWARE_BACKEND setting."""
+    return import_string(settings.HARDWARE_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'HARDWARE_BACKEND' or setting.startswith('SIMULATED_'):
+        get_backend.cache_clear()
@@ -0,0 +1,211 @@
+import logging
+import numpy as np
+import os
+import re
+
+from gardener.device.hardware import get_backend
+
+logger = logging.getLogger('gardener')
+
+# Scan element type e.g. 'le:s12/16>>4' or 'be:u24/32X2>>0'.
+SCAN_TYPE_RE = re.compile(
+    r'^(?P<endian>[bl]e):(?P<sign>[su])(?P<bits>\d+)/(?P<storage>\d+)(?:X(?P<repeat>\d+))?>>(?P<shift>\d+)$')
+
+
+class IioChannel:
+    def __init__(self, name, index, endian, signed, bits, storage_bits, shift, repeat=1):
+        self.name = name
+        self.index = index
+        self.endian = endian
+        self.signed = signed
+        self.bits = bits
+        self.storage_bits = storage_bits
+        self.shift = shift
+        self.repeat = repeat
+
+    def __str__(self):
+        return '<%s name=%s index=%d type=%s>' % (self.__class__.__name__, self.name, self.index, self.type)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def type(self):
+        repeat = f'X{self.repeat}' if self.repeat > 1 else ''
+        sign = 's' if self.signed else 'u'
+        return f'{self.endian}:{sign}{self.bits}/{self.storage_bits}{repeat}>>{self.shift}'
+
+    @property
+    def storage_bytes(self):
+        return self.storage_bits // 8
+
+    @property
+    def dtype(self):
+        return np.dtype(f'{">" if self.endian == "be" else "<"}{"i" if self.signed else "u"}{self.storage_bytes}')
+
+    @classmethod
+    def from_type(cls, name, index, scan_type):
+        match = SCAN_TYPE_RE.match(scan_type.strip())
+        if match is None:
+            raise ValueError(f'invalid scan element type={scan_type}')
+        return cls(
+            name,
+            index,
+            match.group('endian'),
+            match.group('sign') == 's',
+            int(match.group('bits')),
+            int(match.group('storage')),
+            int(match.group('shift')),
+            int(match.group('repeat') or 1))
+
+    def unpack(self, raw):
+        """Returns channel values from raw storage words, shifted, masked and sign extended."""
+        values = raw.astype(np.int64) if self.signed else raw.astype(np.uint64)
+        values = (values >> self.shift) & ((1 << self.bits) - 1)
+        if self.signed:
+            sign_bit = 1 << (self.bits - 1)
+            values = (values ^ sign_bit) - sign_bit
+        return values.astype(np.float64)
+
+
+def scan_dtype(channels):
+    """Returns structured dtype of one scan of the enabled channels, ordered and aligned as the kernel does."""
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    largest = 1
+    for channel in sorted(channels, key=lambda channel: channel.index):
+        size = channel.storage_bytes
+        if offset % size:
+            offset += size - offset % size
+        names.append(channel.name)
+        formats.append((channel.dtype, (channel.repeat, )) if channel.repeat > 1 else channel.dtype)
+        offsets.append(offset)
+        offset += size * channel.repeat
+        largest = max(largest, size)
+    if offset % largest:
+        offset += largest - offset % largest
+    return np.dtype(dict(names=names, formats=formats, offsets=offsets, itemsize=offset))
+
+
+class IioDevice:
+    """Buffered IIO device reading whole blocks of scans from its character device.
+
+    The device is given by its name e.g. iio:device0. A regular file can stand in for the character device in order
+    to replay recorded buffers.
+    """
+
+    def __init__(self, name, sysfs_path=None, dev_path=None):
+        self.name = name
+        self.path = os.path.join(sysfs_path or get_backend().iio_sysfs_path, name)
+        self.dev_path = os.path.join(dev_path or get_backend().iio_dev_path, name)
+        self.channels = []
+        self.dtype = None
+        self.sample_rate = None
+        self.fd = None
+        self.pending = b''
+
+    def __str__(self):
+        return '<%s name=%s channels=%s>' % (self.__class__.__name__, self.name, self.channels)
+
+    def __repr__(self):
+        return str(self)
+
+    def _read_attr(self, *path):
+        with open(os.path.join(self.path, *path)) as f:
+            return f.read().strip()
+
+    def _write_attr(self, value, *path):
+        path = os.path.join(self.path, *path)
+        if not os.path.exists(path):
+            logger.debug(f'path does not exist - path={path}')
+            return False
+        logger.debug(f'echo {value} > {path}')
+        with open(path, 'w') as f:
+            f.write(f'{value}')
+        return True
+
+    def enable(self, channel_names, buffer_length=None, sample_rate=None):
+        """Enables scan elements of the specified channels and the buffer, then opens the character device.
+
+        Any other enabled scan element e.g. in_timestamp or one left over by a previous run is disabled, otherwise
+        the kernel would pack it into every scan.
+        """
+        self._write_attr(0, 'buffer', 'enable')
+        for filename in sorted(os.listdir(os.path.join(self.path, 'scan_elements'))):
+            if filename.endswith('_en') and filename[:-len('_en')] not in channel_names:
+                self._write_attr(0, 'scan_elements', filename)
+        self.channels = []
+        for name in channel_names:
+            self._write_attr(1, 'scan_elements', f'{name}_en')
+            self.channels.append(IioChannel.from_type(
+                name,
+                int(self._read_attr('scan_elements', f'{name}_index')),
+                self._read_attr('scan_elements', f'{name}_type')))
+        self.dtype = scan_dtype(self.channels)
+        if sample_rate:
+            self._write_attr(sample_rate, 'sampling_frequency')
+        if os.path.exists(os.path.join(self.path, 'sampling_frequency')):
+            # The driver may round the requested rate.
+            self.sample_rate = float(self._read_attr('sampling_frequency'))
+        else:
+            self.sample_rate = sample_rate
+        if buffer_length:
+            self._write_attr(buffer_length, 'buffer', 'length')
+        self._write_attr(1, 'buffer', 'enable')
+        self.fd = os.open(self.dev_path, os.O_RDONLY | os.O_NONBLOCK)
+        logger.info(f'enabled {self} - scan_size={self.dtype.itemsize} - sample_rate={self.sample_rate}')
+
+    def disable(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._write_attr(0, 'buffer', 'enable')
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, max_scans=4096):
+        """Reads available scans and returns dict of channel name to array of values, or None if nothing is ready."""
+        try:
+            data = os.read(self.fd, max_scans * self.dtype.itemsize)
+        except BlockingIOError:
+            return None
+        if not data and not self.pending:
+            return None
+        data = self.pending + data
+        scans = len(data) // self.dtype.itemsize
+        self.pending = data[scans * self.dtype.itemsize:]
+        if scans == 0:
+            return None
+        buffer = np.frombuffer(data, dtype=self.dtype, count=scans)
+        return {channel.name: channel.unpack(buffer[channel.name]).reshape(scans, -1).mean(axis=1)
+                for channel in self.channels}
+
+
+def decimate(values, factor, threshold=3.0):
+    """Returns per block aggregates of values decimated by factor.
+
+    Samples further than threshold robust standard deviations (median absolute deviation) from their block median
+    are rejected as noise e.g. from pump motor switching. Returns dict of count, mean, min, max and std arrays with one
+    element per complete block; the remaining samples are left for the next call.
+    """
+    blocks = len(values) // factor
+    if blocks == 0:
+        empty = np.empty(0)
+        return dict(count=empty, mean=empty, min=empty, max=empty, std=empty)
+    values = np.asarray(values[:blocks * factor], dtype=np.float64).reshape(blocks, factor)
+    median = np.median(values, axis=1, keepdims=True)
+    mad = np.median(np.abs(values - median), axis=1, keepdims=True) * 1.4826
+    keep = (np.abs(values - median) <= threshold * mad) | (mad == 0)
+    count = keep.sum(axis=1)
+    kept = np.where(keep, values, 0)
+    mean = kept.sum(axis=1) / count
+    std = np.sqrt(np.where(keep, (values - mean[:, None]) ** 2, 0).sum(axis=1) / count)
+    return dict(
+        count=count,
+        mean=mean,
+        min=np.where(keep, values, np.inf).min(axis=1),
+        max=np.where(keep, values, -np.inf).max(axis=1),
+        std=std)
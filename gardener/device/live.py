@@ -0,0 +1,227 @@
+import json
+import redis
+from collections import OrderedDict
+
+from django.conf import settings
+
+from gardener.device.events import run_script
+
+# Kinds of telemetry which clients can subscribe to across devices.
+TELEMETRY_KINDS = ('cpu_temp', 'public_ip', 'pump_status')
+
+# Appends message to the capped stream and publishes it, then stores the snapshot. Message and snapshot are JSON
+# objects, the stream id of the message is added to both so that clients can resume from it.
+#
+# KEYS[1] - stream
+# KEYS[2] - snapshot
+# ARGV[1] - channel
+# ARGV[2] - approximate max. length of the stream
+# ARGV[3] - message
+# ARGV[4] - snapshot
+PUBLISH_SCRIPT = '''
+local id = redis.call('xadd', KEYS[1], 'maxlen', '~', ARGV[2], '*', 'message', ARGV[3])
+local function with_id(data)
+    return '{"id":"' .. id .. '",' .. string.sub(data, 2)
+end
+redis.call('publish', ARGV[1], with_id(ARGV[3]))
+redis.call('set', KEYS[2], with_id(ARGV[4]))
+return id
+'''
+
+
+class LiveState:
+    """Last published live state of a device for the websocket clients.
+
+    Clients get a snapshot of the whole state when they subscribe and afterwards only the values which have changed.
+    Pump status is kept per pump so that a pump event changes a single entry. Messages of a device state created with
+    device_id carry it so that they can be routed to the clients subscribed to the device.
+    """
+
+    def __init__(self, device_id=None):
+        self.device_id = device_id
+        self.id = None  # Stream id of the last applied message.
+        self.values = {}
+        self.pump_status = {}  # pump_id -> status
+
+    def __str__(self):
+        return '<%s device_id=%s id=%s values=%s pump_status=%s>' % (
+            self.__class__.__name__, self.device_id, self.id, self.values, self.pump_status)
+
+    def __repr__(self):
+        return str(self)
+
+    def snapshot(self):
+        """Returns the whole state or None if nothing has been sampled yet."""
+        if not self.values and not self.pump_status:
+            return None
+        snapshot = dict(self.values, pump_status=sorted(self.pump_status.items()))
+        if self.device_id is not None:
+            snapshot['device_id'] = self.device_id
+        if self.id is not None:
+            snapshot['id'] = self.id
+        return snapshot
+
+    def update(self, **values):
+        """Stores sampled values and returns dict of the ones which have changed.
+
+        Pump status, if specified, is list of (pump_id, status) of all the pumps and is returned as a whole if any of
+        the pumps has changed.
+        """
+        pump_status = values.pop('pump_status', None)
+        changed = {key: value for key, value in values.items() if key not in self.values or self.values[key] != value}
+        self.values.update(changed)
+        if pump_status is not None and dict(pump_status) != self.pump_status:
+            self.pump_status = dict(pump_status)
+            changed['pump_status'] = sorted(self.pump_status.items())
+        if changed and self.device_id is not None:
+            changed['device_id'] = self.device_id
+        return changed
+
+    def update_pump(self, pump_id, status):
+        """Stores status of a pump and returns its message if it has changed, otherwise None."""
+        if self.pump_status.get(pump_id) == status:
+            return None
+        self.pump_status[pump_id] = status
+        if self.device_id is not None:
+            return dict(device_id=self.device_id, pump_id=pump_id, pump_status=status)
+        return dict(pump_id=pump_id, pump_status=status)
+
+    def load(self, snapshot):
+        """Replaces the state with a snapshot, which may be None."""
+        self.id = None
+        self.values = {}
+        self.pump_status = {}
+        if snapshot is not None:
+            self.apply(snapshot)
+
+    def apply(self, message):
+        """Applies a published message or snapshot e.g. received by a websocket worker."""
+        message = dict(message)
+        self.id = message.pop('id', self.id)
+        if self.device_id is not None:
+            message.pop('device_id', None)
+        if 'pump_id' in message:
+            self.update_pump(message['pump_id'], message['pump_status'])
+        else:
+            self.update(**message)
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+def publish(state, message):
+    """Appends message to the live stream, publishes it to the websocket workers and stores snapshot of the state.
+
+    Returns stream id of the message.
+    """
+    data = run_script(
+        PUBLISH_SCRIPT,
+        [settings.REDIS_LIVE_STREAM_KEY, f'{settings.REDIS_LIVE_SNAPSHOT_KEY}:{state.device_id}'],
+        [settings.REDIS_LIVE_CHANNEL, settings.WEBSOCKET_STREAM_LENGTH, encode(message), encode(state.snapshot())])
+    return data.decode()
+
+
+def get_snapshot(device_id):
+    """Returns the last published snapshot of a device or None."""
+    data = settings.REDIS_CONN.get(f'{settings.REDIS_LIVE_SNAPSHOT_KEY}:{device_id}')
+    return json.loads(data) if data is not None else None
+
+
+def get_snapshots():
+    """Returns list of the last published snapshots of all the devices."""
+    keys = list(settings.REDIS_CONN.scan_iter(f'{settings.REDIS_LIVE_SNAPSHOT_KEY}:*'))
+    if not keys:
+        return []
+    return [json.loads(data) for data in settings.REDIS_CONN.mget(keys) if data is not None]
+
+
+def get_topics(message):
+    """Returns topics of a message or snapshot, clients subscribed to any of them receive it.
+
+    Topics are device:<device_id>, pump:<pump_id> for the pumps whose status it carries and telemetry:<kind> for each
+    of the TELEMETRY_KINDS it carries.
+    """
+    topics = [f'telemetry:{kind}' for kind in TELEMETRY_KINDS if kind in message]
+    if message.get('device_id') is not None:
+        topics.append(f'device:{message["device_id"]}')
+    if 'pump_id' in message:
+        topics.append(f'pump:{message["pump_id"]}')
+    elif 'pump_status' in message:
+        topics.extend(f'pump:{pump_id}' for pump_id, _ in message['pump_status'])
+    return topics
+
+
+def is_topic(topic):
+    """Returns True if topic is one which a client can subscribe to."""
+    if not isinstance(topic, str):
+        return False
+    kind, _, value = topic.partition(':')
+    if kind == 'telemetry':
+        return value in TELEMETRY_KINDS
+    return kind in ('device', 'pump') and value.isdigit()
+
+
+def parse_id(id):
+    """Returns stream id as tuple of (milliseconds, sequence number) for comparison or None if it is invalid."""
+    try:
+        ms, seq = id.split('-')
+        return int(ms), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_missed_messages(last_id, limit=None):
+    """Returns list of the messages published after last_id, which are still in the live stream, with their ids.
+
+    Returns None if any of them has been trimmed from the stream or there are more than limit of them, in which case a
+    snapshot is needed instead.
+    """
+    if limit is None:
+        limit = settings.WEBSOCKET_MAX_REPLAY
+    if parse_id(last_id) is None:
+        return None
+    try:
+        entries = settings.REDIS_CONN.xrange(settings.REDIS_LIVE_STREAM_KEY, min=last_id, count=limit + 2)
+    except redis.ResponseError:
+        return None
+    # The range includes last_id itself as long as it has not been trimmed.
+    if not entries or entries[0][0].decode() != last_id or len(entries) > limit + 1:
+        return None
+    return [dict(json.loads(fields[b'message']), id=id.decode()) for id, fields in entries[1:]]
+
+
+def get_client_counts():
+    """Returns dict of websocket worker to its number of clients, as reported by the running workers."""
+    counts = {}
+    for key in settings.REDIS_CONN.scan_iter(f'{settings.REDIS_WEBSOCKET_CLIENTS_KEY}:*'):
+        value = settings.REDIS_CONN.get(key)
+        if value is not None:
+            counts[key.decode().rsplit(':', 1)[1]] = int(value)
+    return counts
+
+
+def get_message_key(message):
+    """Returns key of a message for SendQueue, a newer message with the same key supersedes it."""
+    if 'pump_id' in message:
+        return 'pump_id', message['pump_id']
+    return message.get('device_id'), tuple(sorted(message))
+
+
+class SendQueue:
+    """Frames pending for a client which has fallen behind, keeping only the latest frame per message key."""
+
+    def __init__(self):
+        self.frames = OrderedDict()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, key, frame):
+        self.frames.pop(key, None)
+        self.frames[key] = frame
+
+    def pop_all(self):
+        frames = list(self.frames.values())
+        self.frames.clear()
+        return frames
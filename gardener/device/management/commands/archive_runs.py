@@ -0,0 +1,61 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from gardener.device.models import Run
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Move runs older than the retention period to the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-once',
+            action='store_true',
+            default=False,
+            help='Archive once and exit.')
+
+        parser.add_argument(
+            '--days',
+            type=int,
+            required=False,
+            default=None,
+            help='Retention period in days, defaults to RUN_RETENTION_DAYS setting.')
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            required=False,
+            default=1000,
+            help='Number of runs moved per transaction.')
+
+        parser.add_argument(
+            '--delay',
+            type=int,
+            required=False,
+            default=86400,
+            help='Delay in seconds for periodical archiving.')
+
+    def handle(self, *args, **options):
+        set_process_priority('archive_runs')
+
+        run_once = options['run_once']
+        days = options['days'] if options['days'] is not None else settings.RUN_RETENTION_DAYS
+        batch_size = options['batch_size']
+        delay = options['delay']
+
+        while True:
+            Run.objects.archive(timezone.now() - timedelta(days=days), batch_size=batch_size)
+
+            if run_once:
+                break
+
+            logger.debug(f'sleeping for {delay}s')
+            time.sleep(delay)
@@ -3,9 +3,13 @@ import logging
 import os
 import time
 
+from django.conf import settings
 from django.core.management import BaseCommand
 
+from gardener.device import thermal
+from gardener.device.hardware import get_backend
 from gardener.device.models import Camera
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
@@ -22,10 +26,15 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical check.')
 
     def handle(self, *args, **options):
+        set_process_priority('camera_runner')
+
         default_delay = options['delay']
         while True:
             camera = Camera.objects.filter(device__is_active=True, is_active=True).first()
-            if camera:
+            if camera and thermal.should_defer(
+                    thermal.VIDEO_ENCODING if camera.snapshot_duration > 0 else thermal.CAMERA_CAPTURE):
+                delay = settings.THERMAL_DEFER_DELAY
+            elif camera:
                 capture(camera)
                 delay = max(0, camera.snapshot_frequency - camera.snapshot_duration)
             else:
@@ -35,9 +44,10 @@ class Command(BaseCommand):
 
 
 def capture(camera):
-    cap = cv2.VideoCapture(camera.index)
+    source = get_backend().camera_source(camera)
+    cap = cv2.VideoCapture(source)
     if not cap.isOpened():
-        logger.error(f'cannot open camera={camera.index}')
+        logger.error(f'cannot open camera={source}')
         return
     logger.info('opened cap')
 
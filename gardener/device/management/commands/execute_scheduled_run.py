@@ -6,6 +6,7 @@ from django.utils import timezone
 
 from gardener.device.models import ScheduledRun
 from gardener.utils import send_email_notification
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
@@ -28,6 +29,8 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical execution.')
 
     def handle(self, *args, **options):
+        set_process_priority('execute_scheduled_run')
+
         run_once = options['run_once']
         delay = options['delay']
 
@@ -38,7 +41,7 @@ class Command(BaseCommand):
                     pump__is_active=True,
                     run__isnull=True,
                     start_time__lte=timezone.now()) \
-                .select_related('pump')
+                .select_related('pump__device')
             for scheduled_run in scheduled_runs:
                 run = scheduled_run.pump.start(scheduled_run=scheduled_run)
                 if run is None:
@@ -7,6 +7,9 @@ from django.core.management import BaseCommand
 from django.utils import timezone
 
 from gardener.device.models import Fan
+from gardener.exceptions import SignalException
+from gardener.utils import handle_termination_signals
+from gardener.utils import set_process_priority
 from gardener.utils import time_in_range
 
 logger = logging.getLogger('gardener')
@@ -30,28 +33,36 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical execution.')
 
     def handle(self, *args, **options):
+        set_process_priority('fan_runner')
+
         run_once = options['run_once']
         delay = options['delay']
 
-        while True:
-            fans = Fan.objects.filter(is_active=False)
-            for fan in fans:
-                fan.stop()
-
-            fans = Fan.objects.filter(device__is_active=True, is_active=True)
-            for fan in fans:
-                now = timezone.localtime().time()
-                start_time = fan.start_time
-                start_dt = datetime.combine(timezone.localtime().date(), start_time)
-                end_time = (start_dt + timedelta(seconds=fan.duration)).time()
-
-                if time_in_range(start_time, end_time, now):
-                    fan.start()
-                else:
+        handle_termination_signals()
+
+        try:
+            while True:
+                fans = Fan.objects.filter(is_active=False)
+                for fan in fans:
                     fan.stop()
 
-            if run_once:
-                break
+                fans = Fan.objects.filter(device__is_active=True, is_active=True)
+                for fan in fans:
+                    now = timezone.localtime().time()
+                    start_time = fan.start_time
+                    start_dt = datetime.combine(timezone.localtime().date(), start_time)
+                    end_time = (start_dt + timedelta(seconds=fan.duration)).time()
+
+                    if time_in_range(start_time, end_time, now):
+                        fan.start()
+                    else:
+                        fan.stop()
+
+                if run_once:
+                    break
 
-            logger.debug(f'sleeping for {delay}s')
-            time.sleep(delay)
+                logger.debug(f'sleeping for {delay}s')
+                time.sleep(delay)
+        except SignalException:
+            logger.info('stopping all fans')
+            Fan.stop_all(Fan.objects.all())
@@ -3,6 +3,7 @@ import logging
 from django.core.management import BaseCommand
 
 from gardener.device.models import Lcd
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
@@ -11,6 +12,8 @@ class Command(BaseCommand):
     help = 'Run LCD actions.'
 
     def handle(self, *args, **options):
+        set_process_priority('lcd_runner')
+
         lcd = Lcd.objects.filter(device__is_active=True, is_active=True).first()
         if lcd is None:
             return
@@ -7,6 +7,9 @@ from django.core.management import BaseCommand
 from django.utils import timezone
 
 from gardener.device.models import Light
+from gardener.exceptions import SignalException
+from gardener.utils import handle_termination_signals
+from gardener.utils import set_process_priority
 from gardener.utils import time_in_range
 
 logger = logging.getLogger('gardener')
@@ -30,28 +33,36 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical execution.')
 
     def handle(self, *args, **options):
+        set_process_priority('light_runner')
+
         run_once = options['run_once']
         delay = options['delay']
 
-        while True:
-            lights = Light.objects.filter(is_active=False)
-            for light in lights:
-                light.stop()
-
-            lights = Light.objects.filter(device__is_active=True, is_active=True)
-            for light in lights:
-                now = timezone.localtime().time()
-                start_time = light.start_time
-                start_dt = datetime.combine(timezone.localtime().date(), start_time)
-                end_time = (start_dt + timedelta(seconds=light.duration)).time()
-
-                if time_in_range(start_time, end_time, now):
-                    light.start()
-                else:
+        handle_termination_signals()
+
+        try:
+            while True:
+                lights = Light.objects.filter(is_active=False)
+                for light in lights:
                     light.stop()
 
-            if run_once:
-                break
+                lights = Light.objects.filter(device__is_active=True, is_active=True)
+                for light in lights:
+                    now = timezone.localtime().time()
+                    start_time = light.start_time
+                    start_dt = datetime.combine(timezone.localtime().date(), start_time)
+                    end_time = (start_dt + timedelta(seconds=light.duration)).time()
+
+                    if time_in_range(start_time, end_time, now):
+                        light.start()
+                    else:
+                        light.stop()
+
+                if run_once:
+                    break
 
-            logger.debug(f'sleeping for {delay}s')
-            time.sleep(delay)
+                logger.debug(f'sleeping for {delay}s')
+                time.sleep(delay)
+        except SignalException:
+            logger.info('stopping all lights')
+            Light.stop_all(Light.objects.all())
@@ -1,13 +1,57 @@
 import logging
 import time
 
+from django.conf import settings
 from django.core.management import BaseCommand
 
+from gardener.device import events
 from gardener.device.models import Pump
+from gardener.device.models import Run
+from gardener.device.watchdog import DeadlineWatchdog
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
 
+def sweep():
+    """Stops timed out pumps, switches off pumps which should not be running and closes stale runs."""
+    pumps = Pump.objects.with_status()
+    for pump in pumps:
+        status = pump.status
+        if status == Pump.TIMED_OUT:
+            logger.info(f'stopping pump={pump} due to status={status}')
+            pump.stop()
+        elif status == Pump.OFF and pump.gpio_value(pump.gpio_export_num) != Pump.OFF:
+            logger.warning(f'force stopping pump={pump}')
+            pump.stop(force=True)
+
+    # Close runs left open e.g. when a pump expired while pump_runner was down, unless the run log still has
+    # events for run_logger to write.
+    stale_pumps = [pump for pump in pumps if pump.status == Pump.OFF and pump.logged_status != Pump.OFF]
+    if stale_pumps and settings.REDIS_CONN.llen(settings.REDIS_RUN_LOG_KEY) == 0:
+        Run.objects.close_stale(stale_pumps)
+    return pumps
+
+
+def check_deadline(pump_id, run_id, deadline):
+    """Makes sure the pump has stopped once its run is over."""
+    try:
+        pump = Pump.objects.get(id=pump_id)
+    except Pump.DoesNotExist as e:
+        logger.warning(f'pump_id={pump_id} - e={e}')
+        return
+    overrun = int((time.time() - deadline) * 1000)
+    status = pump.status
+    if status != Pump.OFF:
+        logger.warning(f'stopping pump={pump} due to status={status} - run_id={run_id} - overrun={overrun}ms')
+        pump.stop()
+    elif pump.gpio_value(pump.gpio_export_num) != Pump.OFF:
+        logger.warning(f'force stopping pump={pump} - run_id={run_id} - overrun={overrun}ms')
+        pump.stop(force=True)
+    else:
+        logger.debug(f'pump_id={pump_id} stopped on time - run_id={run_id}')
+
+
 class Command(BaseCommand):
     help = 'Monitor and stop running pump.'
 
@@ -22,26 +66,50 @@ class Command(BaseCommand):
             '--delay',
             type=int,
             required=False,
-            default=5,
-            help='Delay in seconds for periodical check.')
+            default=60,
+            help='Delay in seconds for periodical safety sweep.')
 
     def handle(self, *args, **options):
+        set_process_priority('monitor_pump')
+
         run_once = options['run_once']
         delay = options['delay']
 
+        if run_once:
+            sweep()
+            return
+
+        # Watch deadlines of the runs announced by pump events and check each pump as soon as its run is over. The
+        # safety sweep also picks up runs started while this process was not listening.
+        watchdog = DeadlineWatchdog()
+        pubsub = settings.REDIS_CONN.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(settings.REDIS_PUMP_EVENTS_CHANNEL)
+
+        next_sweep = 0
         while True:
-            pumps = Pump.objects.all()
-            for pump in pumps:
-                status = pump.status
-                if status == Pump.TIMED_OUT:
-                    logger.info(f'stopping pump={pump} due to status={status}')
-                    pump.stop()
-                elif status == Pump.OFF and pump.gpio_value(pump.gpio_export_num) != Pump.OFF:
-                    logger.warning(f'force stopping pump={pump}')
-                    pump.stop(force=True)
-
-            if run_once:
-                break
-
-            logger.debug(f'sleeping for {delay}s')
-            time.sleep(delay)
+            if time.monotonic() >= next_sweep:
+                for pump in sweep():
+                    state = pump.redis_state
+                    if state is not None:
+                        watchdog.watch(pump.id, state.run_id, state.deadline)
+                next_sweep = time.monotonic() + delay
+
+            for deadline, pump_id, run_id in watchdog.due():
+                check_deadline(pump_id, run_id, deadline)
+
+            timeout = next_sweep - time.monotonic()
+            deadline_timeout = watchdog.timeout()
+            if deadline_timeout is not None:
+                timeout = min(timeout, deadline_timeout)
+            logger.debug(f'waiting for {timeout:.3f}s - {watchdog}')
+            msg = pubsub.get_message(timeout=max(0, timeout))
+            if msg is None:
+                continue
+
+            event = events.parse_message(msg)
+            if event is None:
+                continue
+            if event.event == events.START:
+                watchdog.watch(event.pump_id, event.run_id, event.deadline)
+            else:
+                watchdog.unwatch(event.pump_id)
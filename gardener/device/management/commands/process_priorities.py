@@ -0,0 +1,47 @@
+import os
+import psutil
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from gardener.utils import get_process_priority
+
+
+class Command(BaseCommand):
+    help = 'Print declared and effective scheduling priority of running runners.'
+
+    def handle(self, *args, **options):
+        row = '{:<24} {:>7} {:>5} {:<6} {:>4} {:<10} {:<14}'
+        print(row.format('Runner', 'PID', 'Nice', 'Policy', 'Prio', 'CPUs', 'I/O class'))
+        for process in psutil.process_iter(attrs=['pid', 'cmdline']):
+            name = get_runner_name(process.info['cmdline'] or [])
+            if name is None or process.info['pid'] == os.getpid():
+                continue
+            try:
+                priority = get_process_priority(process.info['pid'])
+            except (OSError, psutil.Error):
+                continue
+            ionice = priority['ionice']
+            if priority['ionice_level'] and ionice in ('realtime', 'best-effort'):
+                ionice = f'{ionice}/{priority["ionice_level"]}'
+            print(row.format(
+                name,
+                process.info['pid'],
+                priority['nice'],
+                priority['policy'],
+                priority['priority'],
+                ','.join(str(cpu) for cpu in priority['cpu_affinity']),
+                ionice))
+            declared = settings.PROCESS_PRIORITIES.get(name)
+            if declared:
+                print(f'{"":<24} declared: {declared}')
+
+
+def get_runner_name(cmdline):
+    """Returns runner name from process command line e.g. pump_runner for python manage.py pump_runner."""
+    for index, arg in enumerate(cmdline):
+        if os.path.basename(arg) == 'manage.py' and index + 1 < len(cmdline):
+            return cmdline[index + 1]
+        if os.path.basename(arg) == 'websocket_server.py':
+            return 'websocket_server'
+    return None
@@ -0,0 +1,99 @@
+import logging
+import redis
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from gardener.device import events
+from gardener.device import thermal
+from gardener.device.live import get_client_counts
+from gardener.device.live import LiveState
+from gardener.device.live import publish
+from gardener.device.models import Device
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+# Delay in seconds before reconnecting to Redis.
+RECONNECT_DELAY = 1
+
+
+class Command(BaseCommand):
+    help = 'Sample live state of the devices and publish its changes once for all websocket workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            default=False,
+            help='Print number of clients per websocket worker and exit.')
+
+    def handle(self, *args, **options):
+        if options['report']:
+            counts = get_client_counts()
+            for worker, count in sorted(counts.items()):
+                print(f'{worker}: {count}')
+            print(f'total: {sum(counts.values())}')
+            return
+
+        set_process_priority('publish_live_state')
+
+        states = {}  # device_id -> LiveState
+        pump_devices = {}  # pump_id -> device_id
+        devices = []
+        next_device_sample = 0
+        next_cpu_temp_sample = 0
+
+        pubsub = settings.REDIS_CONN.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(settings.REDIS_PUMP_EVENTS_CHANNEL)
+
+        while True:
+            try:
+                # Sample each value on its own cadence and publish only the values which have changed, per device.
+                now = time.monotonic()
+                values = {}
+                if now >= next_device_sample:
+                    devices = list(Device.objects.all())
+                    for device in devices:
+                        pump_status = device.pump_status
+                        pump_devices.update((pump_id, device.id) for pump_id, _ in pump_status)
+                        values[device.id] = dict(public_ip=device.public_ip, pump_status=pump_status)
+                    next_device_sample = now + thermal.broadcast_interval(settings.WEBSOCKET_DEVICE_INTERVAL)
+                if now >= next_cpu_temp_sample:
+                    for device in devices:
+                        values.setdefault(device.id, {}).update(cpu_temp=device.cpu_temp)
+                    next_cpu_temp_sample = now + thermal.broadcast_interval(settings.WEBSOCKET_CPU_TEMP_INTERVAL)
+                for device_id, device_values in values.items():
+                    state = states.setdefault(device_id, LiveState(device_id))
+                    message = state.update(**device_values)
+                    if message:
+                        logger.debug(f'message={message}')
+                        publish(state, message)
+
+                # Block until next pump event or next sample.
+                timeout = min(next_device_sample, next_cpu_temp_sample) - time.monotonic()
+                msg = pubsub.get_message(timeout=max(0, timeout))
+                if msg is None:
+                    continue
+
+                event = events.parse_message(msg)
+                if event is None:
+                    continue
+                if event.pump_id not in pump_devices:
+                    # Pump added since the last sample.
+                    next_device_sample = 0
+                    continue
+                state = states[pump_devices[event.pump_id]]
+                message = state.update_pump(event.pump_id, event.status)
+                if message is not None:
+                    logger.debug(f'message={message}')
+                    publish(state, message)
+            except redis.ConnectionError as e:
+                # Changes may not have been published and pump events may have been missed while disconnected, so
+                # resample and publish the whole state once Redis is back.
+                logger.error(f'e={e}')
+                time.sleep(RECONNECT_DELAY)
+                states = {}
+                next_device_sample = 0
+                next_cpu_temp_sample = 0
@@ -1,44 +1,164 @@
 import logging
+import redis
 import time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import BaseCommand
+from django_redis.exceptions import ConnectionInterrupted
 
+from gardener.device import events
 from gardener.device.models import Pump
+from gardener.device.reconciler import PumpReconciler
+from gardener.exceptions import SignalException
+from gardener.utils import get_latency_summary
+from gardener.utils import handle_termination_signals
+from gardener.utils import LatencyRecorder
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
+# Interval in seconds between reconciliation passes and latency reports, and delay before reconnecting to Redis.
+HOUSEKEEPING_INTERVAL = 60
+RECONNECT_DELAY = 1
+
+RECONCILIATION_CACHE_KEY = 'pump_runner_reconciliation'
+
+# Raised by the Redis client and by the cache when Redis is unavailable.
+REDIS_ERRORS = (redis.ConnectionError, ConnectionInterrupted)
+
+
+def scan_pump_keys():
+    """Returns dict of pump ID to tuple of run ID and remaining milliseconds (or None) of the running pumps."""
+    keys = []
+    cursor = 0
+    while True:
+        cursor, partial_keys = settings.REDIS_CONN.scan(cursor, f'{settings.REDIS_KEY_PREFIX}:pump:*', 100)
+        keys.extend(partial_keys)
+        if cursor == 0:
+            break
+    logger.debug(f'keys={keys}')
+    if not keys:
+        return {}
+
+    pipe = settings.REDIS_CONN.pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+        pipe.pttl(key)
+    values = pipe.execute()
+
+    running = {}
+    for value, ttl in zip(values[::2], values[1::2]):
+        if value is None or ttl == -2:
+            continue
+        state = events.decode(value)
+        if state is None:
+            continue
+        running[state.pump_id] = (state.run_id, ttl if ttl >= 0 else None)
+    return running
+
 
 class Command(BaseCommand):
     help = 'Start or stop pump based on its status in Redis.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            default=False,
+            help='Print measured command latency and exit.')
+
     def handle(self, *args, **options):
-        last_keys = None
-
-        pubsub = settings.REDIS_CONN.pubsub()
-        pubsub.psubscribe(f'__keyspace@*:{settings.REDIS_KEY_PREFIX}:*')
-
-        while True:
-            now_ms = time.time() * 1000
-
-            # Loop through pump keys every second to ensure keys are expired in a timely manner.
-            if last_keys is None or (now_ms - last_keys >= 1000):
-                keys = []
-                cursor = 0
-                while True:
-                    cursor, partial_keys = settings.REDIS_CONN.scan(cursor, f'{settings.REDIS_KEY_PREFIX}:pump:*', 100)
-                    keys.extend(partial_keys)
-                    if cursor == 0:
-                        break
-                logger.debug(f'keys={keys}')
-                last_keys = now_ms
-
-            msg = pubsub.get_message()
-            if msg is None:
-                time.sleep(0.01)  # 10 ms artificial intrinsic latency.
-                continue
-
-            (pump_id, pump_status) = Pump.parse_redis_pubsub_msg(msg)
-            if pump_id is not None and pump_status is not None:
-                pump = Pump.objects.get(id=pump_id)
-                pump.set_gpio_value(pump.gpio_export_num, pump_status)
+        if options['report']:
+            summary = get_latency_summary('pump_runner')
+            if summary is None:
+                print('No latency reported yet.')
+            else:
+                for key, value in summary.items():
+                    print(f'{key}: {value}')
+            reconciliation = cache.get(RECONCILIATION_CACHE_KEY)
+            if reconciliation is not None:
+                print(f'Last reconciliation: {reconciliation}')
+            return
+
+        set_process_priority('pump_runner')
+
+        reconciler = PumpReconciler()
+        deadlines = {}  # pump_id -> (monotonic time of deadline, run_id, deadline)
+        latency = LatencyRecorder('pump_runner')
+
+        pubsub = settings.REDIS_CONN.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(settings.REDIS_PUMP_EVENTS_CHANNEL)
+        drift_total = 0
+
+        handle_termination_signals()
+
+        next_housekeeping = 0
+
+        try:
+            while True:
+                try:
+                    now = time.monotonic()
+
+                    # Pump keys expire in Redis without notification, so publish the expire event on the deadline of
+                    # each run. The event is received like any other and switches the pump off.
+                    for pump_id, (timer, run_id, deadline) in list(deadlines.items()):
+                        if timer > now:
+                            continue
+                        event = events.make_event(events.EXPIRE, pump_id, Pump.OFF, run_id, deadline)
+                        ttl = events.publish_expiry(Pump(id=pump_id).redis_key, event)
+                        if ttl >= 0:
+                            deadlines[pump_id] = (now + ttl / 1000, run_id, deadline)
+                        else:
+                            del deadlines[pump_id]
+
+                    # Reconcile on start, after reconnecting and periodically. Reloading pumps picks up changes e.g.
+                    # GPIO export numbers edited in the admin.
+                    if now >= next_housekeeping:
+                        running = scan_pump_keys()
+                        for pump_id, (run_id, ttl) in running.items():
+                            if ttl is not None and pump_id not in deadlines:
+                                deadlines[pump_id] = (now + ttl / 1000, run_id, time.time() + ttl / 1000)
+                        reconciler.load(Pump.objects.all())
+                        drift = reconciler.reconcile(running)
+                        drift_total += len(drift)
+                        cache.set(RECONCILIATION_CACHE_KEY, dict(
+                            time=int(time.time()),
+                            pumps=len(reconciler.pumps),
+                            running=reconciler.running,
+                            drift=[pump.id for pump in drift],
+                            drift_total=drift_total), timeout=None)
+                        latency.report()
+                        next_housekeeping = now + HOUSEKEEPING_INTERVAL
+
+                    timeout = min([next_housekeeping] + [timer for timer, _, _ in deadlines.values()])
+                    msg = pubsub.get_message(timeout=max(0, timeout - time.monotonic()))
+                    if msg is None:
+                        continue
+
+                    event = events.parse_message(msg)
+                    if event is None:
+                        continue
+
+                    reconciler.set(event.pump_id, event.status)
+                    latency.add((time.time() - event.time) * 1000)
+                    logger.info(f'event={event}')
+
+                    if event.event == events.START and event.deadline is not None:
+                        deadlines[event.pump_id] = (
+                            time.monotonic() + event.deadline - time.time(), event.run_id, event.deadline)
+                    else:
+                        deadlines.pop(event.pump_id, None)
+                except REDIS_ERRORS as e:
+                    # Events may have been missed while disconnected, reconcile as soon as Redis is back.
+                    logger.error(f'e={e}')
+                    time.sleep(RECONNECT_DELAY)
+                    next_housekeeping = 0
+        except SignalException:
+            logger.info('stopping all pumps')
+            Pump.stop_all(Pump.objects.all())
+        finally:
+            try:
+                latency.report()
+            except REDIS_ERRORS as e:
+                logger.error(f'e={e}')
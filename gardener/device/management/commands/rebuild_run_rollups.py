@@ -0,0 +1,29 @@
+import logging
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from gardener.device.models import DailyRunRollup
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily run rollups from runs and archived runs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            required=False,
+            default=None,
+            help='Number of recent days to recompute, defaults to all days.')
+
+    def handle(self, *args, **options):
+        set_process_priority('rebuild_run_rollups')
+
+        days = options['days']
+        since = timezone.localdate() - timedelta(days=days) if days is not None else None
+        DailyRunRollup.objects.rebuild(since=since)
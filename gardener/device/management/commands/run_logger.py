@@ -0,0 +1,64 @@
+import logging
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from gardener.device.models import Run
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Write runs from the run log in Redis to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-once',
+            action='store_true',
+            default=False,
+            help='Write pending runs and exit.')
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            required=False,
+            default=100,
+            help='Max. number of run log events written per transaction.')
+
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            required=False,
+            default=60,
+            help='Max. seconds to wait for pump events before checking the run log again.')
+
+    def handle(self, *args, **options):
+        set_process_priority('run_logger')
+
+        run_once = options['run_once']
+        batch_size = options['batch_size']
+        timeout = options['timeout']
+
+        # Pump events only wake this process up, the run log is the durable source of the events. Events are removed
+        # from the log once written so nothing is lost if the process is restarted.
+        pubsub = settings.REDIS_CONN.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(settings.REDIS_PUMP_EVENTS_CHANNEL)
+
+        while True:
+            while True:
+                values = settings.REDIS_CONN.lrange(settings.REDIS_RUN_LOG_KEY, 0, batch_size - 1)
+                if not values:
+                    break
+                Run.objects.write_events(values)
+                settings.REDIS_CONN.ltrim(settings.REDIS_RUN_LOG_KEY, len(values), -1)
+                logger.info(f'wrote {len(values)} run log events')
+
+            if run_once:
+                break
+
+            # Wait for the next pump event, then drain the queued ones as the run log has all of them.
+            logger.debug(f'waiting for pump events for {timeout}s')
+            if pubsub.get_message(timeout=timeout) is not None:
+                while pubsub.get_message() is not None:
+                    pass
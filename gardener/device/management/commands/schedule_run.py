@@ -8,14 +8,47 @@ from django.db.models import Func
 from django.utils import timezone
 
 from gardener.data.models import WeatherForecast
+from gardener.data.solar import get_next_sun
 from gardener.device.models import PopToPumpDuration
 from gardener.device.models import Pump
 from gardener.device.models import ScheduledRun
-from gardener.utils import get_next_sun
+from gardener.device.scheduling import pack
+from gardener.utils import set_process_priority
 
 logger = logging.getLogger('gardener')
 
 
+def schedule(requests):
+    """Schedules requested runs of the pumps of a device, staggering them to stay within the pump budget."""
+    device = requests[0][0].device
+    runs = []
+    if device.pump_budget is not None:
+        # Runs scheduled earlier which may still be running at the earliest requested start time.
+        earliest_start_time = min(start_time for _, start_time, _, _ in requests)
+        scheduled_runs = ScheduledRun.objects \
+            .filter(pump__device=device, start_time__gte=earliest_start_time - timedelta(days=1)) \
+            .select_related('pump')
+        for scheduled_run in scheduled_runs:
+            end_time = scheduled_run.start_time + timedelta(seconds=scheduled_run.duration)
+            if end_time > earliest_start_time:
+                runs.append((scheduled_run.start_time, end_time, scheduled_run.pump.budget_weight))
+
+    start_times = pack(
+        [(pump.id, start_time, duration, pump.budget_weight) for pump, start_time, duration, _ in requests],
+        device.pump_budget,
+        runs)
+
+    for pump, start_time, duration, weather_forecast in requests:
+        if start_times[pump.id] != start_time:
+            logger.info(f'staggered pump={pump} - start_time={start_time} - slot={start_times[pump.id]}')
+        obj, created = ScheduledRun.objects.update_or_create(
+            pump=pump,
+            start_time=start_times[pump.id],
+            defaults=dict(weather_forecast=weather_forecast, duration=duration))
+        if created:
+            logger.info(f'obj={obj}')
+
+
 class Command(BaseCommand):
     help = 'Schedule pump to run automatically.'
 
@@ -34,6 +67,8 @@ class Command(BaseCommand):
             help='Delay in seconds for periodical scheduling.')
 
     def handle(self, *args, **options):
+        set_process_priority('schedule_run')
+
         run_once = options['run_once']
         delay = options['delay']
 
@@ -41,6 +76,7 @@ class Command(BaseCommand):
             pumps = Pump.objects \
                 .filter(device__is_active=True, is_active=True, scheduled_run_frequency__isnull=False) \
                 .select_related('device', 'device__location')
+            requests = {}  # device_id -> list of (pump, next_start_time, duration, weather_forecast)
             for pump in pumps:
                 freq = pump.scheduled_run_frequency  # Days.
 
@@ -91,12 +127,10 @@ class Command(BaseCommand):
                     if pop_to_pump_duration:
                         duration = pop_to_pump_duration.duration
 
-                obj, created = ScheduledRun.objects.update_or_create(
-                    pump=pump,
-                    start_time=next_start_time,
-                    defaults=dict(weather_forecast=weather_forecast, duration=duration))
-                if created:
-                    logger.info(f'obj={obj}')
+                requests.setdefault(pump.device_id, []).append((pump, next_start_time, duration, weather_forecast))
+
+            for device_requests in requests.values():
+                schedule(device_requests)
 
             if run_once:
                 break
@@ -0,0 +1,117 @@
+import logging
+import numpy as np
+import select
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from gardener.device.iio import decimate
+from gardener.device.iio import IioDevice
+from gardener.device.models import Sensor
+from gardener.device.models import SensorReading
+from gardener.exceptions import SignalException
+from gardener.utils import handle_termination_signals
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Read sensors from buffered IIO devices and store decimated readings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-once',
+            action='store_true',
+            default=False,
+            help='Read available samples once and exit.')
+
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            required=False,
+            default=1,
+            help='Timeout in seconds while waiting for samples.')
+
+    def handle(self, *args, **options):
+        set_process_priority('sensor_runner')
+
+        run_once = options['run_once']
+        timeout = options['timeout']
+
+        sensors = defaultdict(list)
+        for sensor in Sensor.objects.filter(device__is_active=True, is_active=True):
+            sensors[sensor.iio_device].append(sensor)
+        if not sensors:
+            logger.info('no active sensors')
+            return
+
+        samples = {sensor.id: np.empty(0) for device_sensors in sensors.values() for sensor in device_sensors}
+        devices = {}
+        handle_termination_signals()
+        try:
+            for name, device_sensors in sensors.items():
+                device = IioDevice(name)
+                devices[device] = device_sensors  # Disabled below even if enabling fails half way.
+                device.enable(
+                    [sensor.channel for sensor in device_sensors],
+                    buffer_length=max(sensor.decimation for sensor in device_sensors),
+                    sample_rate=max(sensor.sample_rate for sensor in device_sensors))
+                for sensor in device_sensors:
+                    if sensor.sample_rate != device.sample_rate:
+                        logger.warning(
+                            f'sensor={sensor} - sample_rate={sensor.sample_rate} - '
+                            f'device_sample_rate={device.sample_rate}')
+
+            while True:
+                if run_once:
+                    ready = list(devices)
+                else:
+                    ready, _, _ = select.select(list(devices), [], [], timeout)
+                readings = []
+                for device in ready:
+                    data = device.read()
+                    if data is None:
+                        continue
+                    for sensor in devices[device]:
+                        values = np.concatenate((samples[sensor.id], sensor.to_unit(data[sensor.channel])))
+                        readings.extend(get_readings(sensor, values, device.sample_rate))
+                        samples[sensor.id] = values[len(values) // sensor.decimation * sensor.decimation:]
+
+                if readings:
+                    SensorReading.objects.bulk_create(readings)
+                    logger.debug(f'readings={readings}')
+
+                if run_once:
+                    break
+        except SignalException:
+            logger.info('stopping sensors')
+        finally:
+            for device in devices:
+                device.disable()
+
+
+def get_readings(sensor, values, sample_rate):
+    """Returns unsaved readings for every complete block of samples at sample_rate, the last block ending now.
+
+    Sensors sharing an IIO device are all sampled at the rate the device runs at, not at their own sample_rate.
+    """
+    aggregates = decimate(values, sensor.decimation)
+    blocks = len(aggregates['mean'])
+    block_duration = timedelta(seconds=sensor.decimation / sample_rate)
+    end_time = timezone.now()
+    readings = []
+    for index in range(blocks):
+        block_end_time = end_time - block_duration * (blocks - index - 1)
+        readings.append(SensorReading(
+            sensor=sensor,
+            start_time=block_end_time - block_duration,
+            end_time=block_end_time,
+            count=int(aggregates['count'][index]),
+            mean=float(aggregates['mean'][index]),
+            min=float(aggregates['min'][index]),
+            max=float(aggregates['max'][index]),
+            std=float(aggregates['std'][index])))
+    return readings
@@ -0,0 +1,75 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from gardener.device.hardware import get_backend
+from gardener.device.hardware import SimulatedBackend
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Drive the simulated hardware backend e.g. press a switch or heat up the CPU.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--init',
+            action='store_true',
+            default=False,
+            help='Create simulated hardware tree.')
+
+        parser.add_argument(
+            '--gpio',
+            type=int,
+            required=False,
+            help='GPIO export number of input line to set.')
+
+        parser.add_argument(
+            '--value',
+            type=int,
+            choices=(0, 1),
+            required=False,
+            help='Value to set on input line.')
+
+        parser.add_argument(
+            '--press',
+            type=int,
+            required=False,
+            help='GPIO export number of active-low switch to press and release.')
+
+        parser.add_argument(
+            '--temp',
+            type=float,
+            required=False,
+            help='Temperature in °C to set on thermal zone.')
+
+        parser.add_argument(
+            '--zone',
+            type=int,
+            required=False,
+            default=0,
+            help='Thermal zone index.')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if not isinstance(backend, SimulatedBackend):
+            raise CommandError('HARDWARE_BACKEND is not a simulated backend')
+
+        if options['init']:
+            backend.init()
+
+        if options['gpio'] is not None:
+            if options['value'] is None:
+                raise CommandError('--value is required with --gpio')
+            backend.set_gpio_input(options['gpio'], options['value'])
+
+        if options['press'] is not None:
+            backend.set_gpio_input(options['press'], 1)
+            backend.set_gpio_input(options['press'], 0)
+            time.sleep(0.1)
+            backend.set_gpio_input(options['press'], 1)
+
+        if options['temp'] is not None:
+            backend.set_temp(options['temp'], zone=options['zone'])
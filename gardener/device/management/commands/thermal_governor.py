@@ -0,0 +1,59 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+
+from gardener.device.thermal import get_thermal_state
+from gardener.device.thermal import LEVEL_NAMES
+from gardener.device.thermal import ThermalGovernor
+from gardener.utils import set_process_priority
+
+logger = logging.getLogger('gardener')
+
+
+class Command(BaseCommand):
+    help = 'Sample thermal zones and defer non-critical work when the device is running hot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run-once',
+            action='store_true',
+            default=False,
+            help='Sample once and exit.')
+
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            default=False,
+            help='Print current thermal state and exit.')
+
+        parser.add_argument(
+            '--delay',
+            type=int,
+            required=False,
+            default=10,
+            help='Delay in seconds for periodical sampling.')
+
+    def handle(self, *args, **options):
+        set_process_priority('thermal_governor')
+
+        run_once = options['run_once']
+        delay = options['delay']
+
+        if options['report']:
+            state = get_thermal_state()
+            print(f'Level: {LEVEL_NAMES[state["level"]]}')
+            print(f'Temp: {state["temp"]} ({state["zone"]})')
+            print(f'Deferred: {", ".join(state["deferred"]) or "-"}')
+            return
+
+        governor = ThermalGovernor()
+        while True:
+            state = governor.sample(timeout=delay * 6)
+            logger.debug(f'state={state}')
+
+            if run_once:
+                break
+
+            logger.debug(f'sleeping for {delay}s')
+            time.sleep(delay)
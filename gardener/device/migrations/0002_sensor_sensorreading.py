@@ -0,0 +1,51 @@
+# Generated by Django 2.2.3 on 2026-10-18 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sensor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('soil_moisture', 'Soil moisture'), ('light', 'Light'), ('temperature', 'Temperature')], max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('iio_device', models.CharField(default='iio:device0', help_text='IIO device name.', max_length=50)),
+                ('channel', models.CharField(help_text='IIO scan element name e.g. in_voltage0.', max_length=50)),
+                ('sample_rate', models.PositiveIntegerField(default=1000, help_text='Sampling frequency in Hz.')),
+                ('decimation', models.PositiveIntegerField(default=10000, help_text='Number of samples per stored reading.')),
+                ('scale', models.FloatField(default=1.0, help_text='Multiplier converting raw value to unit.')),
+                ('offset', models.FloatField(default=0.0, help_text='Offset added to raw value before scaling.')),
+                ('unit', models.CharField(blank=True, max_length=10)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='device.Device')),
+            ],
+            options={
+                'unique_together': {('iio_device', 'channel')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SensorReading',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(help_text='Number of samples kept after noise rejection.')),
+                ('mean', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('std', models.FloatField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='device.Sensor')),
+            ],
+            options={
+                'ordering': ('-end_time',),
+                'index_together': {('sensor', 'end_time')},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.3 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0002_sensor_sensorreading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRun',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('pump_id', models.IntegerField()),
+                ('start_time', models.DateTimeField()),
+                ('duration', models.FloatField(help_text='Runtime duration in seconds.')),
+                ('is_scheduled', models.BooleanField(default=False)),
+                ('pop', models.PositiveSmallIntegerField(blank=True, help_text='Probability of precipitation in % at schedule time.', null=True, verbose_name='POP')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['pump', '-start_time'], name='device_run_pump_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(condition=models.Q(end_time__isnull=True), fields=['pump'], name='device_run_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(condition=models.Q(scheduled_run__isnull=False), fields=['-end_time'], name='device_run_sched_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['end_time'], name='device_run_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledrun',
+            index=models.Index(fields=['pump', '-start_time'], name='device_sched_pump_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledrun',
+            index=models.Index(fields=['start_time'], name='device_sched_start_idx'),
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedrun',
+            index_together={('pump_id', 'start_time')},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.3 on 2026-10-18 19:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0003_run_indexes_archivedrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRunRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0, help_text='Total runtime duration in seconds.')),
+                ('scheduled_run_count', models.PositiveIntegerField(default=0)),
+                ('scheduled_seconds', models.FloatField(default=0, help_text='Runtime duration of scheduled runs in seconds.')),
+                ('pop', models.PositiveSmallIntegerField(blank=True, help_text='Highest probability of precipitation in % at schedule time of the scheduled runs.', null=True, verbose_name='POP')),
+                ('pump', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='device.Pump')),
+            ],
+            options={
+                'unique_together': {('pump', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.3 on 2026-10-18 20:03
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0004_dailyrunrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='pump_budget',
+            field=models.FloatField(blank=True, help_text='Max. total budget weight of the pumps running at the same time e.g. number of pumps or supply current, unlimited if not set.', null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='pump',
+            name='budget_weight',
+            field=models.FloatField(default=1, help_text='Weight of this pump counted against the pump budget of the device e.g. its power draw or flow.', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
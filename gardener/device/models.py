@@ -2,23 +2,48 @@ import logging
 import os
 import signal
 import stat
+import time
+from datetime import timedelta
 from operator import itemgetter
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator
 from django.core.validators import MinValueValidator
+from django.db import connection
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import DurationField
+from django.db.models import ExpressionWrapper
+from django.db.models import F
 from django.db.models import Func
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Coalesce
 from django.db.models.functions import Extract
+from django.db.models.functions import Greatest
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 from gardener.data.models import Location
 from gardener.data.models import WeatherForecast
+from gardener.data.solar import get_next_sun
+from gardener.device import events
+from gardener.device.gpio import get_line
+from gardener.device.gpio import GpioGroup
+from gardener.device.hardware import get_backend
 from gardener.exceptions import SignalException
 from gardener.utils import datetime_to_unixtimestamp
 from gardener.utils import get_local_time
-from gardener.utils import get_next_sun
 from gardener.utils import get_private_ip
 from gardener.utils import get_public_ip
 from gardener.utils import get_time_zone
@@ -48,6 +73,12 @@ class Device(models.Model):
     longitude = models.FloatField(
         validators=[MinValueValidator(-180), MaxValueValidator(180)],
         help_text='Longitude where the device is deployed.')
+    pump_budget = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(0)],
+        help_text='Max. total budget weight of the pumps running at the same time e.g. number of pumps or supply '
+                  'current, unlimited if not set.')
     objects = DeviceManager()
 
     def __str__(self):
@@ -58,7 +89,7 @@ class Device(models.Model):
 
     @property
     def cpu_temp(self):
-        path = '/sys/devices/virtual/thermal/thermal_zone0/temp'
+        path = os.path.join(get_backend().thermal_path, 'thermal_zone0', 'temp')
         if os.path.isfile(path):
             value = int(int(open(path).read().strip()) / 1000)
             return value
@@ -88,7 +119,7 @@ class Device(models.Model):
 
     @property
     def pump_status(self):
-        return [(pump.id, pump.status) for pump in self.pump_set.all()]
+        return [(pump.id, pump.status) for pump in self.pump_set.with_status()]
 
     @property
     def weather_forecasts(self):
@@ -141,18 +172,18 @@ class Gpio(models.Model):
     class Meta:
         abstract = True
 
+    def to_relay_value(self, value):
+        """Converts between logical and raw line value (swapped when using active-low relay)."""
+        if self.relay_type == self.ACTIVE_LOW:
+            return self.OFF if value == self.ON else self.ON
+        return value
+
     def gpio_value(self, gpio_export_num):
-        path = f'/sys/class/gpio/gpio{gpio_export_num}/value'
-        if os.path.isfile(path):
-            value = int(open(path).read().strip())
-            assert value in (self.ON, self.OFF)
-            if self.relay_type == self.ACTIVE_LOW:
-                if value == 1:
-                    return 0
-                else:
-                    return 1
-            return value
-        return 0
+        value = get_line(gpio_export_num).read()
+        if value is None:
+            return 0
+        assert value in (self.ON, self.OFF)
+        return self.to_relay_value(value)
 
     def set_gpio_value(self, gpio_export_num, value, direction=None, edge=None):
         assert value in (None, self.ON, self.OFF)
@@ -160,73 +191,21 @@ class Gpio(models.Model):
             direction = self.OUT
         assert direction in (self.IN, self.OUT)
         assert edge in (None, self.RISING, self.FALLING, self.BOTH)
-        logger.info(f'set gpio #{gpio_export_num} - value={value} - direction={direction} - edge={edge}')
-
-        gpio_path = f'/sys/class/gpio/gpio{gpio_export_num}'
-        gpio_direction_path = f'{gpio_path}/direction'
-        gpio_value_path = f'{gpio_path}/value'
-        gpio_edge_path = f'{gpio_path}/edge'
-
-        if not os.path.islink(gpio_path):
-            logger.debug(f'creating gpio #{gpio_export_num} file access')
-            try:
-                with open('/sys/class/gpio/export', 'w') as f:
-                    f.write(f'{gpio_export_num}')
-                    f.flush()
-            except PermissionError as e:
-                logger.error(f'gpio_path={gpio_path} - e={e}')
-
-        if os.path.isfile(gpio_direction_path):
-            logger.debug(f'echo {direction} > {gpio_direction_path}')
-            for _ in range(3):
-                while True:
-                    try:
-                        with open(gpio_direction_path, 'w') as f:
-                            f.write(direction)
-                            f.flush()
-                    except PermissionError as e:
-                        logger.error(f'gpio_direction_path={gpio_direction_path} - e={e}')
-                    else:
-                        break
-        else:
-            logger.warning(f'path does not exist - gpio_direction_path={gpio_direction_path}')
+        logger.debug(f'set gpio #{gpio_export_num} - value={value} - direction={direction} - edge={edge}')
 
+        line = get_line(gpio_export_num)
+        line.configure(direction, edge=edge)
         if value is not None:
-            if os.path.isfile(gpio_value_path):
-                if self.relay_type == self.ACTIVE_LOW:
-                    if value == 1:
-                        value = 0
-                    else:
-                        value = 1
-                logger.debug(f'echo {value} > {gpio_value_path}')
-                for _ in range(3):
-                    while True:
-                        try:
-                            with open(gpio_value_path, 'w') as f:
-                                f.write(f'{value}')
-                                f.flush()
-                        except PermissionError as e:
-                            logger.error(f'gpio_value_path={gpio_value_path} - e={e}')
-                        else:
-                            break
-            else:
-                logger.warning(f'path does not exist - gpio_value_path={gpio_value_path}')
-
-        if edge is not None:
-            if os.path.isfile(gpio_edge_path):
-                logger.debug(f'echo {edge} > {gpio_edge_path}')
-                for _ in range(3):
-                    while True:
-                        try:
-                            with open(gpio_edge_path, 'w') as f:
-                                f.write(f'{edge}')
-                                f.flush()
-                        except PermissionError as e:
-                            logger.error(f'gpio_edge_path={gpio_edge_path} - e={e}')
-                        else:
-                            break
-            else:
-                logger.warning(f'path does not exist - gpio_edge_path={gpio_edge_path}')
+            line.write(self.to_relay_value(value))
+
+    @staticmethod
+    def stop_all(objs):
+        """Switches off GPIO of all the specified objects in one batched pass."""
+        objs = list(objs)
+        group = GpioGroup([obj.gpio_export_num for obj in objs])
+        changed = group.write([obj.to_relay_value(obj.OFF) for obj in objs])
+        logger.info(f'stopped objs={objs} - changed={changed}')
+        return changed
 
     def start(self):
         if self.gpio_value(self.gpio_export_num) != self.ON:
@@ -239,11 +218,121 @@ class Gpio(models.Model):
             self.set_gpio_value(self.gpio_export_num, self.OFF)
 
 
+class PumpQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_status = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_status = self._with_status
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if self._with_status and not fetched:
+            pumps = [pump for pump in self._result_cache if isinstance(pump, Pump)]
+            for pump, state in zip(pumps, events.get_state([pump.redis_key for pump in pumps])):
+                pump.redis_state = state
+
+    def with_logged_status(self):
+        """Annotates logged_status of each pump computed from its latest run in the same SQL statement."""
+        seconds = Coalesce('scheduled_run__duration', 'pump__max_duration', output_field=models.FloatField())
+        duration = ExpressionWrapper(seconds * Value(timedelta(seconds=1)), output_field=models.DurationField())
+        # Deadline of the latest run if it has not ended, otherwise NULL (as if there was no run).
+        deadline = Case(
+            When(end_time__isnull=True, then=F('start_time') + duration),
+            default=None,
+            output_field=models.DateTimeField())
+        latest_run = Run.objects.filter(pump=OuterRef('pk')).order_by('-start_time')
+        return self \
+            .annotate(latest_run_deadline=Subquery(
+                latest_run.annotate(deadline=deadline).values('deadline')[:1], output_field=models.DateTimeField())) \
+            .annotate(logged_status=Case(
+                When(latest_run_deadline__isnull=True, then=Value(Pump.OFF)),
+                When(latest_run_deadline__lt=timezone.now(), then=Value(Pump.TIMED_OUT)),
+                default=Value(Pump.ON),
+                output_field=models.IntegerField()))
+
+    def execute(self, actions):
+        """Executes list of (pump_id, action, duration) pump actions and returns list of results in the same order.
+
+        Action is one of Pump.ACTIONS, duration applies to start only and is capped at max. duration of the pump. The
+        pumps and run IDs are loaded in one transaction and all the actions are sent to Redis in one pipeline.
+        """
+        with transaction.atomic():
+            pumps = self.select_related('device').in_bulk({pump_id for pump_id, _, _ in actions})
+            run_ids = iter(Run.objects.reserve_ids(sum(action == Pump.START for _, action, _ in actions)))
+            device_pumps = {}
+            budget_device_ids = {pump.device_id for pump in pumps.values() if pump.device.pump_budget is not None}
+            for pump in Pump.objects.filter(device_id__in=budget_device_ids):
+                device_pumps.setdefault(pump.device_id, []).append(pump)
+
+        results = []
+        pending = []  # (result, pump, run) per command
+        commands = []
+        for pump_id, action, duration in actions:
+            pump = pumps.get(pump_id)
+            result = dict(id=pump_id, action=action, status=None, run_id=None)
+            results.append(result)
+            if pump is None:
+                result['status'] = Pump.NOT_FOUND
+            elif action == Pump.START and not (pump.is_active and pump.device.is_active):
+                result['status'] = Pump.INACTIVE
+            elif action == Pump.START:
+                run, event, ttl = pump.start_command(next(run_ids), duration=duration)
+                pending.append((result, pump, run))
+                budget = pump.get_budget(device_pumps.get(pump.device_id))
+                commands.append((events.start, (pump.redis_key, event, ttl, budget)))
+            else:
+                pending.append((result, pump, None))
+                commands.append((events.stop, (pump.redis_key, pump.stop_command(), action == Pump.FORCE_STOP)))
+
+        for (result, pump, run), value in zip(pending, events.run_batch(commands)):
+            if run is not None:
+                run = pump.started(run, value)
+                if run is not None:
+                    result['status'] = Pump.STARTED
+                    result['run_id'] = run.id
+                else:
+                    result['status'] = Pump.OVER_BUDGET if value == -2 else Pump.ALREADY_STARTED
+            else:
+                event = pump.stopped(value)
+                result['status'] = Pump.STOPPED if event is not None else Pump.ALREADY_STOPPED
+                result['run_id'] = event.run_id if event is not None else None
+        logger.info(f'executed actions={actions} - results={results}')
+        return results
+
+    def with_status(self):
+        """Loads status of all the pumps from Redis in a single MGET when the queryset is evaluated.
+
+        The pumps are annotated with their logged_status too, so that the whole queryset costs one SQL query and one
+        Redis round trip regardless of the number of pumps.
+        """
+        clone = self.with_logged_status()
+        clone._with_status = True
+        return clone
+
+
 class Pump(Gpio):
     MAX_DURATION = 600
 
     TIMED_OUT = 2  # Ran over duration.
 
+    # Actions and their results for PumpQuerySet.execute().
+    START = 'start'
+    STOP = 'stop'
+    FORCE_STOP = 'force_stop'
+    ACTIONS = (START, STOP, FORCE_STOP)
+    STARTED = 'started'
+    ALREADY_STARTED = 'already_started'
+    STOPPED = 'stopped'
+    ALREADY_STOPPED = 'already_stopped'
+    INACTIVE = 'inactive'
+    OVER_BUDGET = 'over_budget'
+    NOT_FOUND = 'not_found'
+
     HOURLY = 0.04167
     THREE_HOURLY = 0.125
     DAILY = 1.0
@@ -263,11 +352,16 @@ class Pump(Gpio):
     gpio_export_num = models.PositiveSmallIntegerField(help_text='GPIO export number connected to this pump.')
     is_active = models.BooleanField(default=True)
     max_duration = models.PositiveSmallIntegerField(default=MAX_DURATION, help_text='Max. duration in seconds per run.')
+    budget_weight = models.FloatField(
+        default=1,
+        validators=[MinValueValidator(0)],
+        help_text='Weight of this pump counted against the pump budget of the device e.g. its power draw or flow.')
     scheduled_run_default_duration = models.FloatField(
         default=SCHEDULED_RUN_DEFAULT_DURATION, help_text='Default scheduled runtime duration in seconds.')
     scheduled_run_frequency = models.FloatField(
         blank=True, null=True, choices=SCHEDULED_RUN_FREQUENCY_CHOICES, default=DAILY, help_text='In days.')
     scheduled_run_email_notification_recipients = ArrayField(models.EmailField(), blank=True, null=True)
+    objects = PumpQuerySet.as_manager()
 
     def __str__(self):
         return '<%s device=%s gpio_export_num=%d>' % (self.__class__.__name__, self.device, self.gpio_export_num)
@@ -288,79 +382,89 @@ class Pump(Gpio):
 
     @property
     def status(self):
-        """Returns pump status based on latest run state."""
-        try:
-            run = self.run_set.select_related('scheduled_run').latest('start_time')
-        except Run.DoesNotExist:
+        """Returns pump status from its state in Redis, as loaded by with_status() if the pump comes from it."""
+        if hasattr(self, 'redis_state'):
+            return self.status_from_state(self.redis_state)
+        return self.status_from_state(events.get_state([self.redis_key])[0])
+
+    def status_from_state(self, state):
+        if state is None:
             return self.OFF
-        else:
-            if run.end_time is not None:
-                return self.OFF
+        if state.deadline is not None and state.deadline < time.time():
+            return self.TIMED_OUT  # Not expired by Redis yet.
+        return self.ON
+
+    def start(self, scheduled_run=None, duration=None):
+        """Starts pump unless it is already running and returns its run.
+
+        The pump state is set in Redis atomically together with its TTL (duration of the scheduled run, the specified
+        duration or max. duration) and the start event is appended to the run log, from which run_logger writes the
+        run.
+        """
+        run, event, ttl = self.start_command(Run.objects.reserve_id(), scheduled_run, duration)
+        return self.started(run, events.start(self.redis_key, event, ttl, budget=self.get_budget()))
+
+    def get_budget(self, pumps=None):
+        """Returns pump budget of the device for events.start() or None if it is unlimited.
+
+        The other pumps of the device are loaded unless they are specified.
+        """
+        budget = self.device.pump_budget
+        if budget is None:
+            return None
+        if pumps is None:
+            pumps = Pump.objects.filter(device_id=self.device_id)
+        others = {pump.redis_key: pump.budget_weight for pump in pumps if pump.id != self.id}
+        return budget, min(self.budget_weight, budget), others
+
+    def start_command(self, run_id, scheduled_run=None, duration=None):
+        """Returns run to start and its start event and TTL in milliseconds."""
+        run = Run(id=run_id, pump=self, start_time=timezone.now(), scheduled_run=scheduled_run)
+        if scheduled_run is not None:
+            duration = scheduled_run.duration
+        elif duration is None or duration > self.max_duration:
             duration = self.max_duration
-            if run.scheduled_run is not None:
-                duration = run.scheduled_run.duration
-            if (timezone.now() - run.start_time).total_seconds() > duration:
-                return self.TIMED_OUT
-            return self.ON
-
-    @staticmethod
-    def parse_redis_pubsub_msg(msg):
-        msg_type = msg['type']
-        msg_channel = msg['channel']
-        msg_data = msg['data']
-        logger.info(f'msg_type={msg_type} - msg_channel={msg_channel} - msg_data={msg_data}')
-
-        if msg_type != 'pmessage':
-            return (None, None)
-
-        # msg_channel example: '__keyspace@0__:gardener:pump:1:1'
-        msg_channel = msg_channel.decode()
-        if f'{settings.REDIS_KEY_PREFIX}:pump:' not in msg_channel:
-            return (None, None)
-
-        pump_id = int(msg_channel.split('@')[1].split(':')[3])
-        pump_status = None
-
-        msg_data = msg_data.decode()
-        if msg_data == 'set':
-            pump_status = Pump.ON
-        elif msg_data in ('del', 'expired'):
-            pump_status = Pump.OFF
-
-        return (pump_id, pump_status)
-
-    def start(self, scheduled_run=None):
-        if self.status in (self.ON, self.TIMED_OUT):
+        ttl = max(int(duration * 1000), 1)
+        event = events.make_event(
+            events.START,
+            self.id,
+            self.ON,
+            run.id,
+            deadline=run.start_time.timestamp() + ttl / 1000,
+            timestamp=run.start_time.timestamp(),
+            scheduled_run_id=scheduled_run.id if scheduled_run is not None else None)
+        return run, event, ttl
+
+    def started(self, run, result):
+        """Returns the run if the start script has started it, otherwise None."""
+        if result == 0:
             logger.warning('pump is already started')
             return None
-        if scheduled_run is not None:
-            run = Run.objects.create(pump=self, start_time=timezone.now(), scheduled_run=scheduled_run)
-        else:
-            run = Run.objects.create(pump=self, start_time=timezone.now())
-        settings.REDIS_CONN.set(self.redis_key, 1)
-        if scheduled_run is not None:
-            ttl = int(scheduled_run.duration * 1000)
-            logger.info(f'redis_key={self.redis_key} - ttl={ttl}')
-            settings.REDIS_CONN.pexpire(self.redis_key, ttl)
+        if result == -1:
+            logger.warning(f'scheduled run has already been started - scheduled_run={run.scheduled_run}')
+            return None
+        if result == -2:
+            logger.warning(f'pump budget exceeded - pump_budget={self.device.pump_budget}')
+            return None
         logger.info(f'pump started - run={run}')
         return run
 
     def stop(self, force=False):
-        if self.status in (self.ON, self.TIMED_OUT):
-            try:
-                run = self.run_set.filter(end_time__isnull=True).latest('start_time')
-            except Run.DoesNotExist as e:
-                logger.error(f'e={e}')
-                if force:
-                    settings.REDIS_CONN.delete(self.redis_key)
-                logger.info(f'pump force stopped')
-            else:
-                run.end_time = timezone.now()
-                run.save()
-                settings.REDIS_CONN.delete(self.redis_key)
-                logger.info(f'pump stopped - run={run}')
-        else:
+        """Stops pump if it is running, or just switches it off if force is set."""
+        return self.stopped(events.stop(self.redis_key, self.stop_command(), force=force))
+
+    def stop_command(self):
+        return events.make_event(events.STOP, self.id, self.OFF, timestamp=timezone.now().timestamp())
+
+    def stopped(self, event):
+        """Returns the published stop event or None if the pump has already been stopped."""
+        if event is None:
             logger.warning('pump is already stopped')
+        elif event.run_id is None:
+            logger.info(f'pump force stopped')
+        else:
+            logger.info(f'pump stopped - run_id={event.run_id}')
+        return event
 
 
 class PopToPumpDuration(models.Model):
@@ -392,12 +496,98 @@ class ScheduledRun(models.Model):
     def __repr__(self):
         return str(self)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['pump', '-start_time'], name='device_sched_pump_start_idx'),
+            models.Index(fields=['start_time'], name='device_sched_start_idx'),
+        ]
+
+
+class RunManager(models.Manager):
+    def reserve_id(self):
+        """Returns next ID of the run sequence so that the run can be started before it is written."""
+        return self.reserve_ids(1)[0]
+
+    def reserve_ids(self, count):
+        """Returns the specified number of IDs from the run sequence in one query."""
+        if count <= 0:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [self.model._meta.db_table, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    def write_events(self, values):
+        """Writes runs from run log events, skipping the events which have already been written."""
+        for value in values:
+            event = events.decode(value)
+            if event is None or event.run_id is None:
+                continue
+            try:
+                with transaction.atomic():
+                    if event.event == events.START:
+                        self.get_or_create(id=event.run_id, defaults=dict(
+                            pump_id=event.pump_id,
+                            start_time=unixtimestamp_to_datetime(event.time),
+                            scheduled_run_id=event.scheduled_run_id))
+                    else:
+                        end_time = event.time
+                        if event.event == events.EXPIRE and event.deadline is not None:
+                            end_time = min(end_time, event.deadline)
+                        updated = self.filter(id=event.run_id, end_time__isnull=True).update(
+                            end_time=unixtimestamp_to_datetime(end_time))
+                        if updated:
+                            DailyRunRollup.objects.add(
+                                self.select_related('scheduled_run__weather_forecast').get(id=event.run_id))
+            except IntegrityError as e:
+                logger.error(f'event={event} - e={e}')
+
+    def close_stale(self, pumps):
+        """Closes runs of the specified pumps which are no longer running e.g. expired while pump_runner was down."""
+        closed = 0
+        runs = self \
+            .filter(pump__in=pumps, end_time__isnull=True) \
+            .select_related('pump', 'scheduled_run__weather_forecast')
+        for run in runs:
+            duration = run.scheduled_run.duration if run.scheduled_run is not None else run.pump.max_duration
+            run.end_time = min(timezone.now(), run.start_time + timedelta(seconds=duration))
+            with transaction.atomic():
+                run.save(update_fields=['end_time'])
+                DailyRunRollup.objects.add(run)
+            logger.info(f'closed stale run={run}')
+            closed += 1
+        return closed
+
+    def archive(self, before, batch_size=1000):
+        """Moves runs which ended before the specified time to ArchivedRun in batches and returns number of runs moved.
+
+        Scheduled runs which started before that time and have no runs left are deleted too.
+        """
+        archived = 0
+        while True:
+            with transaction.atomic():
+                runs = list(self
+                            .filter(end_time__lt=before)
+                            .select_related('scheduled_run__weather_forecast')
+                            .order_by('id')[:batch_size])
+                if not runs:
+                    break
+                ArchivedRun.objects.bulk_create([ArchivedRun.from_run(run) for run in runs], ignore_conflicts=True)
+                self.filter(id__in=[run.id for run in runs]).delete()
+            archived += len(runs)
+            logger.info(f'archived {len(runs)} runs - before={before}')
+        deleted, _ = ScheduledRun.objects.filter(start_time__lt=before, run__isnull=True).delete()
+        logger.info(f'archived={archived} - deleted={deleted} - before={before}')
+        return archived
+
 
 class Run(models.Model):
     pump = models.ForeignKey(Pump, on_delete=models.CASCADE)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(blank=True, null=True)
     scheduled_run = models.ForeignKey(ScheduledRun, blank=True, null=True, on_delete=models.CASCADE)
+    objects = RunManager()
 
     def __str__(self):
         return '<%s id=%d pump=%s start_time=%s end_time=%s>' % (
@@ -406,6 +596,162 @@ class Run(models.Model):
     def __repr__(self):
         return str(self)
 
+    class Meta:
+        indexes = [
+            # Latest run per pump.
+            models.Index(fields=['pump', '-start_time'], name='device_run_pump_start_idx'),
+            # Open runs.
+            models.Index(fields=['pump'], condition=Q(end_time__isnull=True), name='device_run_open_idx'),
+            # Last scheduled run.
+            models.Index(
+                fields=['-end_time'], condition=Q(scheduled_run__isnull=False), name='device_run_sched_end_idx'),
+            # Retention.
+            models.Index(fields=['end_time'], name='device_run_end_idx'),
+        ]
+
+
+class ArchivedRun(models.Model):
+    """Compact copy of a run moved out of the Run table by the retention policy."""
+    id = models.IntegerField(primary_key=True)
+    pump_id = models.IntegerField()
+    start_time = models.DateTimeField()
+    duration = models.FloatField(help_text='Runtime duration in seconds.')
+    is_scheduled = models.BooleanField(default=False)
+    pop = models.PositiveSmallIntegerField(
+        verbose_name='POP', blank=True, null=True, help_text='Probability of precipitation in % at schedule time.')
+
+    def __str__(self):
+        return '<%s id=%d pump_id=%d start_time=%s duration=%f>' % (
+            self.__class__.__name__, self.id, self.pump_id, self.start_time, self.duration)
+
+    def __repr__(self):
+        return str(self)
+
+    class Meta:
+        index_together = (('pump_id', 'start_time'), )
+
+    @classmethod
+    def from_run(cls, run):
+        pop = None
+        if run.scheduled_run is not None and run.scheduled_run.weather_forecast is not None:
+            pop = run.scheduled_run.weather_forecast.pop
+        return cls(
+            id=run.id,
+            pump_id=run.pump_id,
+            start_time=run.start_time,
+            duration=(run.end_time - run.start_time).total_seconds(),
+            is_scheduled=run.scheduled_run_id is not None,
+            pop=pop)
+
+
+class DailyRunRollupManager(models.Manager):
+    def add(self, run):
+        """Adds a closed run to the rollup of its pump and day."""
+        duration = (run.end_time - run.start_time).total_seconds()
+        rollup, _ = self.get_or_create(pump_id=run.pump_id, date=timezone.localtime(run.start_time).date())
+        values = dict(run_count=F('run_count') + 1, total_seconds=F('total_seconds') + duration)
+        if run.scheduled_run is not None:
+            values.update(
+                scheduled_run_count=F('scheduled_run_count') + 1,
+                scheduled_seconds=F('scheduled_seconds') + duration)
+            if run.scheduled_run.weather_forecast is not None and run.scheduled_run.weather_forecast.pop is not None:
+                # GREATEST ignores NULL on PostgreSQL.
+                values['pop'] = Greatest('pop', Value(run.scheduled_run.weather_forecast.pop))
+        self.filter(id=rollup.id).update(**values)
+
+    def rebuild(self, since=None):
+        """Recomputes rollups from closed and archived runs, of the days from the specified date on or of all days.
+
+        Returns number of rollups written.
+        """
+        runs = Run.objects.filter(end_time__isnull=False)
+        archived_runs = ArchivedRun.objects.all()
+        rollups = self.all()
+        if since is not None:
+            runs = runs.filter(start_time__date__gte=since)
+            archived_runs = archived_runs.filter(start_time__date__gte=since)
+            rollups = rollups.filter(date__gte=since)
+
+        duration = ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField())
+        is_scheduled = Q(scheduled_run__isnull=False)
+        run_totals = runs \
+            .annotate(date=TruncDate('start_time')) \
+            .order_by() \
+            .values('pump_id', 'date') \
+            .annotate(
+                run_count=Count('id'),
+                total_seconds=Sum(duration),
+                scheduled_run_count=Count('id', filter=is_scheduled),
+                scheduled_seconds=Sum(duration, filter=is_scheduled),
+                pop=Max('scheduled_run__weather_forecast__pop', filter=is_scheduled))
+        archived_run_totals = archived_runs \
+            .annotate(date=TruncDate('start_time')) \
+            .order_by() \
+            .values('pump_id', 'date') \
+            .annotate(
+                run_count=Count('id'),
+                total_seconds=Sum('duration'),
+                scheduled_run_count=Count('id', filter=Q(is_scheduled=True)),
+                scheduled_seconds=Sum('duration', filter=Q(is_scheduled=True)),
+                pop=Max('pop'))
+
+        pump_ids = set(Pump.objects.values_list('id', flat=True))
+        totals = {}
+        for row in list(run_totals) + list(archived_run_totals):
+            if row['pump_id'] not in pump_ids:
+                continue
+            rollup = totals.setdefault(
+                (row['pump_id'], row['date']), self.model(pump_id=row['pump_id'], date=row['date']))
+            rollup.run_count += row['run_count']
+            rollup.scheduled_run_count += row['scheduled_run_count']
+            for field in ('total_seconds', 'scheduled_seconds'):
+                seconds = row[field] or 0
+                if isinstance(seconds, timedelta):
+                    seconds = seconds.total_seconds()
+                setattr(rollup, field, getattr(rollup, field) + seconds)
+            if row['pop'] is not None:
+                rollup.pop = max(rollup.pop or 0, row['pop'])
+
+        with transaction.atomic():
+            rollups.delete()
+            self.bulk_create(totals.values())
+        logger.info(f'rebuilt {len(totals)} rollups - since={since}')
+        return len(totals)
+
+
+class DailyRunRollup(models.Model):
+    """Runs of a pump per local day, updated as runs close."""
+    pump = models.ForeignKey(Pump, on_delete=models.CASCADE)
+    date = models.DateField()
+    run_count = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0, help_text='Total runtime duration in seconds.')
+    scheduled_run_count = models.PositiveIntegerField(default=0)
+    scheduled_seconds = models.FloatField(default=0, help_text='Runtime duration of scheduled runs in seconds.')
+    pop = models.PositiveSmallIntegerField(
+        verbose_name='POP',
+        blank=True,
+        null=True,
+        help_text='Highest probability of precipitation in % at schedule time of the scheduled runs.')
+    objects = DailyRunRollupManager()
+
+    def __str__(self):
+        return '<%s pump_id=%d date=%s run_count=%d total_seconds=%f>' % (
+            self.__class__.__name__, self.pump_id, self.date, self.run_count, self.total_seconds)
+
+    def __repr__(self):
+        return str(self)
+
+    class Meta:
+        unique_together = (('pump', 'date'), )
+
+    @property
+    def manual_run_count(self):
+        return self.run_count - self.scheduled_run_count
+
+    @property
+    def manual_seconds(self):
+        return self.total_seconds - self.scheduled_seconds
+
 
 class Lcd(Gpio):
     device = models.ForeignKey(Device, on_delete=models.CASCADE)
@@ -428,14 +774,17 @@ class Lcd(Gpio):
         self.set_gpio_value(self.sw1_gpio_export_num, None, direction=self.IN, edge=self.FALLING)
         self.set_gpio_value(self.sw2_gpio_export_num, None, direction=self.IN, edge=self.FALLING)
 
+    @cached_property
+    def led_gpio_group(self):
+        return GpioGroup(self.led_gpio_export_nums)
+
     def init_leds(self, value=Gpio.OFF):
-        for gpio_export_num in self.led_gpio_export_nums:
-            self.set_gpio_value(gpio_export_num, value)
+        self.set_leds(len(self.led_gpio_export_nums) if value == self.ON else 0)
 
     def set_leds(self, leds):
-        self.init_leds()
-        for gpio_export_num in self.led_gpio_export_nums[:leds]:
-            self.set_gpio_value(gpio_export_num, Gpio.ON)
+        """Switches on the first N LEDs and switches off the rest, only writing the LEDs which changed."""
+        values = [self.ON if index < leds else self.OFF for index in range(len(self.led_gpio_export_nums))]
+        self.led_gpio_group.write([self.to_relay_value(value) for value in values])
 
     def run(self):
         signal.signal(signal.SIGTERM, self.signal_handler)
@@ -549,3 +898,62 @@ class Fan(Gpio):
 
     def __repr__(self):
         return str(self)
+
+
+class Sensor(models.Model):
+    """Analog sensor read through a buffered Linux IIO device channel."""
+    SOIL_MOISTURE = 'soil_moisture'
+    LIGHT = 'light'
+    TEMPERATURE = 'temperature'
+
+    KIND_CHOICES = (
+        (SOIL_MOISTURE, 'Soil moisture'),
+        (LIGHT, 'Light'),
+        (TEMPERATURE, 'Temperature'),
+    )
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    is_active = models.BooleanField(default=True)
+    iio_device = models.CharField(max_length=50, default='iio:device0', help_text='IIO device name.')
+    channel = models.CharField(max_length=50, help_text='IIO scan element name e.g. in_voltage0.')
+    sample_rate = models.PositiveIntegerField(default=1000, help_text='Sampling frequency in Hz.')
+    decimation = models.PositiveIntegerField(default=10000, help_text='Number of samples per stored reading.')
+    scale = models.FloatField(default=1.0, help_text='Multiplier converting raw value to unit.')
+    offset = models.FloatField(default=0.0, help_text='Offset added to raw value before scaling.')
+    unit = models.CharField(max_length=10, blank=True)
+
+    def __str__(self):
+        return '<%s device=%s kind=%s channel=%s>' % (self.__class__.__name__, self.device, self.kind, self.channel)
+
+    def __repr__(self):
+        return str(self)
+
+    class Meta:
+        unique_together = ('iio_device', 'channel')
+
+    def to_unit(self, values):
+        return (values + self.offset) * self.scale
+
+
+class SensorReading(models.Model):
+    """Aggregate of a block of decimated sensor samples."""
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    count = models.PositiveIntegerField(help_text='Number of samples kept after noise rejection.')
+    mean = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    std = models.FloatField()
+
+    def __str__(self):
+        return '<%s sensor=%s end_time=%s mean=%f>' % (
+            self.__class__.__name__, self.sensor, self.end_time, self.mean)
+
+    def __repr__(self):
+        return str(self)
+
+    class Meta:
+        ordering = ('-end_time', )
+        index_together = (('sensor', 'end_time'), )
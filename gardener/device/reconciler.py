@@ -0,0 +1,65 @@
+import logging
+
+from gardener.device.gpio import GpioGroup
+from gardener.device.models import Pump
+
+logger = logging.getLogger('gardener')
+
+
+class PumpReconciler:
+    """Drives pump GPIO lines towards the desired state, i.e. the pumps running according to Redis.
+
+    The lines of all pumps form one GPIO group, so every change diffs the desired values of all pumps against the
+    cached line values and only writes the lines which differ. A reconciliation pass re-reads the lines first in order
+    to find and correct drift e.g. after missed events.
+    """
+
+    def __init__(self):
+        self.pumps = []
+        self.indexes = {}  # pump_id -> index in pumps
+        self.group = GpioGroup([])
+        self.desired = {}  # pump_id -> Pump.ON or Pump.OFF
+
+    def __str__(self):
+        return '<%s pumps=%d running=%s>' % (self.__class__.__name__, len(self.pumps), self.running)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def running(self):
+        return sorted(pump_id for pump_id, status in self.desired.items() if status == Pump.ON)
+
+    def load(self, pumps):
+        pumps = list(pumps)
+        gpio_export_nums = [pump.gpio_export_num for pump in pumps]
+        if gpio_export_nums != [line.gpio_export_num for line in self.group.lines]:
+            self.group = GpioGroup(gpio_export_nums)
+        self.pumps = pumps
+        self.indexes = {pump.id: index for index, pump in enumerate(pumps)}
+
+    def values(self):
+        return [pump.to_relay_value(self.desired.get(pump.id, Pump.OFF)) for pump in self.pumps]
+
+    def set(self, pump_id, status):
+        """Sets desired status of a pump and returns number of lines written."""
+        if pump_id not in self.indexes:
+            self.load(Pump.objects.all())
+            if pump_id not in self.indexes:
+                logger.warning(f'unknown pump_id={pump_id}')
+                return 0
+        self.desired[pump_id] = status
+        return self.group.write(self.values())
+
+    def reconcile(self, running):
+        """Replaces desired state with the specified running pump IDs and returns pumps whose lines have drifted."""
+        self.desired = {pump_id: Pump.ON for pump_id in running if pump_id in self.indexes}
+        actual = self.group.read()
+        values = self.values()
+        drift = [pump for pump, value, current in zip(self.pumps, values, actual) if value != current]
+        self.group.write(values)
+        if drift:
+            logger.warning(f'corrected drift - pump_ids={[pump.id for pump in drift]} - {self}')
+        else:
+            logger.debug(f'no drift - {self}')
+        return drift
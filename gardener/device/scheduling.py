@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+# Tolerance for comparing sums of float weights against the budget.
+EPSILON = 1e-9
+
+
+def get_load(runs, start_time, end_time):
+    """Returns max. total weight of the runs, as (start_time, end_time, weight), overlapping the specified period."""
+    times = [start_time] + [run_start for run_start, _, _ in runs if start_time < run_start < end_time]
+    return max(sum(weight for run_start, run_end, weight in runs if run_start <= t < run_end) for t in times)
+
+
+def find_slot(start_time, duration, weight, budget, runs):
+    """Returns earliest start time not before start_time at which a run fits in the budget alongside the runs.
+
+    The load only drops when a run ends, so the candidates are start_time and the end times of the runs after it. A
+    run heavier than the whole budget is scheduled to run alone.
+    """
+    weight = min(weight, budget)
+    candidates = sorted({start_time} | {run_end for _, run_end, _ in runs if run_end > start_time})
+    for candidate in candidates:
+        if get_load(runs, candidate, candidate + timedelta(seconds=duration)) + weight <= budget + EPSILON:
+            return candidate
+    return candidates[-1]  # Not reached, nothing runs after the last end time.
+
+
+def pack(requests, budget, runs=()):
+    """Places requested runs, as (key, start_time, duration, weight), in staggered slots within the budget.
+
+    Runs are placed in order of their requested start time, each in the earliest slot that fits alongside the runs
+    already scheduled and the ones placed before it. Returns dict of key to start time.
+    """
+    runs = list(runs)
+    start_times = {}
+    for key, start_time, duration, weight in sorted(requests, key=lambda request: request[1]):
+        if budget is not None:
+            start_time = find_slot(start_time, duration, weight, budget, runs)
+            weight = min(weight, budget)
+        runs.append((start_time, start_time + timedelta(seconds=duration), weight))
+        start_times[key] = start_time
+    return start_times
@@ -1,27 +1,80 @@
+import ephem
+import json
 import logging
+import numpy as np
+import os
+import pytz
+import redis
+import tempfile
+import threading
+import time as time_module
+import tornado.concurrent
+import tornado.gen
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.web
+import tornado.websocket
 import uuid
+import websocket_server
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
 from unittest import mock
 
+from django.conf import settings
 from django.core.management import call_command
 from django.test import Client
+from django.test import SimpleTestCase
+from django.test import override_settings
 from django.test import TransactionTestCase
 from django.urls import reverse
 from django.utils import timezone
 
 from gardener.data.models import Location
+from gardener.data.models import SunTimes
 from gardener.data.models import WeatherForecast
 from gardener.data.models import WeatherForecastProvider
+from gardener.data.solar import compute_sun_times
+from gardener.data.solar import get_next_sun
+from gardener.data.solar import SunTable
+from gardener.device import events
+from gardener.device import gpio
+from gardener.device import iio
+from gardener.device import thermal
+from gardener.device.hardware import get_backend
+from gardener.device.live import get_message_key
+from gardener.device.live import get_missed_messages
+from gardener.device.live import get_snapshot
+from gardener.device.live import get_snapshots
+from gardener.device.live import get_topics
+from gardener.device.live import is_topic
+from gardener.device.live import LiveState
+from gardener.device.live import parse_id
+from gardener.device.live import publish
+from gardener.device.live import SendQueue
+from gardener.device.management.commands.sensor_runner import get_readings
+from gardener.device.models import ArchivedRun
+from gardener.device.models import DailyRunRollup
 from gardener.device.models import Device
 from gardener.device.models import Fan
+from gardener.device.models import Lcd
 from gardener.device.models import Light
 from gardener.device.models import PopToPumpDuration
 from gardener.device.models import Pump
 from gardener.device.models import Run
 from gardener.device.models import ScheduledRun
-from gardener.utils import get_next_sun
+from gardener.device.models import Sensor
+from gardener.device.models import SensorReading
+from gardener.device.reconciler import PumpReconciler
+from gardener.device.scheduling import find_slot
+from gardener.device.scheduling import pack
+from gardener.device.watchdog import DeadlineWatchdog
+from gardener.exceptions import SignalException
+from gardener.tornado_wsgi import DjangoHandler
+from gardener.utils import InterruptHandlerThread
+from gardener.utils import LatencyRecorder
 
 logger = logging.getLogger('gardener')
 
@@ -81,6 +134,11 @@ class DeviceTestCase(TransactionTestCase):
 
         self.client = Client()
 
+    def tearDown(self):
+        for pattern in ('pump:*', 'scheduled-run:*', 'run-log', 'live-*'):
+            for key in settings.REDIS_CONN.scan_iter(f'{settings.REDIS_KEY_PREFIX}:{pattern}'):
+                settings.REDIS_CONN.delete(key)
+
     @mock.patch.object(
         timezone,
         'now',
@@ -139,6 +197,7 @@ class DeviceTestCase(TransactionTestCase):
         scheduled_run = ScheduledRun.objects.create(
             pump=self.pump_1, weather_forecast=weather_forecast, start_time=timezone.now(), duration=0.1)
         call_command('execute_scheduled_run', run_once=True)
+        call_command('run_logger', run_once=True)
         run = Run.objects.latest('start_time')
         self.assertEqual(run.pump, scheduled_run.pump)
         self.assertEqual(run.start_time, scheduled_run.start_time)
@@ -146,6 +205,7 @@ class DeviceTestCase(TransactionTestCase):
 
     def test_monitor_pump(self, *args):
         self.client.post(reverse('start-pump', args=(self.pump_1.id, )))
+        call_command('run_logger', run_once=True)
 
         run = Run.objects.latest('start_time')
         self.assertEqual(self.pump_1.status, Pump.ON)
@@ -153,9 +213,11 @@ class DeviceTestCase(TransactionTestCase):
         self.assertIsNone(run.end_time)
         self.assertIsNone(run.scheduled_run)
 
-        run.start_time = timezone.now() - timedelta(seconds=self.pump_1.max_duration)
-        run.save()
-        self.assertEqual(self.pump_1.status, Pump.TIMED_OUT)
+        # Pump key expired while pump_runner was down, so no expire event has been logged.
+        settings.REDIS_CONN.delete(self.pump_1.redis_key)
+        self.assertEqual(self.pump_1.status, Pump.OFF)
+        run.refresh_from_db()
+        self.assertIsNone(run.end_time)
 
         call_command('monitor_pump', run_once=True)
 
@@ -163,6 +225,189 @@ class DeviceTestCase(TransactionTestCase):
         self.assertIsNotNone(run.end_time)
         self.assertEqual(self.pump_1.status, Pump.OFF)
 
+    def test_with_status(self, *args):
+        self.client.post(reverse('start-pump', args=(self.pump_1.id, )))
+        call_command('run_logger', run_once=True)
+
+        with self.assertNumQueries(1):
+            pump_status = self.device.pump_status
+        self.assertEqual(pump_status, [(self.pump_1.id, Pump.ON), (self.pump_2.id, Pump.OFF)])
+
+        pumps = list(Pump.objects.with_status())
+        self.assertEqual([pump.logged_status for pump in pumps], [Pump.ON, Pump.OFF])
+
+        Run.objects.update(start_time=timezone.now() - timedelta(seconds=self.pump_1.max_duration + 1))
+        self.assertEqual(Pump.objects.with_status().get(id=self.pump_1.id).logged_status, Pump.TIMED_OUT)
+
+    def test_archive_runs(self, *args):
+        now = timezone.now()
+        weather_forecast = WeatherForecast.objects.create(
+            location=self.location, start_time=now, end_time=now, pop=40)
+        scheduled_run = ScheduledRun.objects.create(
+            pump=self.pump_1, weather_forecast=weather_forecast, start_time=now - timedelta(days=400), duration=60)
+        old_run = Run.objects.create(
+            pump=self.pump_1,
+            start_time=scheduled_run.start_time,
+            end_time=scheduled_run.start_time + timedelta(seconds=60),
+            scheduled_run=scheduled_run)
+        new_run = Run.objects.create(pump=self.pump_2, start_time=now - timedelta(days=1), end_time=now)
+        open_run = Run.objects.create(pump=self.pump_2, start_time=now - timedelta(days=400))
+
+        call_command('archive_runs', run_once=True, days=365)
+
+        self.assertEqual(set(Run.objects.values_list('id', flat=True)), {new_run.id, open_run.id})
+        self.assertFalse(ScheduledRun.objects.filter(id=scheduled_run.id).exists())
+        archived_run = ArchivedRun.objects.get()
+        self.assertEqual(archived_run.id, old_run.id)
+        self.assertEqual(archived_run.pump_id, self.pump_1.id)
+        self.assertEqual(archived_run.duration, 60)
+        self.assertTrue(archived_run.is_scheduled)
+        self.assertEqual(archived_run.pop, 40)
+
+    def test_pump_actions(self, *args):
+        url = reverse('pump-actions')
+        response = self.client.post(url, [
+            dict(pump_id=self.pump_1.id, action=Pump.START, duration=30),
+            dict(pump_id=self.pump_2.id, action=Pump.STOP),
+            dict(pump_id=0, action=Pump.START),
+        ], content_type='application/json')
+        results = response.json()
+        self.assertEqual(
+            [result['status'] for result in results], [Pump.STARTED, Pump.ALREADY_STOPPED, Pump.NOT_FOUND])
+        self.assertEqual(self.pump_1.status, Pump.ON)
+        state = events.get_state([self.pump_1.redis_key])[0]
+        self.assertAlmostEqual(state.deadline - state.time, 30)
+
+        response = self.client.post(url, [
+            dict(pump_id=self.pump_1.id, action=Pump.FORCE_STOP),
+            dict(pump_id=self.pump_2.id, action=Pump.FORCE_STOP),
+        ], content_type='application/json')
+        results = response.json()
+        self.assertEqual([result['status'] for result in results], [Pump.STOPPED, Pump.STOPPED])
+        self.assertEqual(results[0]['run_id'], state.run_id)
+        self.assertIsNone(results[1]['run_id'])
+        self.assertEqual(self.pump_1.status, Pump.OFF)
+
+        call_command('run_logger', run_once=True)
+        run = Run.objects.get()
+        self.assertEqual(run.id, state.run_id)
+        self.assertIsNotNone(run.end_time)
+
+        response = self.client.post(
+            url, [dict(pump_id=self.pump_1.id, action='pause')], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_pump_budget(self, *args):
+        self.device.pump_budget = 1
+        self.device.save()
+        self.pump_1.refresh_from_db()
+        self.pump_2.refresh_from_db()
+        self.assertIsNotNone(self.pump_1.start())
+        self.assertIsNone(self.pump_2.start())
+        self.assertEqual(self.pump_2.status, Pump.OFF)
+
+        results = Pump.objects.execute([(self.pump_2.id, Pump.START, None), (self.pump_1.id, Pump.STOP, None)])
+        self.assertEqual([result['status'] for result in results], [Pump.OVER_BUDGET, Pump.STOPPED])
+        results = Pump.objects.execute([(self.pump_2.id, Pump.START, None), (self.pump_1.id, Pump.START, None)])
+        self.assertEqual([result['status'] for result in results], [Pump.STARTED, Pump.OVER_BUDGET])
+
+    def test_run_rollups(self, *args):
+        weather_forecast = WeatherForecast.objects.create(
+            location=self.location, start_time=timezone.now(), end_time=timezone.now(), pop=30)
+        scheduled_run = ScheduledRun.objects.create(
+            pump=self.pump_1, weather_forecast=weather_forecast, start_time=timezone.now(), duration=60)
+        self.pump_1.start(scheduled_run=scheduled_run)
+        self.pump_1.stop()
+        self.pump_1.start()
+        self.pump_1.stop()
+        call_command('run_logger', run_once=True)
+
+        rollup = DailyRunRollup.objects.get(pump=self.pump_1)
+        self.assertEqual(rollup.run_count, 2)
+        self.assertEqual(rollup.scheduled_run_count, 1)
+        self.assertEqual(rollup.manual_run_count, 1)
+        self.assertEqual(rollup.pop, 30)
+        total_seconds = sum((run.end_time - run.start_time).total_seconds() for run in Run.objects.all())
+        self.assertAlmostEqual(rollup.total_seconds, total_seconds)
+
+        # Rebuilding from runs and archived runs gives the same rollups.
+        call_command('archive_runs', run_once=True, days=-1)
+        self.assertEqual(Run.objects.count(), 0)
+        call_command('rebuild_run_rollups')
+        rebuilt_rollup = DailyRunRollup.objects.get(pump=self.pump_1)
+        self.assertEqual(rebuilt_rollup.run_count, 2)
+        self.assertEqual(rebuilt_rollup.scheduled_run_count, 1)
+        self.assertEqual(rebuilt_rollup.pop, 30)
+        self.assertAlmostEqual(rebuilt_rollup.total_seconds, total_seconds)
+
+        response = self.client.get(reverse('run-rollups'), dict(pump_id=self.pump_1.id))
+        self.assertEqual(response.json(), [dict(
+            pump_id=self.pump_1.id,
+            date=str(rollup.date),
+            run_count=2,
+            total_seconds=rebuilt_rollup.total_seconds,
+            scheduled_run_count=1,
+            scheduled_seconds=rebuilt_rollup.scheduled_seconds,
+            manual_run_count=1,
+            manual_seconds=rebuilt_rollup.manual_seconds,
+            pop=30)])
+
+        response = self.client.get(reverse('run-rollups'), dict(start_date='2018-13-01'))
+        self.assertEqual(response.status_code, 400)
+
+        # Older than 30 days, only end_date specified.
+        DailyRunRollup.objects.filter(pump=self.pump_1).update(date=rollup.date - timedelta(days=60))
+        response = self.client.get(reverse('run-rollups'), dict(end_date=str(rollup.date - timedelta(days=45))))
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(self.client.get(reverse('run-rollups')).json(), [])
+
+    def test_pump_runner_redis_error(self):
+        # Redis still down when reconciling after a reconnect must not kill the runner with the pumps on.
+        with mock.patch(
+                'gardener.device.management.commands.pump_runner.scan_pump_keys',
+                side_effect=[redis.ConnectionError('down'), redis.ConnectionError('down'), SignalException()]), \
+                mock.patch('gardener.device.management.commands.pump_runner.handle_termination_signals'), \
+                mock.patch('gardener.device.management.commands.pump_runner.time.sleep') as sleep, \
+                mock.patch.object(Pump, 'stop_all') as stop_all:
+            call_command('pump_runner')
+        self.assertEqual(sleep.call_count, 2)
+        stop_all.assert_called_once()
+
+    def test_sun_times(self):
+        now = timezone.now()
+        next_sunrise, next_sunset = get_next_sun(self.lat, self.lon, now + timedelta(days=400))
+        self.assertEqual(
+            SunTimes.objects.filter(latitude=self.lat, longitude=self.lon).count(), settings.SUN_TIMES_DAYS)
+        self.assertGreater(next_sunrise, now + timedelta(days=400))
+
+        # Answered from the loaded table until the date is no longer covered.
+        with self.assertNumQueries(0):
+            for days in range(settings.SUN_TIMES_DAYS - 2):
+                get_next_sun(self.lat, self.lon, now + timedelta(days=400 + days))
+        with self.assertNumQueries(2):
+            get_next_sun(self.lat, self.lon, now + timedelta(days=400 + settings.SUN_TIMES_DAYS + 1))
+
+    def test_live_stream(self):
+        state = LiveState(self.device.id)
+        first_id = publish(state, state.update(cpu_temp=50, pump_status=[(self.pump_1.id, Pump.OFF)]))
+        pump_id = publish(state, state.update_pump(self.pump_1.id, Pump.ON))
+        last_id = publish(state, state.update(cpu_temp=51))
+        self.assertLess(parse_id(first_id), parse_id(pump_id))
+        snapshot = get_snapshot(self.device.id)
+        self.assertEqual(snapshot['id'], last_id)
+        self.assertEqual(snapshot['cpu_temp'], 51)
+        self.assertEqual(get_snapshots(), [snapshot])
+
+        self.assertEqual(get_missed_messages(first_id), [
+            dict(device_id=self.device.id, pump_id=self.pump_1.id, pump_status=Pump.ON, id=pump_id),
+            dict(device_id=self.device.id, cpu_temp=51, id=last_id)])
+        self.assertEqual(get_missed_messages(last_id), [])
+
+        # Too far behind or unknown, a snapshot is needed.
+        self.assertIsNone(get_missed_messages(first_id, limit=1))
+        self.assertIsNone(get_missed_messages('1-0'))
+        self.assertIsNone(get_missed_messages('invalid'))
+
     def test_start_stop(self, *args):
         response = self.client.post(reverse('start-pump', args=(self.pump_1.id, )))
         self.assertEqual(response.json()['id'], self.pump_1.id)
@@ -172,7 +417,8 @@ class DeviceTestCase(TransactionTestCase):
         self.assertTrue(Run.objects.count(), 1)
 
         self.client.post(reverse('stop-pump', args=(self.pump_1.id, )))
-        self.assertTrue(Run.objects.count(), 1)
+        call_command('run_logger', run_once=True)
+        self.assertEqual(Run.objects.count(), 1)
 
         run = Run.objects.first()
         self.assertTrue(run.start_time < run.end_time)
@@ -195,6 +441,33 @@ class DeviceTestCase(TransactionTestCase):
         response = self.client.get(reverse('weather-forecasts', args=(self.device.id, )))
         self.assertEqual(response.json(), [[1536366725, '°C', 8, 17, 40]])
 
+    def test_sensor_runner(self, *args):
+        sensor = Sensor.objects.create(
+            device=self.device, kind=Sensor.SOIL_MOISTURE, channel='in_voltage0', decimation=100, scale=0.5)
+        Sensor.objects.create(device=self.device, kind=Sensor.TEMPERATURE, channel='in_voltage1')
+        with FakeIioDevice() as fake:
+            with override_settings(
+                    HARDWARE_BACKEND='gardener.device.hardware.SimulatedBackend',
+                    SIMULATED_HARDWARE_ROOT=fake.tmp.name):
+                call_command('sensor_runner', run_once=True)
+        self.assertEqual(SensorReading.objects.filter(sensor=sensor).count(), 10)
+        reading = SensorReading.objects.filter(sensor=sensor).first()
+        self.assertAlmostEqual(reading.mean, 500, delta=2)
+        self.assertLess(reading.max, 550)
+
+    def test_sensor_runner_enable_error(self, *args):
+        Sensor.objects.create(device=self.device, kind=Sensor.SOIL_MOISTURE, channel='in_voltage0')
+        Sensor.objects.create(device=self.device, kind=Sensor.LIGHT, iio_device='iio:device1', channel='in_voltage0')
+        with FakeIioDevice() as fake:
+            with override_settings(
+                    HARDWARE_BACKEND='gardener.device.hardware.SimulatedBackend',
+                    SIMULATED_HARDWARE_ROOT=fake.tmp.name):
+                with self.assertRaises(FileNotFoundError):
+                    call_command('sensor_runner', run_once=True)
+            # iio:device1 does not exist, iio:device0 is disabled again.
+            with open(os.path.join(fake.sysfs_path, 'iio:device0', 'buffer', 'enable')) as f:
+                self.assertEqual(f.read(), '0')
+
     @mock.patch.object(Light, 'set_gpio_value')
     @mock.patch.object(Light, 'gpio_value', return_value=Light.OFF)
     @mock.patch.object(
@@ -242,3 +515,681 @@ class DeviceTestCase(TransactionTestCase):
         # now 10:28 => stop
         call_command('fan_runner', run_once=True)
         mock_set_gpio_value.assert_called_with(self.fan_2.gpio_export_num, Fan.OFF)
+
+
+class SimulatedHardwareTestCase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        settings = override_settings(
+            HARDWARE_BACKEND='gardener.device.hardware.SimulatedBackend',
+            SIMULATED_HARDWARE_ROOT=self.root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.root.cleanup)
+        self.addCleanup(gpio.close_lines)
+        self.backend = get_backend()
+        self.backend.init()
+
+
+class GpioTestCase(SimulatedHardwareTestCase):
+    def setUp(self):
+        super().setUp()
+        for gpio_export_num in range(5, 9):
+            self.backend.export_gpio(gpio_export_num)
+        self.path = os.path.join(self.backend.gpio_path, 'gpio5')
+
+    def read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read().strip()
+
+    def test_configure_once(self):
+        line = gpio.get_line(5)
+        self.assertIs(line, gpio.get_line(5))
+        with mock.patch.object(line, '_write_attr', wraps=line._write_attr) as mock_write_attr:
+            self.assertTrue(line.configure(Light.OUT))
+            self.assertTrue(line.configure(Light.OUT))
+            mock_write_attr.assert_called_once_with('direction', Light.OUT)
+        self.assertEqual(self.read('direction'), Light.OUT)
+
+    def test_read_write(self):
+        line = gpio.get_line(5)
+        self.assertTrue(line.write(1))
+        self.assertEqual(line.read(), 1)
+        self.assertTrue(line.write(0))
+        self.assertEqual(self.read('value'), '0')
+        self.assertIsNone(gpio.get_line(9).read())
+
+    def test_active_low(self):
+        light = Light(gpio_export_num=5, relay_type=Light.ACTIVE_LOW)
+        light.set_gpio_value(5, Light.ON)
+        self.assertEqual(self.read('value'), '0')
+        self.assertEqual(light.gpio_value(5), Light.ON)
+
+    def test_group_write(self):
+        group = gpio.GpioGroup((5, 6, 7, 8))
+        self.assertEqual(group.write(0b0011), 2)
+        self.assertEqual(group.values, [1, 1, 0, 0])
+        self.assertEqual(group.write([1, 1, 1, 0]), 1)
+        self.assertEqual(group.write(0b0111), 0)
+        self.assertEqual(gpio.get_line(7).read(), 1)
+
+    def test_lcd_set_leds(self):
+        lcd = Lcd(led_gpio_export_nums=[5, 6, 7, 8])
+        lcd.set_leds(3)
+        with mock.patch.object(gpio.GpioLine, 'write', return_value=True) as mock_write:
+            lcd.set_leds(1)
+            self.assertEqual(mock_write.call_count, 2)
+        self.assertEqual(lcd.led_gpio_group.values, [1, 0, 0, 0])
+
+
+class PumpReconcilerTestCase(SimulatedHardwareTestCase):
+    def test_reconcile(self):
+        reconciler = PumpReconciler()
+        reconciler.load([
+            Pump(id=1, gpio_export_num=5),
+            Pump(id=2, gpio_export_num=6, relay_type=Pump.ACTIVE_LOW),
+            Pump(id=3, gpio_export_num=7)])
+
+        # Cold start converges in a single pass, lines are exported and configured as needed.
+        self.assertEqual(len(reconciler.reconcile({1: (10, 60000)})), 2)
+        self.assertEqual([gpio.get_line(num).read() for num in (5, 6, 7)], [1, 1, 0])
+        self.assertEqual(reconciler.reconcile({1: (10, 60000)}), [])
+
+        # Events only write the line which changed.
+        with mock.patch.object(gpio.GpioLine, 'write', autospec=True, side_effect=gpio.GpioLine.write) as mock_write:
+            self.assertEqual(reconciler.set(2, Pump.ON), 1)
+            mock_write.assert_called_once_with(gpio.get_line(6), 0)
+
+        # Line switched on behind the runner's back is switched off by the next pass.
+        gpio.get_line(7).write(1)
+        drift = reconciler.reconcile({1: (10, 60000), 2: (11, 60000)})
+        self.assertEqual([pump.id for pump in drift], [3])
+        self.assertEqual(gpio.get_line(7).read(), 0)
+        self.assertEqual(reconciler.running, [1, 2])
+
+
+class InterruptHandlerThreadTestCase(SimulatedHardwareTestCase):
+    def test_dispatch_coalesces(self):
+        released = threading.Event()
+        calls = []
+
+        def callback():
+            calls.append(1)
+            released.wait(timeout=5)
+
+        thread = InterruptHandlerThread(((5, callback), ), debounce=0.05)
+        self.assertTrue(thread.dispatch(callback))
+        self.assertFalse(thread.dispatch(callback))  # Still running, coalesced.
+        released.set()
+        thread.executor.shutdown(wait=True)
+        self.assertEqual(calls, [1])
+        self.assertEqual(thread.pending, set())
+
+    @override_settings(GPIO_DEBOUNCE_MS=500)
+    def test_debounce(self):
+        calls = []
+        called = threading.Event()
+
+        def callback():
+            calls.append(time_module.monotonic())
+            called.set()
+
+        gpio.get_line(5).configure(Lcd.IN, edge=Lcd.FALLING)
+        thread = InterruptHandlerThread(((5, callback), ))
+        self.assertEqual(thread.debounce, 0.5)
+        thread.warmup_time = 0
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(thread.terminating.set)
+
+        # Bouncing switch, every edge is handled on its own after the callback of the previous one has returned.
+        start_time = time_module.monotonic()
+        for _ in range(5):
+            self.backend.set_gpio_input(5, 1)
+            self.assertTrue(self.backend.set_gpio_input(5, 0))
+            time_module.sleep(0.02)
+        self.assertTrue(called.wait(timeout=5))
+        time_module.sleep(max(0, 0.5 - (time_module.monotonic() - start_time)))
+        self.assertEqual(len(calls), 1)
+
+        # Next press after the debounce window.
+        called.clear()
+        self.backend.set_gpio_input(5, 1)
+        self.assertTrue(self.backend.set_gpio_input(5, 0))
+        self.assertTrue(called.wait(timeout=5))
+        self.assertEqual(len(calls), 2)
+
+    def test_simulated_edge(self):
+        pressed = threading.Event()
+        gpio.get_line(5).configure(Lcd.IN, edge=Lcd.FALLING)
+        thread = InterruptHandlerThread(((5, pressed.set), ), debounce=0.05)
+        thread.warmup_time = 0
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(thread.terminating.set)
+        self.assertFalse(self.backend.set_gpio_input(5, 1))  # Rising edge is not configured.
+        self.assertFalse(pressed.wait(timeout=0.2))
+        self.assertTrue(self.backend.set_gpio_input(5, 0))
+        self.assertTrue(pressed.wait(timeout=5))
+
+
+@mock.patch('gardener.device.thermal.cache')
+class ThermalGovernorTestCase(SimpleTestCase):
+    def test_hysteresis(self, mock_cache):
+        mock_cache.get.return_value = None
+        governor = thermal.ThermalGovernor()
+        levels = []
+        for temp in (60, 72, 68, 64, 81, 77, 74, 60):
+            with mock.patch.object(thermal, 'read_thermal_zones', return_value=dict(thermal_zone0=temp)):
+                levels.append(governor.sample()['level'])
+        self.assertEqual(levels, [
+            thermal.NORMAL, thermal.THROTTLED, thermal.THROTTLED, thermal.NORMAL,
+            thermal.CRITICAL, thermal.CRITICAL, thermal.THROTTLED, thermal.NORMAL])
+        state = mock_cache.set.call_args[0][1]
+        self.assertEqual(state['deferred'], [])
+
+    def test_should_defer(self, mock_cache):
+        mock_cache.get.return_value = dict(level=thermal.THROTTLED, temp=72, zone='thermal_zone0', deferred=[])
+        self.assertTrue(thermal.should_defer(thermal.VIDEO_ENCODING))
+        self.assertFalse(thermal.should_defer(thermal.CAMERA_CAPTURE))
+
+    @mock.patch.dict(thermal._defer_reports, clear=True)
+    def test_should_defer_reports(self, mock_cache):
+        mock_cache.get.return_value = dict(level=thermal.THROTTLED, temp=72, zone='thermal_zone0', deferred=[])
+        with mock.patch.object(thermal.time, 'monotonic') as monotonic, self.assertLogs('gardener') as logs:
+            for now in (1000, 1001, 1002):
+                monotonic.return_value = now
+                thermal.should_defer(thermal.VIDEO_ENCODING)
+                thermal.should_defer(thermal.WEATHER_FORECAST)
+            monotonic.return_value = 1000 + thermal.DEFER_REPORT_INTERVAL
+            thermal.should_defer(thermal.VIDEO_ENCODING)
+        reports = [record.getMessage() for record in logs.records if record.levelno == logging.INFO]
+        self.assertEqual(len(reports), 3)  # Once per work type, then once per interval.
+        self.assertIn('work=video_encoding', reports[0])
+        self.assertIn('work=weather_forecast', reports[1])
+        self.assertTrue(reports[2].endswith('count=3'))
+
+
+class PumpEventTestCase(SimpleTestCase):
+    def test_status_from_state(self):
+        pump = Pump(id=1)
+        self.assertEqual(pump.status_from_state(None), Pump.OFF)
+        event = events.make_event(events.START, 1, Pump.ON, 42, deadline=time_module.time() + 60)
+        self.assertEqual(pump.status_from_state(event), Pump.ON)
+        self.assertEqual(pump.status_from_state(event._replace(deadline=time_module.time() - 1)), Pump.TIMED_OUT)
+
+    def test_parse_message(self):
+        event = events.make_event(events.START, 1, Pump.ON, 42, 1566000000.5)
+        data = events.encode(event).encode()
+        self.assertEqual(events.parse_message(dict(type='message', channel=b'gardener:pump-events', data=data)), event)
+        self.assertIsNone(events.parse_message(dict(type='subscribe', channel=b'gardener:pump-events', data=1)))
+        self.assertIsNone(events.parse_message(dict(type='message', channel=b'gardener:pump-events', data=b'set')))
+
+
+class DeadlineWatchdogTestCase(SimpleTestCase):
+    def test_due(self):
+        watchdog = DeadlineWatchdog(grace=0)
+        self.assertIsNone(watchdog.timeout(now=100))
+        watchdog.watch(1, 10, 130)
+        watchdog.watch(2, 11, 110)
+        watchdog.watch(3, 12, 120)
+        watchdog.watch(3, 12, 120)  # Already watched e.g. by the safety sweep.
+        self.assertEqual(watchdog.timeout(now=100), 10)
+
+        watchdog.unwatch(2)  # Stopped.
+        watchdog.watch(1, 13, 140)  # Restarted.
+        self.assertEqual(watchdog.timeout(now=100), 20)
+        self.assertEqual(watchdog.due(now=135), [(120, 3, 12)])
+        self.assertEqual(watchdog.due(now=140), [(140, 1, 13)])
+        self.assertEqual(len(watchdog), 0)
+        self.assertIsNone(watchdog.timeout(now=140))
+
+
+class LiveStateTestCase(SimpleTestCase):
+    def test_update(self):
+        state = LiveState()
+        self.assertIsNone(state.snapshot())
+        message = state.update(device_id=1, public_ip='127.0.0.1', cpu_temp=50, pump_status=[(2, 0), (1, 0)])
+        self.assertEqual(message, dict(device_id=1, public_ip='127.0.0.1', cpu_temp=50, pump_status=[(1, 0), (2, 0)]))
+        self.assertEqual(state.snapshot(), message)
+
+        self.assertEqual(state.update(cpu_temp=50), {})
+        self.assertEqual(state.update(cpu_temp=51, public_ip='127.0.0.1'), dict(cpu_temp=51))
+        self.assertEqual(state.update_pump(1, Pump.ON), dict(pump_id=1, pump_status=Pump.ON))
+        self.assertIsNone(state.update_pump(1, Pump.ON))
+        self.assertEqual(state.update(pump_status=[(1, Pump.ON), (2, 0)]), {})
+        self.assertEqual(state.update(pump_status=[(1, 0), (2, 0)]), dict(pump_status=[(1, 0), (2, 0)]))
+        self.assertEqual(state.snapshot()['cpu_temp'], 51)
+
+    def test_apply(self):
+        published = LiveState()
+        state = LiveState()
+        for message in (
+                published.update(device_id=1, cpu_temp=50, pump_status=[(1, 0), (2, 0)]),
+                published.update_pump(2, Pump.ON),
+                published.update(cpu_temp=51)):
+            state.apply(message)
+        self.assertEqual(state.snapshot(), published.snapshot())
+
+        state.load(published.snapshot())
+        self.assertEqual(state.snapshot(), published.snapshot())
+        state.load(None)
+        self.assertIsNone(state.snapshot())
+
+    def test_stream_id(self):
+        state = LiveState()
+        state.apply(dict(device_id=1, cpu_temp=50, pump_status=[(1, 0)], id='1500000000000-0'))
+        state.apply(dict(pump_id=1, pump_status=Pump.ON, id='1500000000000-1'))
+        self.assertEqual(
+            state.snapshot(), dict(device_id=1, cpu_temp=50, pump_status=[(1, Pump.ON)], id='1500000000000-1'))
+        self.assertLess(parse_id('1500000000000-1'), parse_id('1500000000001-0'))
+        self.assertLess(parse_id('1500000000000-9'), parse_id('1500000000000-10'))
+        self.assertIsNone(parse_id('invalid'))
+        self.assertIsNone(parse_id(None))
+
+    def test_topics(self):
+        state = LiveState(1)
+        message = state.update(cpu_temp=50, pump_status=[(2, 0), (3, 0)])
+        self.assertEqual(message['device_id'], 1)
+        self.assertEqual(
+            get_topics(message), ['telemetry:cpu_temp', 'telemetry:pump_status', 'device:1', 'pump:2', 'pump:3'])
+        self.assertEqual(get_topics(state.update_pump(3, Pump.ON)), ['telemetry:pump_status', 'device:1', 'pump:3'])
+        self.assertEqual(get_topics(state.update(cpu_temp=51)), ['telemetry:cpu_temp', 'device:1'])
+        self.assertEqual(get_topics(state.snapshot())[-3:], ['device:1', 'pump:2', 'pump:3'])
+
+        self.assertTrue(is_topic('device:1'))
+        self.assertTrue(is_topic('pump:12'))
+        self.assertTrue(is_topic('telemetry:cpu_temp'))
+        for topic in ('device:', 'device:x', 'pump:-1', 'telemetry:load', 'sensor:1', 1, None):
+            self.assertFalse(is_topic(topic))
+
+    def test_send_queue(self):
+        queue = SendQueue()
+        for message in (
+                dict(pump_id=1, pump_status=Pump.ON),
+                dict(cpu_temp=50),
+                dict(pump_id=2, pump_status=Pump.ON),
+                dict(pump_id=1, pump_status=Pump.OFF),
+                dict(cpu_temp=51)):
+            queue.put(get_message_key(message), message)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.pop_all(), [
+            dict(pump_id=2, pump_status=Pump.ON), dict(pump_id=1, pump_status=Pump.OFF), dict(cpu_temp=51)])
+        self.assertEqual(len(queue), 0)
+
+
+class TornadoTestCase(SimpleTestCase):
+    """Serves the app class attribute of the test case on a local port from an IOLoop of its own, see run_async()."""
+
+    def setUp(self):
+        self.io_loop = tornado.ioloop.IOLoop()
+        self.io_loop.make_current()
+        sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+        self.port = sockets[0].getsockname()[1]
+        self.server = tornado.httpserver.HTTPServer(self.app)
+        self.server.add_sockets(sockets)
+
+    def tearDown(self):
+        self.server.stop()
+        self.io_loop.clear_current()
+        self.io_loop.close(all_fds=True)
+
+    def run_async(self, coroutine):
+        return self.io_loop.run_sync(coroutine, timeout=5)
+
+
+class WebsocketServerTestCase(TornadoTestCase):
+    app = websocket_server.Application()
+
+    def setUp(self):
+        super().setUp()
+        websocket_server.states.clear()
+        websocket_server.MainHandler.clients.clear()
+        websocket_server.MainHandler.routes.clear()
+
+    def test_relay_resync(self):
+        # A message published between subscribing and resyncing is both replayed and still on the channel.
+        message = dict(device_id=1, cpu_temp=51, id='5-1')
+        relay = websocket_server.LiveRelay('live')
+        relay.last_id = '5-0'
+        relay.pubsub = mock.Mock()
+        relay.pubsub.get_message.side_effect = [
+            dict(type='message', data=websocket_server.json_encode(message).encode()),
+            dict(type='message', data=websocket_server.json_encode(dict(message, cpu_temp=52, id='5-2')).encode()),
+            None]
+        with mock.patch.object(websocket_server, 'get_missed_messages', return_value=[message]), \
+                mock.patch.object(websocket_server.MainHandler, 'send_frame') as send_frame, \
+                mock.patch.object(relay, 'watch', return_value=False):
+            relay.resync()
+            relay.on_readable(None, None)
+        self.assertEqual(relay.last_id, '5-2')
+        # 5-1 is relayed once, from the replay.
+        self.assertEqual([args[2] for args, _ in send_frame.call_args_list], [(5, 1), (5, 2)])
+        self.assertEqual(websocket_server.states[1].values['cpu_temp'], 52)
+
+    def connect(self, query, compression_options=None):
+        return tornado.websocket.websocket_connect(
+            f'ws://127.0.0.1:{self.port}/ws/?{query}', compression_options=compression_options)
+
+    async def read(self, connection):
+        return json.loads(await connection.read_message())
+
+    def test_routing(self):
+        send_message = websocket_server.MainHandler.send_message
+
+        async def test():
+            device_1 = await self.connect('topics=device:1')
+            device_2 = await self.connect('topics=device:2,pump:5')
+            send_message(dict(device_id=1, cpu_temp=50, id='1-1'))
+            send_message(dict(device_id=2, pump_id=5, pump_status=Pump.ON, id='1-2'))
+            self.assertEqual((await self.read(device_1))['id'], '1-1')
+            self.assertEqual((await self.read(device_2))['id'], '1-2')  # Not the device:1 frame.
+
+            device_1.write_message(json.dumps(dict(unsubscribe=['device:1'], subscribe=['device:3'])))
+            await tornado.gen.sleep(0.05)
+            self.assertNotIn('device:1', websocket_server.MainHandler.routes)
+            send_message(dict(device_id=1, cpu_temp=51, id='1-3'))
+            send_message(dict(device_id=3, cpu_temp=40, id='1-4'))
+            self.assertEqual((await self.read(device_1))['id'], '1-4')
+
+            device_1.close()
+            device_2.close()
+            await tornado.gen.sleep(0.05)
+
+        self.run_async(test)
+        self.assertEqual(websocket_server.MainHandler.clients, set())
+        self.assertEqual(dict(websocket_server.MainHandler.routes), {})
+
+    def test_frame(self):
+        headers = {
+            125: b'\x81\x7d',
+            126: b'\x81\x7e\x00\x7e',
+            70000: b'\x81\x7f' + (70000).to_bytes(8, 'big'),
+        }
+        for length, header in headers.items():
+            frame = websocket_server.Frame(b'x' * length)
+            self.assertEqual(frame.wire, header + frame.data)
+            self.assertIs(frame.wire, frame.wire)  # Built once.
+
+    def test_compression(self):
+        message = dict(device_id=1, cpu_temp=50, public_ip='127.0.0.1', id='1-1')
+
+        async def test():
+            plain = await self.connect('topics=device:1')
+            compressed = await self.connect('topics=device:1', compression_options={})
+            websocket_server.MainHandler.send_message(message)
+            self.assertEqual(await self.read(plain), message)
+            self.assertEqual(await self.read(compressed), message)
+            plain.close()
+            compressed.close()
+
+        self.run_async(test)
+
+    def test_max_topics(self):
+        async def test():
+            connection = await self.connect('topics=' + ','.join(f'pump:{i}' for i in range(100)))
+            client, = websocket_server.MainHandler.clients
+            self.assertEqual(len(client.topics), websocket_server.MAX_TOPICS)
+            connection.write_message(json.dumps(dict(subscribe=['device:1'])))
+            await tornado.gen.sleep(0.05)
+            self.assertNotIn('device:1', client.topics)
+            connection.close()
+
+        self.run_async(test)
+
+    def test_resume(self):
+        replayed = [dict(device_id=1, cpu_temp=50, id='5-1'), dict(device_id=2, cpu_temp=60, id='5-2')]
+
+        async def test():
+            with mock.patch.object(websocket_server, 'get_missed_messages', return_value=replayed) as get_missed:
+                connection = await self.connect('topics=device:1&last_id=5-0')
+            get_missed.assert_called_once_with('5-0')
+            self.assertEqual((await self.read(connection))['id'], '5-1')  # Only the subscribed device.
+
+            # Relay catching up with the replayed messages.
+            for message in replayed + [dict(device_id=1, cpu_temp=51, id='5-3')]:
+                websocket_server.MainHandler.send_message(message)
+            self.assertEqual((await self.read(connection))['id'], '5-3')
+            connection.close()
+
+        self.run_async(test)
+
+    def test_slow_client(self):
+        async def test():
+            connection = await self.connect('topics=device:1')
+            client, = websocket_server.MainHandler.clients
+            client.writing = True  # Previous frame not flushed yet.
+            with override_settings(WEBSOCKET_SEND_QUEUE_SIZE=2):
+                for pump_id in range(3):
+                    websocket_server.MainHandler.send_message(
+                        dict(device_id=1, pump_id=pump_id, pump_status=Pump.ON, id=f'1-{pump_id}'))
+            self.assertEqual(websocket_server.MainHandler.clients, set())
+            self.assertEqual(dict(websocket_server.MainHandler.routes), {})
+            self.assertIsNone(await connection.read_message())
+            self.assertEqual(connection.close_code, 1013)
+
+            # Failed write, removed before the connection is closed.
+            connection = await self.connect('topics=device:2')
+            client, = websocket_server.MainHandler.clients
+            future = tornado.concurrent.Future()
+            future.set_exception(tornado.websocket.WebSocketClosedError())
+            client.on_written(future)
+            self.assertEqual(websocket_server.MainHandler.clients, set())
+            self.assertEqual(dict(websocket_server.MainHandler.routes), {})
+            self.assertEqual(client.topics, set())
+            connection.close()
+
+        self.run_async(test)
+
+
+def echo_application(environ, start_response):
+    """WSGI application echoing the request body, with repeated headers and without Content-Type."""
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('418 Short And Stout', [('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2')])
+    return [b'echo:', body]
+
+
+class DjangoHandlerTestCase(TornadoTestCase):
+    app = tornado.web.Application([(r'.*', DjangoHandler)])
+
+    def fetch(self, path, **kwargs):
+        return self.run_async(lambda: tornado.httpclient.AsyncHTTPClient().fetch(
+            f'http://127.0.0.1:{self.port}{path}', raise_error=False, **kwargs))
+
+    def test_response(self):
+        with mock.patch('gardener.tornado_wsgi.application', echo_application):
+            response = self.fetch('/', method='POST', body='x=1')
+            self.assertEqual(response.code, 418)
+            self.assertEqual(response.reason, 'Short And Stout')
+            self.assertEqual(response.headers.get_list('Set-Cookie'), ['a=1', 'b=2'])
+            self.assertNotIn('Content-Type', response.headers)
+            self.assertEqual(response.body, b'echo:x=1')
+
+            response = self.fetch('/', method='HEAD')
+            self.assertEqual(response.code, 418)
+            self.assertEqual(response.body, b'')
+
+    def test_csrf(self):
+        response = self.fetch(reverse('admin:login'), method='POST', body='username=admin&password=admin')
+        self.assertEqual(response.code, 403)
+        self.assertIn(b'CSRF', response.body)
+
+
+class SolarTestCase(SimpleTestCase):
+    def solve_next_sun(self, lat, lon, date):
+        loc = ephem.Observer()
+        loc.date = date
+        loc.lat = str(lat)
+        loc.lon = str(lon)
+        loc.horizon = '-0:34'
+        loc.pressure = 0
+        return tuple(
+            timezone.make_aware(find(ephem.Sun(), use_center=False).datetime(), pytz.UTC)
+            for find in (loc.next_rising, loc.next_setting))
+
+    def assert_next_sun(self, lat, lon, start_time, days):
+        table = SunTable(start_time.date(), compute_sun_times(
+            lat, lon, [start_time.date() + timedelta(days=i) for i in range(days)]))
+        for hours in range(0, days * 24 - 24):
+            date = start_time + timedelta(hours=hours)
+            # Same as solving from date, apart from rounding to the second.
+            for sun_time, expected in zip(table.get_next_sun(date), self.solve_next_sun(lat, lon, date)):
+                self.assertGreater(sun_time, date)
+                self.assertLessEqual(abs((sun_time - expected).total_seconds()), 1, date)
+        return table
+
+    def test_sun_table(self):
+        start_time = datetime(2019, 6, 1, tzinfo=timezone.utc)
+        table = self.assert_next_sun(-33.8468332, 151.0635537, start_time, 5)
+        self.assertEqual(len(table.sunrises), 5)
+        self.assertIsNone(table.get_next_sun(start_time - timedelta(seconds=1)))
+        self.assertIsNone(table.get_next_sun(start_time + timedelta(days=5)))
+
+        # Polar day.
+        self.assertEqual(compute_sun_times(89, 0, [start_time.date()]), [(start_time.date(), [], [])])
+
+    def test_midnight_utc(self):
+        # Sunrise moves earlier across midnight UTC, 2019-03-21 has two.
+        start_time = datetime(2019, 3, 18, tzinfo=timezone.utc)
+        sun_times = compute_sun_times(60, 90, [start_time.date() + timedelta(days=i) for i in (2, 3, 4)])
+        self.assertEqual([len(sunrises) for _, sunrises, _ in sun_times], [1, 2, 1])
+        self.assert_next_sun(60, 90, start_time, 7)
+
+        # Sunset moves later across midnight UTC, 2019-03-15 has none.
+        start_time = datetime(2019, 3, 12, tzinfo=timezone.utc)
+        sun_times = compute_sun_times(60, -90, [start_time.date() + timedelta(days=i) for i in (2, 3, 4)])
+        self.assertEqual([len(sunsets) for _, _, sunsets in sun_times], [1, 0, 1])
+        self.assert_next_sun(60, -90, start_time, 7)
+
+
+class SchedulingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.t0 = datetime(2019, 1, 1, 6, 0, tzinfo=timezone.utc)
+
+    def at(self, seconds):
+        return self.t0 + timedelta(seconds=seconds)
+
+    def test_find_slot(self):
+        runs = [(self.at(0), self.at(60), 1), (self.at(30), self.at(90), 1)]
+        self.assertEqual(find_slot(self.at(0), 60, 1, 3, runs), self.at(0))
+        self.assertEqual(find_slot(self.at(0), 60, 1, 2, runs), self.at(60))
+        self.assertEqual(find_slot(self.at(0), 60, 2, 2, runs), self.at(90))
+        self.assertEqual(find_slot(self.at(0), 60, 5, 2, runs), self.at(90))  # Heavier than the budget, runs alone.
+        self.assertEqual(find_slot(self.at(100), 60, 2, 2, runs), self.at(100))
+
+    def test_pack(self):
+        requests = [
+            ('a', self.at(0), 60, 1), ('b', self.at(0), 30, 1), ('c', self.at(0), 30, 1), ('d', self.at(10), 60, 2)]
+        self.assertEqual(pack(requests, None), {key: start_time for key, start_time, _, _ in requests})
+        self.assertEqual(pack(requests, 2), dict(a=self.at(0), b=self.at(0), c=self.at(30), d=self.at(60)))
+        self.assertEqual(pack(requests, 2, [(self.at(-30), self.at(30), 1)]), dict(
+            a=self.at(0), b=self.at(30), c=self.at(60), d=self.at(90)))
+
+
+@mock.patch('gardener.utils.cache')
+class LatencyRecorderTestCase(SimpleTestCase):
+    def test_report(self, mock_cache):
+        latency = LatencyRecorder('test', size=100)
+        self.assertIsNone(latency.report())
+        for ms in range(1, 201):
+            latency.add(ms)
+        summary = latency.report()
+        self.assertEqual(summary['count'], 200)
+        self.assertEqual(summary['window'], 100)
+        self.assertEqual(summary['p50'], 151)
+        self.assertEqual(summary['max'], 200)
+        mock_cache.set.assert_called_once_with('latency:test', summary, timeout=None)
+        self.assertIsNone(latency.report())  # Nothing new.
+
+
+class FakeIioDevice:
+    """File backed IIO device replaying a recorded buffer of two 12-bit channels with pump noise spikes."""
+
+    def __init__(self, scans=1000):
+        rng = np.random.RandomState(0)
+        self.voltage0 = (1000 + rng.normal(0, 4, scans)).astype(np.int16)
+        self.voltage0[::50] = 2000  # Spikes.
+        self.voltage1 = np.full(scans, -100, dtype=np.int16)
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sysfs_path = os.path.join(self.tmp.name, 'sys', 'bus', 'iio', 'devices')
+        self.dev_path = os.path.join(self.tmp.name, 'dev')
+        path = os.path.join(self.sysfs_path, 'iio:device0')
+        os.makedirs(os.path.join(path, 'scan_elements'))
+        os.makedirs(os.path.join(path, 'buffer'))
+        os.makedirs(self.dev_path)
+        files = {
+            'buffer/enable': '0',
+            'buffer/length': '128',
+            'sampling_frequency': '1000',
+            'scan_elements/in_voltage0_en': '0',
+            'scan_elements/in_voltage0_index': '0',
+            'scan_elements/in_voltage0_type': 'le:s12/16>>4',
+            'scan_elements/in_voltage1_en': '0',
+            'scan_elements/in_voltage1_index': '1',
+            'scan_elements/in_voltage1_type': 'le:s12/16>>4',
+            'scan_elements/in_timestamp_en': '1',
+            'scan_elements/in_timestamp_index': '2',
+            'scan_elements/in_timestamp_type': 'le:s64/64>>0',
+        }
+        for name, value in files.items():
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(f'{value}\n')
+        scans = np.empty(len(self.voltage0), dtype='<i2, <i2')
+        scans['f0'] = self.voltage0 << 4
+        scans['f1'] = self.voltage1 << 4
+        with open(os.path.join(self.dev_path, 'iio:device0'), 'wb') as f:
+            f.write(scans.tobytes())
+        return self
+
+    def __exit__(self, *args):
+        self.tmp.cleanup()
+
+
+class IioTestCase(SimpleTestCase):
+    def test_scan_dtype(self):
+        channels = [
+            iio.IioChannel.from_type('in_voltage0', 0, 'le:u12/16>>0'),
+            iio.IioChannel.from_type('in_temp', 1, 'be:s24/32>>8'),
+            iio.IioChannel.from_type('timestamp', 2, 'le:s64/64>>0'),
+        ]
+        dtype = iio.scan_dtype(channels)
+        self.assertEqual(dtype.itemsize, 16)
+        self.assertEqual(dtype.fields['in_temp'][1], 4)
+        self.assertEqual(dtype.fields['timestamp'][1], 8)
+
+    def test_read_recorded_buffer(self):
+        with FakeIioDevice() as fake:
+            device = iio.IioDevice('iio:device0', sysfs_path=fake.sysfs_path, dev_path=fake.dev_path)
+            device.enable(['in_voltage0', 'in_voltage1'], buffer_length=256, sample_rate=2000)
+            self.assertEqual(device.sample_rate, 2000)
+            # Scan elements which have not been requested are disabled.
+            with open(os.path.join(device.path, 'scan_elements', 'in_timestamp_en')) as f:
+                self.assertEqual(f.read(), '0')
+            data = device.read(max_scans=600)
+            self.assertEqual(len(data['in_voltage0']), 600)
+            data = device.read()
+            self.assertEqual(len(data['in_voltage0']), 400)
+            self.assertIsNone(device.read())
+            device.disable()
+        np.testing.assert_array_equal(data['in_voltage1'], -100)
+        np.testing.assert_array_equal(data['in_voltage0'], fake.voltage0[600:])
+
+    def test_get_readings(self):
+        # Sampled at the rate of the device it shares with a faster sensor.
+        sensor = Sensor(kind=Sensor.SOIL_MOISTURE, channel='in_voltage0', sample_rate=500, decimation=100)
+        with FakeIioDevice() as fake:
+            readings = get_readings(sensor, fake.voltage0, 1000)
+        self.assertEqual(len(readings), 10)
+        for reading in readings:
+            self.assertEqual(reading.end_time - reading.start_time, timedelta(seconds=0.1))
+        self.assertEqual(readings[0].end_time, readings[1].start_time)
+
+    def test_decimate(self):
+        with FakeIioDevice() as fake:
+            aggregates = iio.decimate(fake.voltage0, 100)
+        self.assertEqual(len(aggregates['mean']), 10)
+        self.assertTrue((aggregates['count'] <= 98).all())  # Spikes rejected.
+        self.assertTrue((aggregates['max'] < 1100).all())
+        self.assertTrue((np.abs(aggregates['mean'] - 1000) < 2).all())
@@ -0,0 +1,136 @@
+import glob
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from gardener.device.hardware import get_backend
+
+logger = logging.getLogger('gardener')
+
+# Thermal levels.
+NORMAL = 0
+THROTTLED = 1
+CRITICAL = 2
+
+LEVEL_NAMES = {
+    NORMAL: 'normal',
+    THROTTLED: 'throttled',
+    CRITICAL: 'critical',
+}
+
+# Non-critical work which can be deferred. Pump, light and fan actuation is never deferred.
+CAMERA_CAPTURE = 'camera_capture'
+VIDEO_ENCODING = 'video_encoding'
+WEATHER_FORECAST = 'weather_forecast'
+WEBSOCKET_BROADCAST = 'websocket_broadcast'
+
+# Minimum thermal level at which the work is deferred.
+DEFERRED_WORK = {
+    CAMERA_CAPTURE: CRITICAL,
+    VIDEO_ENCODING: THROTTLED,
+    WEATHER_FORECAST: THROTTLED,
+    WEBSOCKET_BROADCAST: THROTTLED,
+}
+
+CACHE_KEY = 'thermal_state'
+
+# Interval in seconds between INFO reports of the deferred work of each type, the deferrals in between are logged at
+# DEBUG and counted in the next report.
+DEFER_REPORT_INTERVAL = 300
+
+# Per process, work -> (monotonic time of the last INFO report, deferrals since).
+_defer_reports = {}
+
+
+def read_thermal_zones():
+    """Returns a dict of thermal zone name to its temperature in °C."""
+    temps = {}
+    for path in sorted(glob.glob(os.path.join(get_backend().thermal_path, 'thermal_zone*', 'temp'))):
+        zone = os.path.basename(os.path.dirname(path))
+        try:
+            with open(path) as f:
+                temps[zone] = int(f.read().strip()) / 1000
+        except (OSError, ValueError) as e:
+            logger.warning(f'path={path} - e={e}')
+    return temps
+
+
+def get_thermal_state():
+    state = cache.get(CACHE_KEY)
+    if state is None:
+        state = dict(level=NORMAL, temp=None, zone=None, time=None, deferred=[])
+    return state
+
+
+def get_thermal_level():
+    return get_thermal_state()['level']
+
+
+def should_defer(work):
+    """Returns True if the non-critical work should be deferred at the current thermal level."""
+    state = get_thermal_state()
+    if state['level'] < DEFERRED_WORK[work]:
+        return False
+    now = time.monotonic()
+    report_time, count = _defer_reports.get(work, (None, 0))
+    count += 1
+    message = f'deferring work={work} - level={LEVEL_NAMES[state["level"]]} - temp={state["temp"]}'
+    if report_time is None or now - report_time >= DEFER_REPORT_INTERVAL:
+        logger.info(f'{message} - count={count}')
+        _defer_reports[work] = (now, 0)
+    else:
+        logger.debug(message)
+        _defer_reports[work] = (report_time, count)
+    return True
+
+
+def broadcast_interval(seconds):
+    """Returns websocket broadcast interval stretched according to the current thermal level."""
+    if should_defer(WEBSOCKET_BROADCAST):
+        return seconds * settings.THERMAL_BROADCAST_INTERVAL_FACTOR
+    return seconds
+
+
+class ThermalGovernor:
+    """Samples all thermal zones and sets the thermal level shared with the runners through the cache.
+
+    The level is raised as soon as the hottest zone reaches a threshold and only lowered once it has cooled down
+    below the threshold minus hysteresis, so that deferred work does not flap around a threshold.
+    """
+
+    def __init__(self):
+        self.level = get_thermal_level()
+
+    def next_level(self, temp):
+        thresholds = (
+            (CRITICAL, settings.THERMAL_CRITICAL_TEMP),
+            (THROTTLED, settings.THERMAL_THROTTLE_TEMP),
+        )
+        for level, threshold in thresholds:
+            if temp >= threshold or (self.level >= level and temp > threshold - settings.THERMAL_HYSTERESIS):
+                return level
+        return NORMAL
+
+    def sample(self, timeout=60):
+        """Samples thermal zones and publishes state which expires after timeout seconds if not sampled again."""
+        temps = read_thermal_zones()
+        if not temps:
+            return None
+        zone, temp = max(temps.items(), key=lambda item: item[1])
+        level = self.next_level(temp)
+        if level != self.level:
+            logger.info(
+                f'thermal level changed from {LEVEL_NAMES[self.level]} to {LEVEL_NAMES[level]} - '
+                f'zone={zone} - temp={temp} - temps={temps}')
+        self.level = level
+        state = dict(
+            level=level,
+            temp=temp,
+            zone=zone,
+            time=int(time.time()),
+            deferred=sorted(work for work, min_level in DEFERRED_WORK.items() if level >= min_level))
+        cache.set(CACHE_KEY, state, timeout=timeout)
+        return state
@@ -4,6 +4,8 @@ from . import views
 
 urlpatterns = [
     path('weather-forecasts/<device_id>/', views.weather_forecasts, name='weather-forecasts'),
+    path('pump-actions/', views.pump_actions, name='pump-actions'),
+    path('run-rollups/', views.run_rollups, name='run-rollups'),
     path('start-pump/<pump_id>/', views.start_pump, name='start-pump'),
     path('stop-pump/<pump_id>/', views.stop_pump, name='stop-pump'),
 ]
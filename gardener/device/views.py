@@ -1,9 +1,14 @@
 import logging
+from datetime import timedelta
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 
 from django.http.response import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
+from gardener.device.models import DailyRunRollup
 from gardener.device.models import Device
 from gardener.device.models import Pump
 from gardener.utils import datetime_to_unixtimestamp
@@ -37,6 +42,33 @@ def stop_pump(request, pump_id):
     return Response(dict(id=pump.id))
 
 
+@api_view(['POST'])
+def pump_actions(request):
+    """Executes list of pump actions, e.g. [{"pump_id": 1, "action": "start", "duration": 30}], in one batch.
+
+    Returns list of results in the same order.
+    """
+    data = request.data
+    if not isinstance(data, list):
+        raise ParseError('Expected a list of actions.')
+    actions = []
+    for item in data:
+        if not isinstance(item, dict):
+            raise ParseError('Expected an object per action.')
+        pump_id = item.get('pump_id')
+        action = item.get('action')
+        duration = item.get('duration')
+        if not isinstance(pump_id, int) or isinstance(pump_id, bool):
+            raise ParseError('Invalid pump_id.')
+        if action not in Pump.ACTIONS:
+            raise ParseError(f'Invalid action, expected one of {", ".join(Pump.ACTIONS)}.')
+        if duration is not None and (not isinstance(duration, (int, float)) or duration <= 0):
+            raise ParseError('Invalid duration.')
+        actions.append((pump_id, action, duration))
+    logger.info(f'executing pump actions - actions={actions}')
+    return Response(Pump.objects.execute(actions))
+
+
 @api_view(['GET'])
 def weather_forecasts(request, device_id):
     forecasts = []
@@ -49,3 +81,45 @@ def weather_forecasts(request, device_id):
         for f in device.weather_forecasts:
             forecasts.append((datetime_to_unixtimestamp(f.start_time), f.temp_unit, f.min_temp, f.max_temp, f.pop))
     return Response(forecasts)
+
+
+@api_view(['GET'])
+def run_rollups(request):
+    """Returns daily run rollups, of the last 30 days unless start_date or end_date (YYYY-MM-DD) are specified."""
+    dates = dict(start_date=None, end_date=None)
+    for param in dates:
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        try:
+            dates[param] = parse_date(value)
+        except ValueError:
+            pass
+        if dates[param] is None:
+            raise ParseError(f'Invalid {param}.')
+
+    rollups = DailyRunRollup.objects.order_by('date', 'pump_id')
+    if dates['start_date'] is None and dates['end_date'] is None:
+        dates['start_date'] = timezone.localdate() - timedelta(days=30)
+    if dates['start_date'] is not None:
+        rollups = rollups.filter(date__gte=dates['start_date'])
+    if dates['end_date'] is not None:
+        rollups = rollups.filter(date__lte=dates['end_date'])
+    pump_id = request.query_params.get('pump_id')
+    if pump_id:
+        if not pump_id.isdigit():
+            raise ParseError('Invalid pump_id.')
+        rollups = rollups.filter(pump_id=pump_id)
+
+    return Response([
+        dict(
+            pump_id=rollup.pump_id,
+            date=rollup.date,
+            run_count=rollup.run_count,
+            total_seconds=rollup.total_seconds,
+            scheduled_run_count=rollup.scheduled_run_count,
+            scheduled_seconds=rollup.scheduled_seconds,
+            manual_run_count=rollup.manual_run_count,
+            manual_seconds=rollup.manual_seconds,
+            pop=rollup.pop)
+        for rollup in rollups])
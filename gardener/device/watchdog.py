@@ -0,0 +1,56 @@
+import heapq
+import logging
+import time
+
+logger = logging.getLogger('gardener')
+
+
+class DeadlineWatchdog:
+    """Min-heap of the deadlines of active runs.
+
+    Stopped and restarted runs are not removed from the heap, their entries are skipped when they come due instead,
+    so that watching and unwatching are O(log n) and O(1).
+    """
+
+    def __init__(self, grace=0.05):
+        self.grace = grace
+        self.heap = []  # (deadline, pump_id, run_id)
+        self.active = {}  # pump_id -> run_id
+
+    def __str__(self):
+        return '<%s active=%s>' % (self.__class__.__name__, self.active)
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return len(self.active)
+
+    def watch(self, pump_id, run_id, deadline):
+        if deadline is None or self.active.get(pump_id) == run_id:
+            return
+        self.active[pump_id] = run_id
+        heapq.heappush(self.heap, (deadline, pump_id, run_id))
+
+    def unwatch(self, pump_id):
+        self.active.pop(pump_id, None)
+
+    def timeout(self, now=None):
+        """Returns seconds until the next deadline (plus grace) or None if there are no active runs."""
+        while self.heap and self.active.get(self.heap[0][1]) != self.heap[0][2]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] + self.grace - (now or time.time()))
+
+    def due(self, now=None):
+        """Pops and returns list of (deadline, pump_id, run_id) of the runs whose deadline (plus grace) has passed."""
+        now = now or time.time()
+        due = []
+        while self.heap and self.heap[0][0] + self.grace <= now:
+            deadline, pump_id, run_id = heapq.heappop(self.heap)
+            if self.active.get(pump_id) != run_id:
+                continue
+            del self.active[pump_id]
+            due.append((deadline, pump_id, run_id))
+        return due
@@ -86,6 +86,12 @@ DATABASES = {
 REDIS_URL = env('REDIS_URL', default='redis://127.0.0.1:6379/0')
 REDIS_CONN = redis.StrictRedis.from_url(REDIS_URL)
 REDIS_KEY_PREFIX = 'gardener'
+REDIS_PUMP_EVENTS_CHANNEL = f'{REDIS_KEY_PREFIX}:pump-events'
+REDIS_RUN_LOG_KEY = f'{REDIS_KEY_PREFIX}:run-log'
+REDIS_LIVE_CHANNEL = f'{REDIS_KEY_PREFIX}:live'
+REDIS_LIVE_SNAPSHOT_KEY = f'{REDIS_KEY_PREFIX}:live-snapshot'
+REDIS_LIVE_STREAM_KEY = f'{REDIS_KEY_PREFIX}:live-stream'
+REDIS_WEBSOCKET_CLIENTS_KEY = f'{REDIS_KEY_PREFIX}:websocket-clients'
 
 CACHES = {
     'default': {
@@ -175,7 +181,70 @@ if DEBUG:
         'rest_framework.renderers.BrowsableAPIRenderer',
     )
 
+# Days of sunrise and sunset times which are computed and loaded at once, see gardener.data.solar.
+SUN_TIMES_DAYS = env.int('SUN_TIMES_DAYS', default=30)
+
 WEBSOCKET_HOST = env('WEBSOCKET_HOST', default='127.0.0.1')
 WEBSOCKET_PORT = env('WEBSOCKET_PORT', default=8888)
 
+# Threads of websocket_server.py --django in which the Django application handles requests.
+WSGI_THREADS = env.int('WSGI_THREADS', default=4)
+
+# Seconds between samples of the CPU temperature and of the rest of the device state (public IP and pump status, which
+# is otherwise pushed on pump events) by websocket_server. Only changed values are pushed to the clients.
+WEBSOCKET_CPU_TEMP_INTERVAL = env.float('WEBSOCKET_CPU_TEMP_INTERVAL', default=5)
+WEBSOCKET_DEVICE_INTERVAL = env.float('WEBSOCKET_DEVICE_INTERVAL', default=60)
+
+# Websocket clients which fall behind get only the latest message per key. They are disconnected once more than
+# WEBSOCKET_SEND_QUEUE_SIZE keys are pending or they have been behind for more than WEBSOCKET_MAX_LAG seconds.
+# permessage-deflate is offered with the specified zlib compression level, 0 to disable it.
+WEBSOCKET_SEND_QUEUE_SIZE = env.int('WEBSOCKET_SEND_QUEUE_SIZE', default=32)
+WEBSOCKET_MAX_LAG = env.float('WEBSOCKET_MAX_LAG', default=30)
+WEBSOCKET_COMPRESSION_LEVEL = env.int('WEBSOCKET_COMPRESSION_LEVEL', default=1)
+
+# Live state messages are kept in a Redis stream of about WEBSOCKET_STREAM_LENGTH entries. Reconnecting clients get the
+# messages they have missed, or a snapshot if they have missed more than WEBSOCKET_MAX_REPLAY of them.
+WEBSOCKET_STREAM_LENGTH = env.int('WEBSOCKET_STREAM_LENGTH', default=1000)
+WEBSOCKET_MAX_REPLAY = env.int('WEBSOCKET_MAX_REPLAY', default=100)
+
+GPIO_DEBOUNCE_MS = env.int('GPIO_DEBOUNCE_MS', default=200)
+
+# Thermal thresholds in °C above which non-critical work (camera, forecast updates, websocket broadcasts) is deferred.
+THERMAL_THROTTLE_TEMP = env.float('THERMAL_THROTTLE_TEMP', default=70)
+THERMAL_CRITICAL_TEMP = env.float('THERMAL_CRITICAL_TEMP', default=80)
+THERMAL_HYSTERESIS = env.float('THERMAL_HYSTERESIS', default=5)
+THERMAL_BROADCAST_INTERVAL_FACTOR = env.int('THERMAL_BROADCAST_INTERVAL_FACTOR', default=5)
+THERMAL_DEFER_DELAY = env.int('THERMAL_DEFER_DELAY', default=60)
+
+# Scheduling priority applied by each runner at startup: nice level, scheduling policy ('other', 'batch', 'idle',
+# 'fifo' or 'rr') with its real-time priority, CPU affinity and I/O class ('realtime', 'best-effort' or 'idle') with
+# its level. See manage.py process_priorities for the effective settings.
+PROCESS_PRIORITIES = {
+    'pump_runner': dict(nice=-10, policy='fifo', priority=50, cpu_affinity=[0], ionice='realtime', ionice_level=0),
+    'run_logger': dict(nice=-5, ionice='best-effort', ionice_level=2),
+    'monitor_pump': dict(nice=-10, policy='rr', priority=40, cpu_affinity=[0], ionice='best-effort', ionice_level=0),
+    'execute_scheduled_run': dict(nice=-5, ionice='best-effort', ionice_level=2),
+    'lcd_runner': dict(nice=-5),
+    'light_runner': dict(nice=-5),
+    'fan_runner': dict(nice=-5),
+    'thermal_governor': dict(nice=-5),
+    'sensor_runner': dict(nice=-5, cpu_affinity=[1, 2, 3]),
+    'schedule_run': dict(nice=5),
+    'websocket_server': dict(nice=5, cpu_affinity=[1, 2, 3]),
+    'publish_live_state': dict(nice=5, cpu_affinity=[1, 2, 3]),
+    'update_weather_forecast': dict(nice=10, policy='batch', cpu_affinity=[1, 2, 3], ionice='idle'),
+    'archive_runs': dict(nice=15, policy='idle', ionice='idle'),
+    'rebuild_run_rollups': dict(nice=15, policy='idle', ionice='idle'),
+    'camera_runner': dict(nice=15, policy='batch', cpu_affinity=[1, 2, 3], ionice='idle'),
+}
+
+# Runs which ended more than the specified number of days ago are moved to the archive table by archive_runs.
+RUN_RETENTION_DAYS = env.int('RUN_RETENTION_DAYS', default=365)
+
+# Hardware backend, set to gardener.device.hardware.SimulatedBackend to run off-device.
+HARDWARE_BACKEND = env('HARDWARE_BACKEND', default='gardener.device.hardware.SysfsBackend')
+SIMULATED_HARDWARE_ROOT = env('SIMULATED_HARDWARE_ROOT', default='/dev/shm/gardener')
+SIMULATED_CAMERA_SOURCE = env('SIMULATED_CAMERA_SOURCE', default='')
+SIMULATED_FORECAST_SERVER_PORT = env.int('SIMULATED_FORECAST_SERVER_PORT', default=8021)
+
 LCD_TEXT_PATH = os.path.join(BASE_DIR, 'log', 'lcd_text.txt')
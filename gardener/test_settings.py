@@ -1,6 +1,12 @@
 from .settings import *  # noqa
 
 REDIS_KEY_PREFIX = 'test_gardener'
+REDIS_PUMP_EVENTS_CHANNEL = f'{REDIS_KEY_PREFIX}:pump-events'
+REDIS_RUN_LOG_KEY = f'{REDIS_KEY_PREFIX}:run-log'
+REDIS_LIVE_CHANNEL = f'{REDIS_KEY_PREFIX}:live'
+REDIS_LIVE_SNAPSHOT_KEY = f'{REDIS_KEY_PREFIX}:live-snapshot'
+REDIS_LIVE_STREAM_KEY = f'{REDIS_KEY_PREFIX}:live-stream'
+REDIS_WEBSOCKET_CLIENTS_KEY = f'{REDIS_KEY_PREFIX}:websocket-clients'
 
 CACHES = {
     'default': {
@@ -9,3 +15,5 @@ CACHES = {
         'KEY_PREFIX': REDIS_KEY_PREFIX,
     },
 }
+
+PROCESS_PRIORITIES = {}
@@ -0,0 +1,61 @@
+"""Serves the Django application from the tornado IOLoop of websocket_server.py --django.
+
+Requests are handled by the WSGI application in a thread pool, so that the blocking ORM calls of the views and the
+REST API do not block the websocket clients.
+"""
+import tornado.ioloop
+import tornado.web
+import tornado.wsgi
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from gardener.wsgi import application
+
+executor = ThreadPoolExecutor(max_workers=settings.WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+def call_application(environ):
+    """Calls the WSGI application and returns its status, headers and body."""
+    response = []
+    body = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, headers]
+        return body.append
+
+    result = application(environ, start_response)
+    try:
+        body.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = response
+    return status, headers, b''.join(body)
+
+
+class DjangoHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ('GET', 'HEAD', 'POST', 'DELETE', 'PATCH', 'PUT', 'OPTIONS')
+
+    async def handle(self, *args, **kwargs):
+        environ = tornado.wsgi.WSGIContainer.environ(self.request)
+        environ['wsgi.multithread'] = True
+        environ['wsgi.multiprocess'] = False
+        status, headers, body = await tornado.ioloop.IOLoop.current().run_in_executor(
+            executor, call_application, environ)
+
+        code, reason = status.split(' ', 1)
+        self.set_status(int(code), reason)
+        self.clear_header('Content-Type')
+        names = set()
+        for name, value in headers:
+            # Headers such as Set-Cookie may be repeated.
+            if name.lower() in names:
+                self.add_header(name, value)
+            else:
+                self.set_header(name, value)
+                names.add(name.lower())
+        if self.request.method != 'HEAD':
+            self.write(body)
+
+    get = head = post = delete = patch = put = options = handle
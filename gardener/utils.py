@@ -1,13 +1,16 @@
 import calendar
-import ephem
 import logging
 import os
+import psutil
 import pytz
 import requests
 import select
+import signal
 import socket
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from psutil import net_if_addrs
 from timezonefinder import TimezoneFinder
@@ -16,38 +19,90 @@ from urllib.request import urlretrieve
 from django.conf import settings
 from django.core.cache import cache
 from django.core.mail import send_mass_mail
+from django.db import close_old_connections
 from django.utils import timezone
 
+from gardener.device.gpio import get_line
+from gardener.device.hardware import get_backend
+from gardener.exceptions import SignalException
+
 logger = logging.getLogger('gardener')
 
 
 class InterruptHandlerThread(threading.Thread):
-    def __init__(self, tuples, **kwargs):
+    """Waits for GPIO interrupts and dispatches their callbacks to a small worker pool.
+
+    Interrupts on the same line within the debounce window are ignored and a callback which is still queued or
+    running is not queued again, so a bouncing switch fires its callback once and the epoll loop never blocks.
+    """
+
+    def __init__(self, tuples, debounce=None, workers=2, **kwargs):
         super().__init__(**kwargs)
         self.terminating = threading.Event()
         self.tuples = tuples
         self.warmup_time = 3  # Ignore triggers during the first 3 seconds.
+        if debounce is None:
+            debounce = settings.GPIO_DEBOUNCE_MS / 1000
+        self.debounce = debounce
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__)
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+
+    def dispatch(self, callback):
+        with self.pending_lock:
+            if callback in self.pending:
+                logger.debug(f'coalesced callback={callback}')
+                return False
+            self.pending.add(callback)
+        self.executor.submit(self.invoke, callback)
+        return True
+
+    def invoke(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.exception(f'callback={callback} - e={e}')
+        finally:
+            close_old_connections()
+            with self.pending_lock:
+                self.pending.discard(callback)
 
     def run(self):
-        values = [f'/sys/class/gpio/gpio{gpio_export_num}/value' for (gpio_export_num, _) in self.tuples]
-        files = [open(value) for value in values]
+        backend = get_backend()
+        handlers = {}  # fileno -> [callback, last_time]
+        for (gpio_export_num, callback) in self.tuples:
+            line = get_line(gpio_export_num)
+            fileno = backend.open_interrupt(line)
+            if fileno is None:
+                logger.error(f'cannot open line={line}')
+                continue
+            handlers[fileno] = [callback, 0]
         logger.info(f'{self.__class__.__name__} started - ident={self.ident}')
 
-        start_time = time.time()
+        start_time = time.monotonic()
 
         epoll = select.epoll()
-        for file in files:
-            epoll.register(file, select.EPOLLIN | select.EPOLLET)
+        for fileno in handlers:
+            epoll.register(fileno, select.EPOLLIN | select.EPOLLPRI | select.EPOLLET)
 
         while not self.terminating.is_set():
             events = epoll.poll(timeout=1)
+            now = time.monotonic()
             for fileno, event in events:
-                for index, file in enumerate(files):
-                    if fileno == file.fileno() and time.time() - start_time > self.warmup_time:
-                        self.tuples[index][1]()  # Invoke callback method.
-
-        for file in files:
-            file.close()
+                handler = handlers.get(fileno)
+                if handler is None:
+                    continue
+                callback, last_time = handler
+                backend.acknowledge_interrupt(fileno)
+                if now - start_time <= self.warmup_time or now - last_time < self.debounce:
+                    continue
+                handler[1] = now
+                self.dispatch(callback)
+
+        epoll.close()
+        for fileno in handlers:
+            backend.close_interrupt(fileno)
+        self.executor.shutdown(wait=True)
         logger.info(f'{self.__class__.__name__} terminated - ident={self.ident}')
 
 
@@ -72,6 +127,57 @@ class PollingThread(threading.Thread):
         logger.info(f'{self.__class__.__name__} terminated - ident={self.ident}')
 
 
+class LatencyRecorder:
+    """Keeps the most recent latency samples (in milliseconds) and summarizes them for reporting through the cache."""
+
+    def __init__(self, name, size=1000):
+        self.name = name
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.reported_count = 0
+
+    def __str__(self):
+        return '<%s name=%s count=%d>' % (self.__class__.__name__, self.name, self.count)
+
+    def __repr__(self):
+        return str(self)
+
+    @property
+    def cache_key(self):
+        return f'latency:{self.name}'
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return dict(count=self.count)
+        return dict(
+            count=self.count,
+            window=len(samples),
+            mean=round(sum(samples) / len(samples), 3),
+            p50=round(samples[len(samples) // 2], 3),
+            p99=round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+            max=round(samples[-1], 3),
+            time=int(time.time()))
+
+    def report(self):
+        """Logs and caches summary if there are new samples since last report."""
+        if self.count == self.reported_count:
+            return None
+        self.reported_count = self.count
+        summary = self.summary()
+        logger.info(f'name={self.name} - latency={summary}')
+        cache.set(self.cache_key, summary, timeout=None)
+        return summary
+
+
+def get_latency_summary(name):
+    return cache.get(f'latency:{name}')
+
+
 class EmailThread(threading.Thread):
     def __init__(self, datatuple, **kwargs):
         self.datatuple = datatuple
@@ -82,6 +188,92 @@ class EmailThread(threading.Thread):
         logger.info(f'datatuple={self.datatuple} - sent={sent}')
 
 
+def raise_signal_exception(signum, frame):
+    logger.info(f'caught signum={signum}')
+    raise SignalException
+
+
+def handle_termination_signals():
+    """Raises SignalException in the main thread on SIGTERM or SIGINT."""
+    signal.signal(signal.SIGTERM, raise_signal_exception)
+    signal.signal(signal.SIGINT, raise_signal_exception)
+
+
+SCHED_POLICIES = {
+    'other': os.SCHED_OTHER,
+    'batch': os.SCHED_BATCH,
+    'idle': os.SCHED_IDLE,
+    'fifo': os.SCHED_FIFO,
+    'rr': os.SCHED_RR,
+}
+
+IONICE_CLASSES = {
+    'none': psutil.IOPRIO_CLASS_NONE,
+    'realtime': psutil.IOPRIO_CLASS_RT,
+    'best-effort': psutil.IOPRIO_CLASS_BE,
+    'idle': psutil.IOPRIO_CLASS_IDLE,
+}
+
+
+def set_process_priority(name):
+    """Applies scheduling priority declared in PROCESS_PRIORITIES setting for the named runner.
+
+    Settings which need privileges the process does not have (negative nice level, real-time policy or real-time
+    I/O class) are logged and skipped. Must be called before starting any thread so that threads inherit it.
+    """
+    priority = settings.PROCESS_PRIORITIES.get(name)
+    if not priority:
+        return None
+
+    if 'nice' in priority:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, priority['nice'])
+        except OSError as e:
+            logger.warning(f'name={name} - nice={priority["nice"]} - e={e}')
+
+    if 'policy' in priority:
+        policy = priority['policy']
+        sched_priority = priority.get('priority', 0) if policy in ('fifo', 'rr') else 0
+        try:
+            os.sched_setscheduler(0, SCHED_POLICIES[policy], os.sched_param(sched_priority))
+        except OSError as e:
+            logger.warning(f'name={name} - policy={policy} - priority={sched_priority} - e={e}')
+
+    if 'cpu_affinity' in priority:
+        cpus = set(priority['cpu_affinity']) & set(range(os.cpu_count()))
+        if cpus:
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError as e:
+                logger.warning(f'name={name} - cpus={cpus} - e={e}')
+
+    if 'ionice' in priority:
+        ioclass = IONICE_CLASSES[priority['ionice']]
+        value = priority.get('ionice_level') if priority['ionice'] in ('realtime', 'best-effort') else None
+        try:
+            psutil.Process().ionice(ioclass, value=value)
+        except (OSError, psutil.Error) as e:
+            logger.warning(f'name={name} - ionice={priority["ionice"]} - e={e}')
+
+    effective = get_process_priority()
+    logger.info(f'name={name} - declared={priority} - effective={effective}')
+    return effective
+
+
+def get_process_priority(pid=0):
+    """Returns effective scheduling priority of the specified process (defaults to current process)."""
+    process = psutil.Process(pid or None)
+    policy = os.sched_getscheduler(pid)
+    ioclass = process.ionice()
+    return dict(
+        nice=process.nice(),
+        policy=next((key for key, value in SCHED_POLICIES.items() if value == policy), str(policy)),
+        priority=os.sched_getparam(pid).sched_priority,
+        cpu_affinity=sorted(process.cpu_affinity()),
+        ionice=next((key for key, value in IONICE_CLASSES.items() if value == ioclass.ioclass), str(ioclass.ioclass)),
+        ionice_level=ioclass.value)
+
+
 def ftp_get(url):
     logger.info(f'url={url}')
     content = ''
@@ -138,32 +330,6 @@ def nginx_configured():
     return False
 
 
-def get_next_sun(lat, lon, date=None):
-    """Returns a tuple of next sunrise and sunset given the specified latitude and longitude."""
-    if date is None:
-        date = timezone.now()
-
-    loc = ephem.Observer()
-    loc.date = date
-    loc.lat = str(lat)
-    loc.lon = str(lon)
-    loc.elev = 0
-    loc.horizon = '-0:34'
-    loc.pressure = 0
-
-    dt = loc.next_rising(ephem.Sun(), use_center=False).datetime()
-    next_sunrise = timezone.make_aware(dt, pytz.timezone('UTC')).replace(microsecond=0)  # Second precision.
-
-    dt = loc.next_setting(ephem.Sun(), use_center=False).datetime()
-    next_sunset = timezone.make_aware(dt, pytz.timezone('UTC')).replace(microsecond=0)  # Second precision.
-
-    logger.debug(
-        f'lat={lat} - lon={lon} - date={date} - '
-        f'next_sunrise={timezone.localtime(next_sunrise)} - next_sunset={timezone.localtime(next_sunset)}')
-
-    return next_sunrise, next_sunset
-
-
 def get_time_zone(latitude, longitude):
     """Returns time zone for the specified location."""
     return TimezoneFinder().timezone_at(lat=latitude, lng=longitude)
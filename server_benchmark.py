@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Compares memory and latency of the Django application served by gunicorn alongside websocket_server.py with
+websocket_server.py --django serving both from one process.
+
+Starts each setup on local ports, connects the websocket clients, sends the HTTP requests with the specified
+concurrency to the specified path and reports the RSS of each program, the total and the p50/p99 latency of the
+requests. Both setups run publish_live_state as well, which is a Django process of its own in either one, so that the
+total is the memory of all the Django processes serving the dashboard. The database and Redis configured in .env must
+be available.
+
+    venv/bin/python server_benchmark.py --requests=500 --concurrency=4 --clients=20 --path=/
+"""
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gardener.settings')
+
+import numpy as np
+import psutil
+import signal
+import subprocess
+import sys
+import time
+import tornado.gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.netutil
+import tornado.websocket
+from tornado.options import define
+from tornado.options import options
+
+define('requests', type=int, default=500)
+define('concurrency', type=int, default=4)
+define('clients', type=int, default=20, help='Number of websocket clients connected during the benchmark.')
+define('path', type=str, default='/')
+define('gunicorn_workers', type=int, default=4)
+
+
+def get_free_port():
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    for sock in sockets:
+        sock.close()
+    return port
+
+
+def get_rss(process):
+    """Returns RSS in MiB of the process and its children."""
+    process = psutil.Process(process.pid)
+    return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 1024 / 1024
+
+
+async def wait_for(url, attempts=100):
+    client = tornado.httpclient.AsyncHTTPClient()
+    for _ in range(attempts):
+        try:
+            await client.fetch(url, raise_error=False)
+            return
+        except OSError:
+            await tornado.gen.sleep(0.1)
+    raise RuntimeError(f'{url} is not responding')
+
+
+async def benchmark(http_port, websocket_url):
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=options.concurrency)
+    await wait_for(f'http://127.0.0.1:{http_port}{options.path}')
+    connections = [await tornado.websocket.websocket_connect(websocket_url) for _ in range(options.clients)]
+
+    latencies = []
+
+    async def fetch():
+        start = time.perf_counter()
+        response = await client.fetch(f'http://127.0.0.1:{http_port}{options.path}', raise_error=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return response.code
+
+    codes = []
+    for i in range(0, options.requests, options.concurrency):
+        codes.extend(await tornado.gen.multi([fetch() for _ in range(min(options.concurrency, options.requests - i))]))
+
+    for connection in connections:
+        connection.close()
+    return latencies, codes
+
+
+def start(args):
+    # Own process group so that forked workers are stopped as well.
+    return subprocess.Popen(args, start_new_session=True)
+
+
+def stop(processes):
+    for process in processes:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+async def main():
+    gunicorn = os.path.join(os.path.dirname(sys.executable), 'gunicorn')
+    http_port = get_free_port()
+    websocket_port = get_free_port()
+    publisher = [sys.executable, 'manage.py', 'publish_live_state']
+    setups = (
+        ('gunicorn + websocket_server', dict(
+            gunicorn=[
+                gunicorn, f'--bind=127.0.0.1:{http_port}', f'--workers={options.gunicorn_workers}',
+                'gardener.wsgi:application'],
+            websocket_server=[sys.executable, 'websocket_server.py', f'--port={websocket_port}', '--logging=warning'],
+            publish_live_state=publisher),
+         http_port, f'ws://127.0.0.1:{websocket_port}/ws/'),
+        ('websocket_server --django', dict(
+            websocket_server=[
+                sys.executable, 'websocket_server.py', f'--port={http_port}', '--django', '--logging=warning'],
+            publish_live_state=publisher),
+         http_port, f'ws://127.0.0.1:{http_port}/ws/'),
+    )
+    for name, commands, port, websocket_url in setups:
+        processes = {program: start(command) for program, command in commands.items()}
+        try:
+            latencies, codes = await benchmark(port, websocket_url)
+            rss = {program: get_rss(process) for program, process in processes.items()}
+        finally:
+            stop(processes.values())
+        print(
+            f'{name}: requests={options.requests} - concurrency={options.concurrency} - clients={options.clients} - '
+            f'codes={sorted(set(codes))} - rss={sum(rss.values()):.1f}MiB '
+            f'({", ".join(f"{program}={value:.1f}MiB" for program, value in rss.items())}) - '
+            f'p50={np.percentile(latencies, 50):.2f}ms - p99={np.percentile(latencies, 99):.2f}ms')
+
+
+if __name__ == '__main__':
+    tornado.options.parse_command_line()
+    tornado.ioloop.IOLoop.current().run_sync(main)
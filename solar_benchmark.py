@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Measures sunrise and sunset lookups from the precomputed sun times against solving them on every call.
+
+The dashboard render looks up the next sunrise and sunset of the device (Device.next_sunrise and next_sunset, each
+solving both before) and a scheduling pass steps a day at a time from the last scheduled run of each pump until the
+next sunrise is in the future, as schedule_run does. Sun times are computed in memory, without the database, and the
+time to compute them is reported separately.
+
+    venv/bin/python solar_benchmark.py --pumps=4 --steps=7 --repeat=100
+"""
+import os
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gardener.settings')
+
+import django
+django.setup()
+
+import ephem
+import pytz
+import time
+from datetime import timedelta
+from tornado.options import define
+from tornado.options import options
+
+from django.conf import settings
+from django.utils import timezone
+
+from gardener.data.solar import compute_sun_times
+from gardener.data.solar import SunTable
+
+define('lat', type=float, default=-33.8468332)
+define('lon', type=float, default=151.0635537)
+define('pumps', type=int, default=4)
+define('steps', type=int, default=7, help='Days stepped per pump in a scheduling pass.')
+define('repeat', type=int, default=100)
+
+
+def solve_next_sun(lat, lon, date):
+    """Solves the next sunrise and sunset with a new observer, as get_next_sun did before."""
+    loc = ephem.Observer()
+    loc.date = date
+    loc.lat = str(lat)
+    loc.lon = str(lon)
+    loc.elev = 0
+    loc.horizon = '-0:34'
+    loc.pressure = 0
+    next_sunrise = timezone.make_aware(loc.next_rising(ephem.Sun(), use_center=False).datetime(), pytz.UTC)
+    next_sunset = timezone.make_aware(loc.next_setting(ephem.Sun(), use_center=False).datetime(), pytz.UTC)
+    return next_sunrise.replace(microsecond=0), next_sunset.replace(microsecond=0)
+
+
+def dashboard(get_next_sun, now):
+    next_sunrise, _ = get_next_sun(options.lat, options.lon, now)
+    _, next_sunset = get_next_sun(options.lat, options.lon, now)
+
+
+def scheduling_pass(get_next_sun, now):
+    for _ in range(options.pumps):
+        last_start_time = now - timedelta(days=options.steps)
+        while True:
+            next_start_time, _ = get_next_sun(options.lat, options.lon, last_start_time)
+            if next_start_time <= now:
+                last_start_time += timedelta(days=1)
+            else:
+                break
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    for _ in range(options.repeat):
+        function(*args)
+    return (time.perf_counter() - start) * 1000 / options.repeat
+
+
+if __name__ == '__main__':
+    options.parse_command_line()
+    now = timezone.now()
+    start_date = (now - timedelta(days=options.steps + 1)).date()
+    days = max(settings.SUN_TIMES_DAYS, options.steps + 3)
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+
+    start = time.perf_counter()
+    table = SunTable(start_date, compute_sun_times(options.lat, options.lon, dates))
+    compute_time = (time.perf_counter() - start) * 1000
+
+    def lookup(lat, lon, date):
+        return table.get_next_sun(date)
+
+    print(f'compute {days} days: {compute_time:.2f}ms')
+    for name, function in (('dashboard render', dashboard), ('scheduling pass', scheduling_pass)):
+        solve_time = measure(function, solve_next_sun, now)
+        lookup_time = measure(function, lookup, now)
+        print(
+            f'{name}: solve={solve_time:.3f}ms - lookup={lookup_time:.3f}ms - '
+            f'speedup={solve_time / lookup_time:.0f}x')
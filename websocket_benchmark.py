@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""Measures websocket fan-out of MainHandler to local clients.
+
+Runs the websocket application and the clients in one process and sends pump status messages of --devices devices,
+each client subscribed to one of them. Messages are either encoded once and routed to the subscribed clients
+(MainHandler.send_message) or encoded per client and sent to all of them as before. Reports the time from sending
+until every recipient has received the message, the time spent in the send call itself and the CPU time spent, which
+includes the clients.
+
+    venv/bin/python websocket_benchmark.py --clients=500 --messages=200 --devices=4
+
+With --workers, starts websocket_server.py with each of the given numbers of workers on a separate channel instead,
+publishes the messages once in Redis as publish_live_state does and reports the deliveries per second, the latency
+from publish until each client has received the message and the scaling of the deliveries relative to the first
+number of workers. The clients run in this process, which caps the deliveries it can measure, keep --interval high
+enough that it is not the bottleneck.
+
+    venv/bin/python websocket_benchmark.py --workers=1,2,4 --clients=2000 --messages=200
+"""
+import websocket_server
+
+import json
+import logging
+import numpy as np
+import os
+import signal
+import subprocess
+import sys
+import time
+import tornado.gen
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.websocket
+from tornado.options import define
+from tornado.options import options
+
+from django.conf import settings
+
+from gardener.device.live import encode
+
+define('clients', type=int, default=200)
+define('messages', type=int, default=100)
+define('compression', type=bool, default=False, help='Negotiate permessage-deflate.')
+define('devices', type=int, default=1, help='Number of devices the clients are spread across.')
+define('workers', type=int, multiple=True, default=[], help='Benchmark websocket_server.py with these numbers of '
+       'workers over Redis, e.g. 1,2,4.')
+define('interval', type=float, default=0.01, help='Seconds between messages published with --workers.')
+
+
+def per_client_send_message(message):
+    for client in list(websocket_server.MainHandler.clients):
+        client.write_message(message)
+
+
+async def benchmark(port, send_message, routed):
+    compression_options = {} if options.compression else None
+    connections = {}  # device_id -> connections subscribed to the device
+    for i in range(options.clients):
+        device_id = i % options.devices + 1
+        connection = await tornado.websocket.websocket_connect(
+            f'ws://127.0.0.1:{port}/?topics=device:{device_id}', compression_options=compression_options)
+        connections.setdefault(device_id, []).append(connection)
+
+    latencies = []
+    broadcast_time = 0
+    cpu_time = time.process_time()
+    for i in range(options.messages):
+        device_id = i % options.devices + 1
+        message = dict(
+            device_id=device_id,
+            public_ip='127.0.0.1',
+            cpu_temp=40 + i % 10,
+            pump_status=[(device_id * 8 + pump_id, (i + pump_id) % 2) for pump_id in range(8)])
+        start = time.perf_counter()
+        send_message(message)
+        broadcast_time += time.perf_counter() - start
+        recipients = connections[device_id] if routed else sum(connections.values(), [])
+        for connection in recipients:
+            await connection.read_message()
+        latencies.append((time.perf_counter() - start) * 1000)
+    cpu_time = time.process_time() - cpu_time
+
+    for connection in sum(connections.values(), []):
+        connection.close()
+    return latencies, broadcast_time, cpu_time
+
+
+async def connect(port, attempts=50):
+    """Connects a client, waiting for the server to start."""
+    for _ in range(attempts - 1):
+        try:
+            return await tornado.websocket.websocket_connect(f'ws://127.0.0.1:{port}/?topics=device:1')
+        except (ConnectionRefusedError, OSError):
+            await tornado.gen.sleep(0.1)
+    return await tornado.websocket.websocket_connect(f'ws://127.0.0.1:{port}/?topics=device:1')
+
+
+async def receive(connection, messages, latencies):
+    # Skip snapshot sent on connect.
+    while messages:
+        frame = await connection.read_message()
+        if frame is None:
+            break
+        message = json.loads(frame)
+        if 'sent' in message:
+            latencies.append((time.time() - message['sent']) * 1000)
+            messages -= 1
+
+
+async def benchmark_workers(workers):
+    """Returns deliveries per second and latencies of websocket_server.py with the number of workers."""
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    for sock in sockets:
+        sock.close()
+    channel = f'{settings.REDIS_LIVE_CHANNEL}-benchmark'
+    server = subprocess.Popen([
+        sys.executable, 'websocket_server.py', f'--port={port}', f'--processes={workers}',
+        f'--channel={channel}', '--logging=warning'], start_new_session=True)
+    try:
+        connections = [await connect(port) for _ in range(options.clients)]
+        await tornado.gen.sleep(1)  # Let every worker subscribe.
+
+        latencies = []
+        receivers = [receive(connection, options.messages, latencies) for connection in connections]
+        start = time.perf_counter()
+        futures = tornado.gen.multi(receivers)
+        for i in range(options.messages):
+            message = dict(id=f'{i + 1}-0', device_id=1, cpu_temp=40 + i % 10, sent=time.time())
+            settings.REDIS_CONN.publish(channel, encode(message))
+            await tornado.gen.sleep(options.interval)
+        await futures
+        elapsed = time.perf_counter() - start
+
+        for connection in connections:
+            connection.close()
+        return len(latencies) / elapsed, latencies
+    finally:
+        # Stop the workers along with the process which forked them.
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+async def main_workers():
+    first_deliveries = None
+    for workers in options.workers:
+        deliveries, latencies = await benchmark_workers(workers)
+        if first_deliveries is None:
+            first_deliveries = deliveries
+        print(
+            f'workers={workers} - clients={options.clients} - messages={options.messages} - '
+            f'deliveries={deliveries:.0f}/s - scaling={deliveries / first_deliveries:.2f}x - '
+            f'p50={np.percentile(latencies, 50):.2f}ms - p99={np.percentile(latencies, 99):.2f}ms')
+
+
+async def main():
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    server = tornado.httpserver.HTTPServer(websocket_server.Application())
+    server.add_sockets(sockets)
+
+    for name, send_message, routed in (
+            ('encode per client to all', per_client_send_message, False),
+            ('encode once to subscribers', websocket_server.MainHandler.send_message, True)):
+        latencies, broadcast_time, cpu_time = await benchmark(port, send_message, routed)
+        print(
+            f'{name}: clients={options.clients} - devices={options.devices} - messages={options.messages} - '
+            f'compression={options.compression} - '
+            f'p50={np.percentile(latencies, 50):.2f}ms - p99={np.percentile(latencies, 99):.2f}ms - '
+            f'broadcast={broadcast_time * 1000 / options.messages:.2f}ms/message - '
+            f'cpu={cpu_time * 1000 / options.messages:.2f}ms/message')
+
+    server.stop()
+
+
+if __name__ == '__main__':
+    tornado.options.parse_command_line()
+    logging.getLogger('tornado.access').setLevel(logging.WARNING)
+    tornado.ioloop.IOLoop.current().run_sync(main_workers if options.workers else main)
@@ -5,96 +5,374 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gardener.settings')
 import django
 django.setup()
 
-import asyncio
+import json
 import logging
-import threading
+import redis
+import socket
+import struct
 import time
+import tornado.httpserver
+import tornado.iostream
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import tornado.web
 import tornado.websocket
+from collections import defaultdict
+from tornado.escape import json_encode
 from tornado.options import define
 from tornado.options import options
-from tornado.platform.asyncio import AnyThreadEventLoopPolicy
 
 from django.conf import settings
 
-from gardener.device.models import Device
-from gardener.device.models import Pump
-
-asyncio.set_event_loop_policy(AnyThreadEventLoopPolicy())
+from gardener.device.live import get_message_key
+from gardener.device.live import get_missed_messages
+from gardener.device.live import get_snapshots
+from gardener.device.live import get_topics
+from gardener.device.live import is_topic
+from gardener.device.live import LiveState
+from gardener.device.live import parse_id
+from gardener.device.live import SendQueue
+from gardener.utils import set_process_priority
 
 define('address', type=str, default='127.0.0.1')
 define('port', type=int, default=8888)
+define('processes', type=int, default=1, help='Number of worker processes sharing the port, 0 for one per CPU.')
+define('channel', type=str, default=settings.REDIS_LIVE_CHANNEL, help='Redis channel of the live state messages.')
+define('django', type=bool, default=False, help='Serve the Django application as well, with the websocket at /ws/.')
+
+logger = logging.getLogger('gardener')
+
+# Delay in seconds before reconnecting to Redis and interval in seconds between client count reports.
+RECONNECT_DELAY = 1
+CLIENT_COUNT_INTERVAL = 10
+
+# Max. number of topics a client can subscribe to.
+MAX_TOPICS = 64
+
+# Live state of the devices as published by publish_live_state, kept by each worker for the snapshots sent to its
+# clients. device_id -> LiveState
+states = {}
+
+
+class Frame:
+    """Encoded text message, framed once for all the clients which receive it.
+
+    Clients which have negotiated permessage-deflate compress the message with their own compression context, i.e.
+    once per client. The others are written the same frame bytes.
+    """
+
+    def __init__(self, data):
+        self.data = data  # UTF-8 encoded JSON.
+        self._wire = None
+
+    @property
+    def wire(self):
+        """Returns the unmasked websocket text frame of the message, as servers send it."""
+        if self._wire is None:
+            length = len(self.data)
+            if length < 126:
+                header = struct.pack('!BB', 0x81, length)
+            elif length <= 0xFFFF:
+                header = struct.pack('!BBH', 0x81, 126, length)
+            else:
+                header = struct.pack('!BBQ', 0x81, 127, length)
+            self._wire = header + self.data
+        return self._wire
 
 
 class Application(tornado.web.Application):
-    def __init__(self):
+    def __init__(self, django=False):
         handlers = [
-            (r'/', MainHandler),
+            (r'/ws/', MainHandler),
         ]
+        if django:
+            from gardener.tornado_wsgi import DjangoHandler
+            handlers.append((r'.*', DjangoHandler))
+        else:
+            handlers.append((r'/', MainHandler))
         tornado.web.Application.__init__(self, handlers)
 
 
 class MainHandler(tornado.websocket.WebSocketHandler):
+    """Websocket client subscribed to topics, see get_topics.
+
+    Clients pass the initial topics as comma separated topics argument and change them by sending
+    {"subscribe": [...]} or {"unsubscribe": [...]}. Messages are routed through the topic to clients table, so that
+    each one costs only as much as the number of clients which receive it.
+    """
     clients = set()
+    routes = defaultdict(set)  # topic -> clients
 
     def open(self):
+        self.queue = SendQueue()
+        self.writing = False
+        self.behind_since = None
+        self.resume_id = None
+        self.topics = set()
         self.clients.add(self)
+        topics = [topic for topic in self.get_argument('topics', '').split(',') if topic]
+        self.subscribe(topics, self.get_argument('last_id', None))
 
     def on_close(self):
-        self.clients.remove(self)
+        self.remove()
+
+    def remove(self):
+        self.clients.discard(self)
+        self.unsubscribe(list(self.topics))
+
+    def subscribe(self, topics, last_id=None):
+        """Subscribes to topics and sends the current state of the new ones.
+
+        Reconnecting clients pass the id of the last message they have received and get only the ones they have
+        missed. The relay may not have read all of them yet, they are skipped until it catches up.
+        """
+        topics = {topic for topic in topics if is_topic(topic)} - self.topics
+        topics = set(sorted(topics)[:max(0, MAX_TOPICS - len(self.topics))])
+        if not topics:
+            return
+        for topic in topics:
+            self.routes[topic].add(self)
+        self.topics |= topics
+
+        messages = None
+        if last_id:
+            try:
+                messages = get_missed_messages(last_id)
+            except redis.ConnectionError as e:
+                logger.error(f'e={e}')
+        if messages is not None:
+            for message in messages:
+                if topics.intersection(get_topics(message)):
+                    self.send(get_message_key(message), Frame(json_encode(message).encode()))
+            self.resume_id = parse_id(messages[-1]['id'] if messages else last_id)
+            return
+
+        for state in states.values():
+            snapshot = state.snapshot()
+            if snapshot is not None and topics.intersection(get_topics(snapshot)):
+                self.send(get_message_key(snapshot), Frame(json_encode(snapshot).encode()))
+
+    def unsubscribe(self, topics):
+        for topic in self.topics.intersection(topics):
+            clients = self.routes[topic]
+            clients.discard(self)
+            if not clients:
+                del self.routes[topic]
+            self.topics.discard(topic)
 
     def check_origin(self, origin):
         return True
 
+    def get_compression_options(self):
+        if settings.WEBSOCKET_COMPRESSION_LEVEL:
+            return dict(compression_level=settings.WEBSOCKET_COMPRESSION_LEVEL)
+        return None
+
     def on_message(self, message):
-        self.write_message(message)
+        try:
+            data = json.loads(message)
+            subscribe = data.get('subscribe', [])
+            unsubscribe = data.get('unsubscribe', [])
+            if not isinstance(subscribe, list) or not isinstance(unsubscribe, list):
+                raise ValueError('topics must be a list')
+        except (AttributeError, ValueError) as e:
+            logger.warning(f'invalid message={message} - e={e}')
+            return
+        self.unsubscribe([topic for topic in unsubscribe if is_topic(topic)])
+        self.subscribe(subscribe)
+
+    def send(self, key, frame):
+        """Sends Frame unless the previous one has not been flushed yet, in which case it is queued."""
+        if not self.writing:
+            self.write_frames([frame])
+            return
+        self.queue.put(key, frame)
+        if self.behind_since is None:
+            self.behind_since = time.monotonic()
+        lag = time.monotonic() - self.behind_since
+        if len(self.queue) > settings.WEBSOCKET_SEND_QUEUE_SIZE or lag > settings.WEBSOCKET_MAX_LAG:
+            logger.warning(f'closing slow client - queue={len(self.queue)} - lag={lag:.3f}s')
+            self.remove()
+            self.close(1013, 'Too slow')
+
+    def write_frames(self, frames):
+        try:
+            for frame in frames:
+                future = self.write_frame(frame)
+        except (tornado.websocket.WebSocketClosedError, tornado.iostream.StreamClosedError):
+            self.remove()
+            return
+        self.writing = True
+        future.add_done_callback(self.on_written)
+
+    def write_frame(self, frame):
+        """Writes the frame as is unless the connection compresses messages. Returns future of the write."""
+        connection = self.ws_connection
+        if connection is None or connection.is_closing():
+            raise tornado.websocket.WebSocketClosedError()
+        if connection._compressor is not None:
+            return self.write_message(frame.data)
+        return connection.stream.write(frame.wire)
+
+    def on_written(self, future):
+        self.writing = False
+        if future.exception() is not None:
+            self.remove()
+            return
+        frames = self.queue.pop_all()
+        if frames:
+            self.write_frames(frames)
+        else:
+            self.behind_since = None
 
     @classmethod
     def send_message(cls, message):
-        [client.write_message(message) for client in cls.clients]
+        """Encodes message once and sends it to the subscribed clients, must be called on the IOLoop."""
+        cls.send_frame(
+            get_message_key(message), Frame(json_encode(message).encode()), parse_id(message.get('id')),
+            get_topics(message))
 
+    @classmethod
+    def send_frame(cls, key, frame, id, topics):
+        """Sends Frame of a message with the parsed stream id to the clients subscribed to any of its topics.
+
+        Must be called on the IOLoop.
+        """
+        recipients = set()
+        for topic in topics:
+            recipients.update(cls.routes.get(topic, ()))
+        logger.debug(f'frame={frame.data} - recipients={len(recipients)}')
+        for client in recipients:
+            if client.resume_id is not None and id is not None:
+                if id <= client.resume_id:
+                    continue
+                client.resume_id = None
+            client.send(key, frame)
 
-def push_data():
-    last_data = None
 
-    pubsub = settings.REDIS_CONN.pubsub()
-    pubsub.psubscribe(f'__keyspace@*:{settings.REDIS_KEY_PREFIX}:*')
+class LiveRelay:
+    """Relays live state messages published once in Redis to the clients of this worker.
 
-    while True:
-        now_ms = time.time() * 1000
+    Messages are read as soon as the socket of the Redis pubsub connection becomes readable on the IOLoop and are sent
+    to the clients as published, without encoding them again.
+    """
 
-        if last_data is None or (now_ms - last_data >= 3000):
-            device = Device.objects.primary_device()
-            message = dict(
-                device_id=device.id,
-                public_ip=device.public_ip,
-                cpu_temp=device.cpu_temp,
-                pump_status=device.pump_status)
-            logging.info(message)
-            MainHandler.send_message(message)
-            last_data = now_ms
+    def __init__(self, channel):
+        self.channel = channel
+        self.last_id = None  # Stream id of the last relayed message.
+        self.pubsub = None
+        self.sock = None
+        self.fd = None
 
-        msg = pubsub.get_message()
-        if msg is None:
-            time.sleep(0.01)  # 10 ms artificial intrinsic latency.
-            continue
+    def connect(self):
+        """Subscribes to the channel and loads the snapshots, retrying until Redis is available."""
+        try:
+            self.pubsub = settings.REDIS_CONN.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(self.channel)
+        except redis.ConnectionError as e:
+            logger.error(f'e={e}')
+            tornado.ioloop.IOLoop.current().call_later(RECONNECT_DELAY, self.connect)
+            return
+        self.watch()
+        self.resync()
+        logger.info(f'subscribed to channel={self.channel}')
 
-        (pump_id, pump_status) = Pump.parse_redis_pubsub_msg(msg)
-        if pump_id is not None and pump_status is not None:
-            message = dict(
-                pump_id=pump_id,
-                pump_status=pump_status)
-            logging.info(message)
-            MainHandler.send_message(message)
+    def resync(self):
+        """Relays the messages missed while disconnected or, if they are no longer in the stream, the snapshots."""
+        try:
+            messages = get_missed_messages(self.last_id) if self.last_id is not None else None
+            snapshots = get_snapshots() if messages is None else []
+        except redis.ConnectionError as e:
+            logger.error(f'e={e}')
+            return
+        if messages is not None:
+            for message in messages:
+                self.apply(message)
+                MainHandler.send_message(message)
+            return
+        states.clear()
+        for snapshot in snapshots:
+            self.apply(snapshot)
+            MainHandler.send_message(snapshot)
+
+    def apply(self, message):
+        device_id = message.get('device_id')
+        if device_id not in states:
+            states[device_id] = LiveState(device_id)
+        states[device_id].apply(message)
+        if 'id' in message and (self.last_id is None or parse_id(message['id']) > parse_id(self.last_id)):
+            self.last_id = message['id']
+
+    def watch(self):
+        """Registers the pubsub socket with the IOLoop unless it already is. Returns True if it has been registered."""
+        sock = self.pubsub.connection._sock
+        if sock is self.sock:
+            return False
+        self.unwatch()
+        self.sock = sock
+        self.fd = sock.fileno()
+        tornado.ioloop.IOLoop.current().add_handler(self.fd, self.on_readable, tornado.ioloop.IOLoop.READ)
+        return True
+
+    def unwatch(self):
+        if self.fd is not None:
+            tornado.ioloop.IOLoop.current().remove_handler(self.fd)
+        self.sock = None
+        self.fd = None
+
+    def on_readable(self, fd, io_events):
+        try:
+            # Drain all the buffered messages, get_message() does not block with the default timeout of 0.
+            while True:
+                msg = self.pubsub.get_message()
+                if msg is None:
+                    break
+                if msg['type'] != 'message':
+                    continue
+                message = json.loads(msg['data'])
+                # Messages published between subscribing and resyncing are replayed and still on the channel.
+                if self.last_id is not None and parse_id(message['id']) <= parse_id(self.last_id):
+                    continue
+                self.apply(message)
+                MainHandler.send_frame(
+                    get_message_key(message), Frame(msg['data']), parse_id(message['id']), get_topics(message))
+        except redis.ConnectionError as e:
+            logger.error(f'e={e}')
+            self.unwatch()
+            self.pubsub.close()
+            tornado.ioloop.IOLoop.current().call_later(RECONNECT_DELAY, self.connect)
+            return
+
+        # redis-py reconnects and resubscribes on its own when it can, with a new socket.
+        if self.watch():
+            logger.info(f'resubscribed to channel={self.channel}')
+            self.resync()
+
+
+def report_client_count():
+    """Reports number of clients of this worker, see publish_live_state --report."""
+    key = f'{settings.REDIS_WEBSOCKET_CLIENTS_KEY}:{socket.gethostname()}-{os.getpid()}'
+    try:
+        settings.REDIS_CONN.set(key, len(MainHandler.clients), ex=CLIENT_COUNT_INTERVAL * 3)
+    except redis.ConnectionError as e:
+        logger.error(f'e={e}')
 
 
 if __name__ == '__main__':
     tornado.options.parse_command_line()
 
-    threading.Thread(target=push_data).start()
+    # Workers share the listening socket, the kernel spreads the connections between them.
+    sockets = tornado.netutil.bind_sockets(options.port, address=options.address)
+    if options.processes != 1:
+        tornado.process.fork_processes(options.processes)
+
+    set_process_priority('websocket_server')
+
+    # Client addresses are passed on by nginx in X-Real-IP.
+    server = tornado.httpserver.HTTPServer(Application(django=options.django), xheaders=options.django)
+    server.add_sockets(sockets)
 
-    application = Application()
-    server = tornado.httpserver.HTTPServer(application)
-    server.listen(options.port, address=options.address)
+    LiveRelay(options.channel).connect()
+    tornado.ioloop.PeriodicCallback(report_client_count, CLIENT_COUNT_INTERVAL * 1000).start()
     tornado.ioloop.IOLoop.current().start()